@@ -0,0 +1,92 @@
+import maps
+
+###############
+# Blast table #
+###############
+
+# The 4 directions of a blast
+DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+class BlastTable(object):
+    """Cells reached by the blast of a bomb, for every cell of a map. Each
+    ray follows the rules of World.add_blast(): it covers at most expl_range
+    cells, stops before the exit and at the first wall, which it includes.
+    Bombs and entities also stop a blast, but they move, so they are left to
+    the callers. Rays are computed the first time they are needed."""
+
+    # PARAM wrld [World]: the world whose map is used
+    def __init__(self, wrld):
+        """Class constructor"""
+        self.width = wrld.width()
+        self.height = wrld.height()
+        self.range = wrld.expl_range
+        self.version = wrld.map_version
+        # Cell index -> tuple of the 4 rays, None if not computed yet
+        self.rays = [None] * (self.width * self.height)
+
+    # PARAM wrld [World]: a world whose map version is the one of the table
+    def rays_at(self, wrld, x, y):
+        """Returns the 4 rays of a blast at (x,y), each a tuple of cells"""
+        i = x + y * self.width
+        rays = self.rays[i]
+        if rays is None:
+            rays = self.rays[i] = tuple(ray(wrld, x, y, dx, dy) for (dx, dy) in DIRECTIONS)
+        return rays
+
+    # PARAM wrld [World]: the world whose map is used
+    # PARAM walls [list]: cells whose walls were destroyed since this table
+    #                     was computed
+    def repaired(self, wrld, walls):
+        """Returns a copy of this table for the map of wrld"""
+        new = BlastTable.__new__(BlastTable)
+        new.width = self.width
+        new.height = self.height
+        new.range = self.range
+        new.version = wrld.map_version
+        new.rays = list(self.rays)
+        # Only the rays that ended on a destroyed wall change: forget those
+        # of the cells in range of it along its row and column
+        for (x, y) in walls:
+            for (dx, dy) in DIRECTIONS:
+                for r in range(1, self.range + 1):
+                    xx = x + r * dx
+                    yy = y + r * dy
+                    if (xx < 0) or (xx >= self.width) or (yy < 0) or (yy >= self.height):
+                        break
+                    new.rays[xx + yy * self.width] = None
+        return new
+
+##########
+# Blasts #
+##########
+
+# PARAM wrld [World]: the world whose map is used
+# PARAM opened [set]: cells whose walls are considered destroyed
+def ray(wrld, x, y, dx, dy, opened=()):
+    """Returns the cells of the ray of a blast at (x,y) along (dx,dy)"""
+    cells = []
+    xx = x + dx
+    yy = y + dy
+    while ((len(cells) < wrld.expl_range) and
+           (xx >= 0) and (xx < wrld.width()) and
+           (yy >= 0) and (yy < wrld.height())):
+        if wrld.exitcell == (xx, yy):
+            break
+        cells.append((xx, yy))
+        if wrld.wall_at(xx, yy) and (xx, yy) not in opened:
+            break
+        xx = xx + dx
+        yy = yy + dy
+    return tuple(cells)
+
+#########
+# Cache #
+#########
+
+# Tables by map version
+tables = maps.MapCache()
+
+def for_world(wrld):
+    """Returns the blast table of the map of wrld"""
+    return tables.get(wrld, lambda: BlastTable(wrld),
+                      lambda table, walls: table.repaired(wrld, walls))
@@ -0,0 +1,98 @@
+from array import array
+import blast_table
+
+##############
+# Danger map #
+##############
+
+# Steps a bitmask can hold
+MAX_HORIZON = 63
+
+class DangerMap(object):
+    """Steps at which each cell will be covered by an explosion, predicted
+    from the current bombs and explosions. Bit k of the mask of a cell is set
+    if the cell holds an explosion after k more calls to World.next(), bit 0
+    being the current state. Bombs are not chained: a blast stops at any bomb
+    still on the board, as in World.add_blast(). Monsters and characters that
+    might stop a blast are ignored, so the prediction can only err on the
+    side of danger."""
+
+    # PARAM wrld [World]: the world whose bombs and explosions are used
+    def __init__(self, wrld):
+        """Simulates the bombs and explosions until the last explosion of
+        the current bombs is over"""
+        self.width = wrld.width()
+        self.height = wrld.height()
+        # A bomb placed now explodes after bomb_time + 1 steps and its
+        # explosion lasts expl_duration more steps
+        self.horizon = min(MAX_HORIZON, wrld.bomb_time + wrld.expl_duration + 1)
+        self.masks = array('Q', [0]) * (self.width * self.height)
+        # Cell -> timer, as in World.bombs and World.explosions
+        bombs = {(b.x, b.y): b.timer for b in wrld.bombs.values()}
+        explosions = {(e.x, e.y): e.timer for e in wrld.explosions.values()}
+        # Walls destroyed by the time of the simulation
+        opened = set()
+        self.mark(explosions, 0)
+        for k in range(1, self.horizon + 1):
+            if not (bombs or explosions):
+                break
+            # Expired explosions destroy the walls under them
+            for cell, timer in list(explosions.items()):
+                if timer > 0:
+                    explosions[cell] = timer - 1
+                else:
+                    del explosions[cell]
+                    if wrld.wall_at(*cell):
+                        opened.add(cell)
+            # Expired bombs explode; they all stay on the board until every
+            # blast of the step is done
+            expired = []
+            for cell, timer in bombs.items():
+                if timer > 0:
+                    bombs[cell] = timer - 1
+                else:
+                    expired.append(cell)
+            for (x, y) in expired:
+                explosions[(x, y)] = wrld.expl_duration
+                # A wall under the bomb stops the whole blast
+                if wrld.wall_at(x, y) and (x, y) not in opened:
+                    continue
+                for ray in self.rays(wrld, x, y, opened):
+                    for cell in ray:
+                        if cell in bombs:
+                            break
+                        explosions[cell] = wrld.expl_duration
+            for cell in expired:
+                del bombs[cell]
+            self.mark(explosions, k)
+
+    def mask(self, x, y):
+        """Returns the bitmask of the steps at which (x,y) is exploding"""
+        return self.masks[x + y * self.width]
+
+    def exploding_at(self, x, y, k):
+        """Returns True if (x,y) holds an explosion after k more steps"""
+        return (self.masks[x + y * self.width] >> k) & 1 == 1
+
+    def safe_at(self, x, y, first, last):
+        """Returns True if (x,y) holds no explosion from step first to step
+        last, both included"""
+        span = (1 << (last - first + 1)) - 1
+        return (self.masks[x + y * self.width] >> first) & span == 0
+
+    ###################
+    # Private methods #
+    ###################
+
+    def mark(self, explosions, k):
+        """Sets bit k for the cells holding an explosion"""
+        bit = 1 << k
+        for (x, y) in explosions:
+            self.masks[x + y * self.width] |= bit
+
+    def rays(self, wrld, x, y, opened):
+        """Returns the 4 rays of a blast at (x,y) once the given walls are
+        destroyed"""
+        if not opened:
+            return wrld.blast_rays(x, y)
+        return [blast_table.ray(wrld, x, y, dx, dy, opened) for (dx, dy) in blast_table.DIRECTIONS]
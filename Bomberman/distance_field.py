@@ -0,0 +1,101 @@
+from array import array
+from collections import deque
+import maps
+
+#######################
+# Exit distance field #
+#######################
+
+# The 8 possible moves
+MOVES = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+class ExitDistanceField(object):
+    """Number of steps from every cell to the exit, walls being the only
+    obstacles (-1 if the exit cannot be reached)"""
+
+    # PARAM wrld [World]: the world whose map is used
+    def __init__(self, wrld):
+        """Computes the field with a breadth-first search from the exit"""
+        self.width = wrld.width()
+        self.height = wrld.height()
+        self.exitcell = wrld.exitcell
+        self.version = wrld.map_version
+        self.dist = array('i', [-1]) * (self.width * self.height)
+        (ex, ey) = self.exitcell
+        self.dist[ex + ey * self.width] = 0
+        self.relax(wrld, deque([self.exitcell]))
+
+    def distance(self, x, y):
+        """Returns the distance from (x,y) to the exit, or None"""
+        d = self.dist[x + y * self.width]
+        if d < 0:
+            return None
+        return d
+
+    # PARAM wrld [World]: the world whose map is used
+    # PARAM walls [list]: cells whose walls were destroyed since this field
+    #                     was computed
+    def repaired(self, wrld, walls):
+        """Returns a copy of this field for the map of wrld"""
+        new = ExitDistanceField.__new__(ExitDistanceField)
+        new.width = self.width
+        new.height = self.height
+        new.exitcell = self.exitcell
+        new.version = wrld.map_version
+        new.dist = array('i', self.dist)
+        # Opening cells can only make distances shorter: give the opened
+        # cells their distance and spread any improvement from there
+        queue = deque()
+        for (x, y) in walls:
+            if not wrld.wall_at(x, y):
+                best = new.best_neighbor(wrld, x, y)
+                if best >= 0:
+                    new.dist[x + y * new.width] = best + 1
+                    queue.append((x, y))
+        new.relax(wrld, queue)
+        return new
+
+    ###################
+    # Private methods #
+    ###################
+
+    def best_neighbor(self, wrld, x, y):
+        """Returns the smallest distance among the neighbors of (x,y)"""
+        best = -1
+        for (dx, dy) in MOVES:
+            nx = x + dx
+            ny = y + dy
+            if (nx >= 0) and (nx < self.width) and (ny >= 0) and (ny < self.height):
+                d = self.dist[nx + ny * self.width]
+                if d >= 0 and (best < 0 or d < best):
+                    best = d
+        return best
+
+    def relax(self, wrld, queue):
+        """Spreads distances from the cells in the queue"""
+        dist = self.dist
+        width = self.width
+        height = self.height
+        while queue:
+            (x, y) = queue.popleft()
+            nd = dist[x + y * width] + 1
+            for (dx, dy) in MOVES:
+                nx = x + dx
+                ny = y + dy
+                if (nx >= 0) and (nx < width) and (ny >= 0) and (ny < height):
+                    i = nx + ny * width
+                    if (dist[i] < 0 or dist[i] > nd) and not wrld.wall_at(nx, ny):
+                        dist[i] = nd
+                        queue.append((nx, ny))
+
+#########
+# Cache #
+#########
+
+# Fields by map version
+fields = maps.MapCache()
+
+def for_world(wrld):
+    """Returns the exit distance field of the map of wrld"""
+    return fields.get(wrld, lambda: ExitDistanceField(wrld),
+                      lambda field, walls: field.repaired(wrld, walls))
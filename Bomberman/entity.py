@@ -1,4 +1,5 @@
 from math import copysign
+import random
 
 ############
 # Entities #
@@ -45,6 +46,10 @@ def __sign__(x):
 class MovableEntity(PositionalEntity):
     """Positional entity that can move"""
 
+    # Whether this entity belongs to a shared world and must not be changed
+    # (see SensedWorld.freeze())
+    frozen = False
+
     # PARAM x [int]: x coordinate in the grid
     # PARAM y [int]: y coordinate in the grid
     def __init__(self, x, y):
@@ -59,6 +64,8 @@ class MovableEntity(PositionalEntity):
     # The passed values are clamped in [-1,1]
     def move(self, dx, dy):
         """Move entity"""
+        if self.frozen:
+            raise RuntimeError("Cannot move an entity of a shared world, call mutable() first")
         # Make sure dx is in [-1,1]
         self.dx = __sign__(dx)
         # Make sure dy is in [-1,1]
@@ -122,6 +129,9 @@ class AIEntity(Entity):
     def __init__(self, name, avatar):
         self.name = name
         self.avatar = avatar[0]
+        # Random number generator to use in do(). The random module by
+        # default, a stream of its own when added to a seeded world.
+        self.rng = random
 
     def do(self, wrld):
         """Pick an action for the entity given the world state"""
@@ -264,6 +274,8 @@ class CharacterEntity(AIEntity, MovableEntity):
 
     def place_bomb(self):
         """Attempts to place a bomb"""
+        if self.frozen:
+            raise RuntimeError("Cannot move an entity of a shared world, call mutable() first")
         self.maybe_place_bomb = True
 
     def set_cell_color(self, x, y, color):
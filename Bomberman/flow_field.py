@@ -0,0 +1,131 @@
+from array import array
+from collections import deque, OrderedDict
+from search_state import walls_of
+
+###################
+# Exit flow field #
+###################
+
+# The 8 possible moves; MOVES[7 - k] is the opposite of MOVES[k]
+MOVES = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+class ExitFlowField(object):
+    """Best next step toward the exit from every cell, in the current state.
+    Walls, bombs, explosions and monsters block the way; characters do not,
+    as they move on. A single breadth-first search from the exit serves every
+    character of the step. Without an exit, no cell reaches it."""
+
+    # PARAM wrld [World]: the world whose state is used
+    # PARAM margin [int]: monsters also block the cells at most this many
+    #                     cells away from them along both axes, the exit
+    #                     included
+    def __init__(self, wrld, margin=0):
+        """Computes the field with a breadth-first search from the exit"""
+        self.width = wrld.width()
+        self.height = wrld.height()
+        self.margin = margin
+        width = self.width
+        height = self.height
+        # Steps to the exit, -1 if it cannot be reached
+        self.dist = array('i', [-1]) * (width * height)
+        # Index in MOVES of the next step, for the cells with a distance > 0
+        self.step = bytearray(width * height)
+        if not wrld.exitcell:
+            return
+        blocked = bytearray(walls_of(wrld))
+        for table in (wrld.bombs, wrld.explosions):
+            for i, e in table.items():
+                if e:
+                    blocked[i] = 1
+        (ex, ey) = wrld.exitcell
+        blocked[ex + ey * width] = 0
+        for m in wrld.iter_monsters():
+            for x in range(max(0, m.x - margin), min(width, m.x + margin + 1)):
+                for y in range(max(0, m.y - margin), min(height, m.y + margin + 1)):
+                    blocked[x + y * width] = 1
+        if not blocked[ex + ey * width]:
+            self.dist[ex + ey * width] = 0
+            self.spread(blocked, deque([ex + ey * width]))
+
+    def distance(self, x, y):
+        """Returns the number of steps from (x,y) to the exit, or None"""
+        d = self.dist[x + y * self.width]
+        if d < 0:
+            return None
+        return d
+
+    def next_step(self, x, y):
+        """Returns the move (dx,dy) from (x,y) toward the exit, or None if
+        (x,y) is the exit or the exit cannot be reached from there"""
+        i = x + y * self.width
+        if self.dist[i] <= 0:
+            return None
+        return MOVES[self.step[i]]
+
+    def path(self, x, y):
+        """Returns the cells from (x,y) to the exit, both included, or None
+        if the exit cannot be reached"""
+        if self.dist[x + y * self.width] < 0:
+            return None
+        path = [(x, y)]
+        while self.dist[x + y * self.width] > 0:
+            (dx, dy) = MOVES[self.step[x + y * self.width]]
+            x += dx
+            y += dy
+            path.append((x, y))
+        return path
+
+    ###################
+    # Private methods #
+    ###################
+
+    # PARAM blocked [bytearray]: 1 for the cells the way cannot go through
+    # PARAM queue [deque]: cells to spread distances from
+    def spread(self, blocked, queue):
+        """Spreads distances from the cells in the queue. Blocked cells get a
+        distance and a next step too, but no cell is reached through them: a
+        character standing on its own bomb can still find its way out."""
+        dist = self.dist
+        step = self.step
+        width = self.width
+        height = self.height
+        while queue:
+            i = queue.popleft()
+            (y, x) = divmod(i, width)
+            nd = dist[i] + 1
+            for k, (dx, dy) in enumerate(MOVES):
+                nx = x + dx
+                ny = y + dy
+                if (nx >= 0) and (nx < width) and (ny >= 0) and (ny < height):
+                    j = nx + ny * width
+                    if dist[j] < 0:
+                        dist[j] = nd
+                        step[j] = 7 - k
+                        if not blocked[j]:
+                            queue.append(j)
+
+#########
+# Cache #
+#########
+
+# Maximum number of fields kept
+MAX_FIELDS = 16
+
+# Fields of the most recent states, by (map version, state hash, margin)
+fields = OrderedDict()
+
+# PARAM wrld [World]: the world whose state is used
+# PARAM margin [int]: see ExitFlowField
+def for_world(wrld, margin=0):
+    """Returns the exit flow field of the current state of wrld, shared by
+    all the worlds in the same state, such as the copies given to each
+    character for a step"""
+    key = (wrld.map_version, wrld.zhash, margin)
+    field = fields.get(key)
+    if field is not None:
+        fields.move_to_end(key)
+        return field
+    field = fields[key] = ExitFlowField(wrld, margin)
+    if len(fields) > MAX_FIELDS:
+        fields.popitem(last=False)
+    return field
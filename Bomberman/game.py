@@ -1,19 +1,38 @@
 from real_world import RealWorld
 from events import Event
-import colorama
-import pygame
+from profiler import StepProfiler
 import math
 
 class Game:
     """Game class"""
 
-    def __init__(self, width, height, max_time, bomb_time, expl_duration, expl_range, sprite_dir="../../bomberman/sprites/"):
-        self.world = RealWorld.from_params(width, height, max_time, bomb_time, expl_duration, expl_range)
+    # PARAM headless [bool]: if True, the game is neither displayed nor
+    #                        printed, and steps run back to back. pygame
+    #                        and colorama are not needed in this mode.
+    # PARAM seed [object]: if not None, each monster and character draws
+    #                      random numbers from its own generator, seeded
+    #                      from this value and its name
+    # PARAM profile [bool or file]: if set, the time spent in each phase of
+    #                               a step and in each entity is recorded
+    #                               (see stats()). If a file, a trace of
+    #                               each step is also written to it.
+    # PARAM shared_snapshot [bool]: if True, all the monsters, then all the
+    #                               characters, are handed the same frozen
+    #                               world during a step
+    def __init__(self, width, height, max_time, bomb_time, expl_duration, expl_range, sprite_dir="../../bomberman/sprites/", storage="dict", headless=False, seed=None, profile=False, shared_snapshot=False):
+        self.world = RealWorld.from_params(width, height, max_time, bomb_time, expl_duration, expl_range, storage, seed)
+        self.world.shared_snapshot = shared_snapshot
+        self.profiler = None
+        if profile:
+            self.profiler = StepProfiler(None if profile is True else profile)
+            self.profiler.attach(self.world)
         self.sprite_dir = sprite_dir
-        self.load_gui(width, height)
+        self.headless = headless
+        if not headless:
+            self.load_gui(width, height)
 
     @classmethod
-    def fromfile(cls, fname, sprite_dir="../../bomberman/sprites/"):
+    def fromfile(cls, fname, sprite_dir="../../bomberman/sprites/", storage="dict", headless=False, seed=None, profile=False, shared_snapshot=False):
         with open(fname, 'r') as fd:
             # First lines are parameters
             max_time = int(fd.readline().split()[1])
@@ -32,7 +51,7 @@ class Game:
                     raise RuntimeError("Row", height, "is not", width, "characters long")
                 row = fd.readline()
             # Create empty world
-            gm = cls(width, height, max_time, bomb_time, expl_duration, expl_range, sprite_dir)
+            gm = cls(width, height, max_time, bomb_time, expl_duration, expl_range, sprite_dir, storage, headless, seed, profile, shared_snapshot)
             # Now parse the data in the world
             fd.seek(startpos)
             for y in range(0, height):
@@ -49,6 +68,7 @@ class Game:
             return gm
 
     def load_gui(self, board_width, board_height):
+        import pygame
         pygame.init()
         self.height = 24 * board_height
         self.width = 24 * board_width
@@ -70,6 +90,7 @@ class Game:
         self.explosion_sprite = pygame.transform.scale(self.explosion_sprite, rect)
 
     def display_gui(self):
+        import pygame
         for x in range(self.world.width()):
             for y in range(self.world.height()):
                 top = self.block_height * y
@@ -93,6 +114,14 @@ class Game:
     def go(self, wait=0):
         """ Main game loop. """
 
+        if self.headless:
+            while not self.done():
+                (self.world, self.events) = self.world.next()
+                self.world.next_decisions()
+            return
+
+        import colorama
+        import pygame
         if wait is 0:
             def step():
                 pygame.event.clear()
@@ -113,6 +142,12 @@ class Game:
             self.world.next_decisions()
         colorama.deinit()
 
+    def stats(self):
+        """Returns the profiling stats of the game, or None if not profiled"""
+        if self.profiler:
+            return self.profiler.stats()
+        return None
+
     ###################
     # Private methods #
     ###################
@@ -122,9 +157,11 @@ class Game:
 
     def done(self):
         # User Exit
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return True
+        if not self.headless:
+            import pygame
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return True
         # Time's up
         if self.world.time <= 0:
             return True
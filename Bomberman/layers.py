@@ -0,0 +1,93 @@
+###############
+# Cell layers #
+###############
+
+# Bits of the static/timed layer
+WALL      = 1
+EXIT      = 2
+BOMB      = 4
+EXPLOSION = 8
+
+class CellLayers(object):
+    """Flat, array-backed storage of what occupies each cell of a world"""
+
+    # Undo log of the world, if it records its changes: every cell about to
+    # change is appended to it (see World.undo_log)
+    log = None
+
+    # PARAM width [int]: world width
+    # PARAM height [int]: world height
+    def __init__(self, width, height):
+        """Class constructor"""
+        self.width = width
+        self.height = height
+        # One byte of WALL/EXIT/BOMB/EXPLOSION bits per cell
+        self.flags = bytearray(width * height)
+        # Number of monsters and characters per cell
+        self.monsters = bytearray(width * height)
+        self.characters = bytearray(width * height)
+
+    @classmethod
+    def from_layers(cls, layers):
+        """Clone the given layers"""
+        new = cls.__new__(cls)
+        new.width = layers.width
+        new.height = layers.height
+        new.flags = bytearray(layers.flags)
+        new.monsters = bytearray(layers.monsters)
+        new.characters = bytearray(layers.characters)
+        return new
+
+    def empty(self, i):
+        """Returns True if nothing at all is at index i"""
+        return not (self.flags[i] or self.monsters[i] or self.characters[i])
+
+    def has(self, i, flag):
+        """Returns True if the given flag is set at index i"""
+        return (self.flags[i] & flag) != 0
+
+    def set(self, i, flag):
+        """Sets the given flag at index i"""
+        if self.log is not None:
+            self.save(self.flags, i)
+        self.flags[i] |= flag
+
+    def clear(self, i, flag):
+        """Clears the given flag at index i"""
+        if self.log is not None:
+            self.save(self.flags, i)
+        self.flags[i] &= ~flag
+
+    def add_monster(self, i):
+        """Counts one more monster at index i"""
+        if self.log is not None:
+            self.save(self.monsters, i)
+        self.monsters[i] += 1
+
+    def remove_monster(self, i):
+        """Counts one monster less at index i"""
+        if self.log is not None:
+            self.save(self.monsters, i)
+        self.monsters[i] -= 1
+
+    def add_character(self, i):
+        """Counts one more character at index i"""
+        if self.log is not None:
+            self.save(self.characters, i)
+        self.characters[i] += 1
+
+    def remove_character(self, i):
+        """Counts one character less at index i"""
+        if self.log is not None:
+            self.save(self.characters, i)
+        self.characters[i] -= 1
+
+    ###################
+    # Private methods #
+    ###################
+
+    # PARAM layer [bytearray]: one of the layers
+    # PARAM i [int]: index of the cell about to change
+    def save(self, layer, i):
+        """Appends to the undo log how to put the cell back"""
+        self.log.append((bytearray.__setitem__, layer, i, layer[i]))
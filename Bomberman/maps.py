@@ -0,0 +1,84 @@
+################
+# Map versions #
+################
+
+# A world gets a new map version whenever its walls or its exit change, and
+# clones keep the version of their source. Worlds with the same version have
+# the same map, so data derived from the map alone can be cached by version.
+
+import itertools
+from collections import OrderedDict
+
+# Source of new versions
+counter = itertools.count(1)
+
+# For versions obtained by destroying a wall:
+# version -> (previous version, x, y)
+parents = OrderedDict()
+
+# Maximum number of destroyed walls remembered
+MAX_PARENTS = 4096
+
+def new_version():
+    """Returns a version for a map unrelated to the known ones"""
+    return next(counter)
+
+# PARAM version [int]: the version of the map before the change
+# PARAM x [int]: x coordinate of the destroyed wall
+# PARAM y [int]: y coordinate of the destroyed wall
+def wall_destroyed(version, x, y):
+    """Returns the version of a map after a wall has been destroyed"""
+    new = next(counter)
+    parents[new] = (version, x, y)
+    if len(parents) > MAX_PARENTS:
+        parents.popitem(last=False)
+    return new
+
+# PARAM known [function]: tells whether data is available for a version
+def find_ancestor(version, known):
+    """Returns the closest known version the given one derives from, along
+    with the walls destroyed since then, or (None, None)"""
+    walls = []
+    while not known(version):
+        parent = parents.get(version)
+        if not parent:
+            return (None, None)
+        (version, x, y) = parent
+        walls.append((x, y))
+    return (version, walls)
+
+#########
+# Cache #
+#########
+
+class MapCache(object):
+    """Data computed from maps, kept for the most recently used versions"""
+
+    # PARAM size [int]: maximum number of versions kept
+    def __init__(self, size=64):
+        """Class constructor"""
+        self.size = size
+        self.entries = OrderedDict()
+
+    # PARAM wrld [World]: the world whose map is used
+    # PARAM compute [function]: computes the data of the map of wrld
+    # PARAM repair [function]: if given, called with the data of an older
+    #                          version and the walls destroyed since then,
+    #                          returns the data for wrld
+    def get(self, wrld, compute, repair=None):
+        """Returns the data of the map of wrld, computing it if needed"""
+        version = wrld.map_version
+        data = self.entries.get(version)
+        if data is not None:
+            self.entries.move_to_end(version)
+            return data
+        if repair:
+            (ancestor, walls) = find_ancestor(version, lambda v: v in self.entries)
+            if ancestor:
+                data = repair(self.entries[ancestor], walls)
+        if data is None:
+            data = compute()
+        self.entries[version] = data
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return data
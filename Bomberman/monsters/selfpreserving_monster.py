@@ -1,7 +1,6 @@
 # import sys
 # sys.path.insert(0, '..')
 from entity import MonsterEntity
-import random
 
 class SelfPreservingMonster(MonsterEntity):
     """A random monster that walks away from explosions"""
@@ -11,15 +10,12 @@ class SelfPreservingMonster(MonsterEntity):
         self.rnge = rnge
 
     def look_for_character(self, wrld):
-        for dx in range(-self.rnge, self.rnge+1):
-            # Avoid out-of-bounds access
-            if ((self.x + dx >= 0) and (self.x + dx < wrld.width())):
-                for dy in range(-self.rnge, self.rnge+1):
-                    # Avoid out-of-bounds access
-                    if ((self.y + dy >= 0) and (self.y + dy < wrld.height())):
-                        # Is a character at this position?
-                        if (wrld.characters_at(self.x + dx, self.y + dy)):
-                            return (True, dx, dy)
+        # Pick the character a scan of the neighborhood, column by column,
+        # would find first
+        found = wrld.characters_within(self.x, self.y, self.rnge)
+        if found:
+            (c, dx, dy) = min(found, key=lambda f: (f[1], f[2]))
+            return (True, dx, dy)
         # Nothing found
         return (False, 0, 0)
 
@@ -71,5 +67,5 @@ class SelfPreservingMonster(MonsterEntity):
                 self.move(0,0)
             else:
                 # Pick a move at random
-                (dx, dy) = random.choice(safe)
+                (dx, dy) = self.rng.choice(safe)
                 self.move(dx, dy)
@@ -1,7 +1,6 @@
 # import sys
 # sys.path.insert(0, '..')
 from entity import MonsterEntity
-import random
 
 class StupidMonster(MonsterEntity):
     """A pretty stupid monster"""
@@ -27,5 +26,5 @@ class StupidMonster(MonsterEntity):
         # Get list of safe moves
         safe = self.look_for_empty_cell(wrld)
         # Pick a move at random
-        (dx, dy) = random.choice(safe)
+        (dx, dy) = self.rng.choice(safe)
         self.move(dx, dy)
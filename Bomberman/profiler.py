@@ -0,0 +1,109 @@
+import json
+import sys
+import time
+import tracemalloc
+
+#################
+# Step profiler #
+#################
+
+# Methods of RealWorld timed as phases of a step
+PHASES = ["update_explosions", "update_bombs", "update_monsters",
+          "update_characters", "update_scores", "manage_events", "snapshot"]
+
+class StepProfiler(object):
+    """Records the time spent in each phase of RealWorld.next(), in cloning
+    the world for the entities and in each entity's do(). Allocations are
+    counted in blocks, and in bytes if tracemalloc is tracing."""
+
+    # PARAM trace [file]: if given, one JSON object per step is written to
+    #                     this file, with the time spent in each phase
+    def __init__(self, trace=None):
+        """Class constructor"""
+        self.trace = trace
+        # Number of steps profiled
+        self.steps = 0
+        # name -> [calls, seconds, allocated blocks, allocated bytes]
+        self.phases = {}
+        # Seconds spent in each phase since the last step
+        self.current = {}
+
+    # PARAM wrld [RealWorld]: the world to profile
+    def attach(self, wrld):
+        """Instruments a world; only this instance is affected"""
+        for name in PHASES:
+            setattr(wrld, name, self.timed(getattr(wrld, name), name))
+        wrld.entity_do = self.timed(wrld.entity_do, lambda e, w: "do:" + e.name)
+        wrld.next = self.timed(wrld.next, "step", True)
+
+    def stats(self):
+        """Returns { phase : { calls, seconds, mean_us, blocks, bytes } },
+        "step" covering the whole of RealWorld.next()"""
+        stats = {}
+        for name, (calls, seconds, blocks, nbytes) in self.phases.items():
+            stats[name] = {
+                "calls": calls,
+                "seconds": seconds,
+                "mean_us": 1e6 * seconds / calls,
+                "blocks": blocks,
+                "bytes": nbytes,
+            }
+        return stats
+
+    def report(self):
+        """Returns the stats as a table, slowest phase first"""
+        lines = ["%-24s %8s %10s %10s %10s %12s" % ("phase", "calls", "seconds", "mean us", "blocks", "bytes")]
+        stats = self.stats()
+        for name in sorted(stats, key=lambda n: -stats[n]["seconds"]):
+            s = stats[name]
+            lines.append("%-24s %8d %10.4f %10.1f %10d %12d" % (name, s["calls"], s["seconds"],
+                                                               s["mean_us"], s["blocks"], s["bytes"]))
+        return "\n".join(lines)
+
+    ###################
+    # Private methods #
+    ###################
+
+    # PARAM fn [function]: the bound method to time
+    # PARAM name [string or function]: the name of the phase, or a function
+    #                                  computing it from the arguments
+    # PARAM step [bool]: whether a call ends a step
+    def timed(self, fn, name, step=False):
+        """Returns a wrapper of fn recording its calls"""
+        def wrapper(*args):
+            blocks = sys.getallocatedblocks()
+            tracing = tracemalloc.is_tracing()
+            nbytes = tracemalloc.get_traced_memory()[0] if tracing else 0
+            start = time.perf_counter()
+            result = fn(*args)
+            seconds = time.perf_counter() - start
+            if tracing:
+                nbytes = tracemalloc.get_traced_memory()[0] - nbytes
+            self.record(name(*args) if callable(name) else name,
+                        seconds, sys.getallocatedblocks() - blocks, nbytes)
+            if step:
+                self.end_step(args, result)
+            return result
+        return wrapper
+
+    def record(self, name, seconds, blocks, nbytes):
+        """Adds a call to the stats of a phase"""
+        phase = self.phases.get(name)
+        if not phase:
+            phase = self.phases[name] = [0, 0.0, 0, 0]
+        phase[0] += 1
+        phase[1] += seconds
+        phase[2] += blocks
+        phase[3] += nbytes
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def end_step(self, args, result):
+        """Writes the trace of a step and starts a new one"""
+        self.steps += 1
+        if self.trace:
+            (wrld, events) = result
+            self.trace.write(json.dumps({"step": self.steps,
+                                         "time": wrld.time,
+                                         "events": [str(e) for e in events],
+                                         "seconds": self.current}) + "\n")
+        self.current = {}
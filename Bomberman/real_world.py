@@ -1,33 +1,77 @@
 from world import World
 from sensed_world import SensedWorld
 from events import Event
+import random
+from layers import WALL, EXIT
+import zobrist
+import maps
 
 class RealWorld(World):
     """The real world state"""
 
+    # Whether the entities get the same frozen snapshot during each phase of
+    # a step (monsters, then characters), rather than one clone each
+    shared_snapshot = False
+    # The snapshot of the current phase, when shared
+    current_snapshot = None
+
     def add_exit(self, x, y):
         """Adds an exit cell at (x,y)"""
         self.exitcell = (x,y)
+        self.zhash ^= zobrist.key(zobrist.EXIT, self.index(x,y))
+        self.map_version = maps.new_version()
+        if self.layers:
+            self.layers.set(self.index(x,y), EXIT)
 
     def add_wall(self, x, y):
         """Adds a wall cell at (x,y)"""
+        if not self.grid[x][y]:
+            self.zhash ^= zobrist.key(zobrist.WALL, self.index(x,y))
+        self.own_grid()
         self.grid[x][y] = True
+        self.map_version = maps.new_version()
+        if self.layers:
+            self.layers.set(self.index(x,y), WALL)
 
     def add_monster(self, m):
         """Adds the given monster to the world"""
-        self.monsters[self.index(m.x,m.y)] = [m]
+        i = self.index(m.x,m.y)
+        for old in self.monsters.get(i, []):
+            self.zhash ^= zobrist.key(zobrist.MONSTER, i, 0, old.name)
+        self.monsters[i] = [m]
+        self.current_snapshot = None
+        self.seed_entity(m)
+        self.zhash ^= zobrist.key(zobrist.MONSTER, i, 0, m.name)
+        if self.layers:
+            self.layers.monsters[i] = 1
 
     def add_character(self, c):
         """Adds the given character to the world"""
-        self.characters[self.index(c.x,c.y)] = [c]
+        i = self.index(c.x,c.y)
+        for old in self.characters.get(i, []):
+            self.zhash ^= zobrist.key(zobrist.CHARACTER, i, 0, old.name)
+        self.characters[i] = [c]
+        self.current_snapshot = None
+        self.seed_entity(c)
+        self.zhash ^= zobrist.key(zobrist.CHARACTER, i, 0, c.name)
+        if self.layers:
+            self.layers.characters[i] = 1
         self.scores[c.name] = -self.time
 
     ###################
     # Private methods #
     ###################
 
+    def seed_entity(self, e):
+        """Gives an entity its own random number generator"""
+        # Streams only depend on the seed and the name of the entity, not on
+        # the order entities are added or draw numbers in
+        if self.seed is not None:
+            e.rng = random.Random("%s/%s" % (self.seed, e.name))
+
     def next(self):
         """Returns a new world state, along with the events that occurred"""
+        self.current_snapshot = None
         self.time = self.time - 1
         self.update_explosions()
         self.events = self.update_bombs() + self.update_monsters() + self.update_characters()
@@ -37,6 +81,8 @@ class RealWorld(World):
 
     def next_decisions(self):
         self.aientity_do(self.monsters)
+        # The characters see the moves the monsters just picked
+        self.current_snapshot = None
         self.aientity_do(self.characters)
 
     def aientity_do(self, entities):
@@ -44,15 +90,36 @@ class RealWorld(World):
         for i, elist in entities.items():
             for e in elist:
                 # Call AI
-                e.do(SensedWorld.from_world(self))
+                self.entity_do(e, self.snapshot())
+
+    def entity_do(self, e, wrld):
+        """Lets an entity pick its action"""
+        e.do(wrld)
+
+    def snapshot(self):
+        """Returns the world as seen by an entity"""
+        if not self.shared_snapshot:
+            return SensedWorld.from_world(self, True)
+        # Made once per phase, after the world has been updated
+        if not self.current_snapshot:
+            self.current_snapshot = SensedWorld.from_world(self, True)
+            self.current_snapshot.freeze()
+        return self.current_snapshot
 
     def manage_events(self):
+        if self.shared_snapshot:
+            # Remove the characters killed by monsters first, so that all
+            # the callbacks see the same world
+            for e in self.events:
+                if e.tpe == Event.CHARACTER_KILLED_BY_MONSTER:
+                    self.remove_character(e.character)
         for e in self.events:
             if e.tpe == Event.BOMB_HIT_CHARACTER:
-                e.other.done(SensedWorld.from_world(self))
+                e.other.done(self.snapshot())
             elif e.tpe == Event.CHARACTER_KILLED_BY_MONSTER:
-                self.remove_character(e.character)
-                e.character.done(SensedWorld.from_world(self))
+                if not self.shared_snapshot:
+                    self.remove_character(e.character)
+                e.character.done(self.snapshot())
             elif e.tpe == Event.CHARACTER_FOUND_EXIT:
-                e.character.done(SensedWorld.from_world(self))
+                e.character.done(self.snapshot())
         
@@ -0,0 +1,241 @@
+from collections import namedtuple
+from events import Event
+import maps
+
+########################
+# Compact search state #
+########################
+
+# What does not change during a search: board size, exit cell index (-1 if
+# none), game parameters, and the name of the character being controlled
+Rules = namedtuple("Rules", ["width", "height", "exit", "bomb_time",
+                             "expl_duration", "expl_range", "me"])
+
+class SearchState(namedtuple("SearchState", ["rules", "walls", "time", "characters",
+                                             "monsters", "bombs", "explosions"])):
+    """Immutable and hashable snapshot of a world, holding only what the game
+    rules need:
+    - walls: bytes, 1 for each cell index (x + y * width) holding a wall
+    - time: time left
+    - characters: tuple of (name, x, y, dx, dy)
+    - monsters: tuple of (name, x, y, dx, dy)
+    - bombs: tuple of (cell index, timer, owner name)
+    - explosions: tuple of (cell index, timer, owner name)
+    Use successors() to advance it by one step."""
+
+    __slots__ = ()
+
+    # PARAM wrld [World]: the world to copy
+    # PARAM character [CharacterEntity]: the character controlled by the
+    #                                    actions passed to successors()
+    @classmethod
+    def from_world(cls, wrld, character):
+        """Create a search state from a world"""
+        width = wrld.width()
+        exit = -1
+        if wrld.exitcell:
+            exit = wrld.exitcell[0] + wrld.exitcell[1] * width
+        rules = Rules(width, wrld.height(), exit, wrld.bomb_time,
+                      wrld.expl_duration, wrld.expl_range, character.name)
+        characters = tuple((c.name, c.x, c.y, c.dx, c.dy)
+                           for clist in wrld.characters.values() for c in clist)
+        # Monsters are sorted so that equal states compare equal
+        monsters = tuple(sorted((m.name, m.x, m.y, m.dx, m.dy)
+                                for mlist in wrld.monsters.values() for m in mlist))
+        bombs = tuple((i, b.timer, b.owner.name) for i, b in wrld.bombs.items())
+        explosions = tuple((i, e.timer, e.owner.name) for i, e in wrld.explosions.items())
+        return cls(rules, walls_of(wrld), wrld.time, characters, monsters, bombs, explosions)
+
+    def me(self):
+        """Returns the (x,y) position of the controlled character, or None"""
+        for (name, x, y, dx, dy) in self.characters:
+            if name == self.rules.me:
+                return (x, y)
+        return None
+
+    def wall_at(self, x, y):
+        """Returns True if there is a wall at (x,y)"""
+        return self.walls[x + y * self.rules.width] == 1
+
+    def explosion_at(self, x, y):
+        """Returns True if there is an explosion at (x,y)"""
+        i = x + y * self.rules.width
+        return any(j == i for (j, timer, owner) in self.explosions)
+
+    def bomb_at(self, x, y):
+        """Returns True if there is a bomb at (x,y)"""
+        i = x + y * self.rules.width
+        return any(j == i for (j, timer, owner) in self.bombs)
+
+#########
+# Walls #
+#########
+
+# Walls by map version
+walls_cache = maps.MapCache()
+
+def walls_of(wrld):
+    """Returns the walls of a world as bytes, shared by states of the same map"""
+    return walls_cache.get(wrld, lambda: wall_bytes(wrld))
+
+def wall_bytes(wrld):
+    """Returns the walls of a world as bytes"""
+    width = wrld.width()
+    cells = bytearray(width * wrld.height())
+    for x in range(width):
+        for y in range(wrld.height()):
+            if wrld.wall_at(x, y):
+                cells[x + y * width] = 1
+    return bytes(cells)
+
+##############
+# Successors #
+##############
+
+def sign(v):
+    """Clamps a direction component to [-1,1]"""
+    return (v > 0) - (v < 0)
+
+# PARAM state [SearchState]: the state to advance
+# PARAM action [tuple]: (dx,dy) or (dx,dy,place_bomb) for the controlled
+#                       character
+# PARAM monster_actions [list]: (dx,dy) or None for each monster, in the
+#                               order of state.monsters; monsters without an
+#                               action keep their direction
+def successors(state, action, monster_actions=None):
+    """Returns the state after one step, along with the events that occurred
+    as (type, character name, other name or None). Follows World.next():
+    explosions expire first, then bombs explode, monsters move, and finally
+    characters place bombs and move. Simultaneous events may be listed in a
+    different order than by World.next()."""
+    rules = state.rules
+    width = rules.width
+    height = rules.height
+    walls = state.walls
+    events = []
+    # Tick explosions; walls under expired ones are destroyed
+    explosions = {}
+    opened = None
+    for (i, timer, owner) in state.explosions:
+        if timer > 0:
+            explosions[i] = (timer - 1, owner)
+        elif walls[i]:
+            if opened is None:
+                opened = bytearray(walls)
+            opened[i] = 0
+    if opened is not None:
+        walls = bytes(opened)
+    monsters = list(state.monsters)
+    characters = list(state.characters)
+    # Actions by monster name, as blasts may remove monsters before they move
+    orders = {}
+    if monster_actions:
+        for (m, a) in zip(state.monsters, monster_actions):
+            if a:
+                orders[m[0]] = a
+    # Tick bombs; expired ones explode
+    bomb_cells = set(i for (i, timer, owner) in state.bombs)
+    bombs = []
+    for (i, timer, owner) in state.bombs:
+        if timer > 0:
+            bombs.append((i, timer - 1, owner))
+            continue
+        # Explosion at the bomb, then along each ray until something is hit
+        explosions[i] = (rules.expl_duration, owner)
+        ev = check_blast(walls, width, monsters, characters, i % width, i // width, owner)
+        if ev:
+            events.extend(ev)
+            continue
+        for (dx, dy) in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            x = i % width + dx
+            y = i // width + dy
+            r = 0
+            while (r < rules.expl_range) and (0 <= x < width) and (0 <= y < height):
+                j = x + y * width
+                if j == rules.exit or j in bomb_cells:
+                    break
+                explosions[j] = (rules.expl_duration, owner)
+                ev = check_blast(walls, width, monsters, characters, x, y, owner)
+                if ev:
+                    events.extend(ev)
+                    break
+                x += dx
+                y += dy
+                r += 1
+    # Move monsters
+    killed = set()
+    moved_monsters = []
+    for (name, x, y, dx, dy) in monsters:
+        if name in orders:
+            dx = sign(orders[name][0])
+            dy = sign(orders[name][1])
+        nx = max(0, min(width - 1, x + dx))
+        ny = max(0, min(height - 1, y + dy))
+        if ((nx != x) or (ny != y)) and not walls[nx + ny * width]:
+            expl = explosions.get(nx + ny * width)
+            if expl:
+                events.append((Event.BOMB_HIT_MONSTER, expl[1], name))
+                continue
+            for (cname, cx, cy, cdx, cdy) in characters:
+                if (cx, cy) == (nx, ny):
+                    events.append((Event.CHARACTER_KILLED_BY_MONSTER, cname, name))
+                    killed.add(cname)
+            (x, y) = (nx, ny)
+        moved_monsters.append((name, x, y, dx, dy))
+    # Place bombs and move characters
+    moved_characters = []
+    for (name, x, y, dx, dy) in characters:
+        if name == rules.me:
+            dx = sign(action[0])
+            dy = sign(action[1])
+            if len(action) > 2 and action[2] and all(b[2] != name for b in bombs):
+                bombs = place_bomb(bombs, x + y * width, rules.bomb_time, name)
+        nx = max(0, min(width - 1, x + dx))
+        ny = max(0, min(height - 1, y + dy))
+        if ((nx != x) or (ny != y)) and not walls[nx + ny * width]:
+            j = nx + ny * width
+            expl = explosions.get(j)
+            if expl:
+                events.append((Event.BOMB_HIT_CHARACTER, expl[1], name))
+                continue
+            (x, y) = (nx, ny)
+            hit = [m for m in moved_monsters if (m[1], m[2]) == (x, y)]
+            if hit:
+                events.append((Event.CHARACTER_KILLED_BY_MONSTER, name, hit[0][0]))
+                continue
+            if j == rules.exit:
+                events.append((Event.CHARACTER_FOUND_EXIT, name, None))
+                continue
+        # Characters reached by a monster are removed at the end of the step
+        if name not in killed:
+            moved_characters.append((name, x, y, dx, dy))
+    new = SearchState(rules, walls, state.time - 1, tuple(moved_characters),
+                      tuple(moved_monsters), tuple(bombs),
+                      tuple((i, timer, owner) for i, (timer, owner) in explosions.items()))
+    return (new, events)
+
+###################
+# Private methods #
+###################
+
+def check_blast(walls, width, monsters, characters, x, y, owner):
+    """Kills what an explosion at (x,y) hits, returns the events"""
+    if walls[x + y * width]:
+        return [(Event.BOMB_HIT_WALL, owner, None)]
+    ev = []
+    # World.check_blast removes entities from the list it is iterating over,
+    # which skips every other entity sharing the cell: do the same
+    for entities, tpe in ((monsters, Event.BOMB_HIT_MONSTER),
+                          (characters, Event.BOMB_HIT_CHARACTER)):
+        here = [e for e in entities if (e[1], e[2]) == (x, y)]
+        for e in here[::2]:
+            ev.append((tpe, owner, e[0]))
+            entities.remove(e)
+    return ev
+
+def place_bomb(bombs, i, timer, owner):
+    """Returns bombs with a new one at cell i, replacing any bomb there"""
+    bomb = (i, timer, owner)
+    if any(b[0] == i for b in bombs):
+        return [bomb if b[0] == i else b for b in bombs]
+    return bombs + [bomb]
@@ -1,12 +1,23 @@
 from entity import *
 from events import *
 from world import World
+from layers import CellLayers, EXPLOSION
+import zobrist
 
 class SensedWorld(World):
     """The world state as seen by a monster or a robot"""
 
+    # Whether this world is shared by several entities and must not be
+    # modified (see freeze())
+    frozen = False
+
+    # PARAM wrld [World]: the world to clone
+    # PARAM cow [bool]: if True, the wall grid is shared with wrld instead of
+    #                   being copied, and whichever world destroys or adds a
+    #                   wall first makes its own copy. Entities are always
+    #                   cloned, as agents are free to modify them.
     @classmethod
-    def from_world(cls, wrld):
+    def from_world(cls, wrld, cow=False):
         """Create a new world state from an existing state"""
         new = cls()
         new.bomb_time     = wrld.bomb_time
@@ -14,8 +25,19 @@ class SensedWorld(World):
         new.expl_range    = wrld.expl_range
         new.exitcell      = wrld.exitcell
         new.time          = wrld.time
-        # Copy grid
-        new.grid          = [[wrld.wall_at(x,y) for y in range(wrld.height())] for x in range(wrld.width())]
+        new.zhash         = wrld.zhash
+        new.map_version   = wrld.map_version
+        new.exit_field    = wrld.exit_field
+        new.blast_table   = wrld.blast_table
+        # Copy or share grid
+        if cow:
+            new.grid      = wrld.grid
+            new.grid_shared = wrld.grid_shared = True
+        else:
+            new.grid      = [list(column) for column in wrld.grid]
+        # Copy cell layers
+        if wrld.layers:
+            new.layers    = CellLayers.from_layers(wrld.layers)
         # Copy monsters
         mmapping = {}
         for k, omonsters in wrld.monsters.items():
@@ -53,6 +75,11 @@ class SensedWorld(World):
             c = cmapping.get(oe.owner)
             if c:
                 new.explosions[k] = ExplosionEntity(oe.x, oe.y, oe.timer, c)
+            else:
+                # The owner is gone, the explosion is not copied
+                new.zhash ^= zobrist.key(zobrist.EXPLOSION, k, oe.timer)
+                if new.layers:
+                    new.layers.clear(k, EXPLOSION)
         # Copy events
         for e in wrld.events:
             # Create a new event
@@ -72,25 +99,96 @@ class SensedWorld(World):
         return new
 
     def me(self, character):
-        for k,clist in self.characters.items():
-            for c in clist:
-                if c.name == character.name:
-                    return c
+        return self.character_by_name(character.name)
+
+    def freeze(self):
+        """Marks this world as shared: it refuses to be modified, and its
+        monsters and characters refuse to move or place bombs"""
+        self.frozen = True
+        for elist in list(self.monsters.values()) + list(self.characters.values()):
+            for e in elist:
+                e.frozen = True
+
+    def mutable(self):
+        """Returns a world that can be modified: this one, or a private
+        copy-on-write clone if this one is frozen"""
+        if self.frozen:
+            return SensedWorld.from_world(self, True)
+        return self
 
     def next(self):
         """Returns a new world state, along with the events that occurred"""
-        new = SensedWorld.from_world(self)
-        new.time = new.time - 1
-        new.update_explosions()
-        new.events = new.update_bombs() + new.update_monsters() + new.update_characters()
-        new.update_scores()
-        new.manage_events()
+        new = SensedWorld.from_world(self, True)
+        new.step()
         return (new, new.events)
 
+    # PARAM actions [dict]: maps the name of a monster or character to its
+    #                       action for this step, either (dx,dy) or
+    #                       (dx,dy,place_bomb); entities not listed keep
+    #                       their current direction
+    def apply(self, actions=None):
+        """Advances this world by one step in place, returns an undo record"""
+        self.check_mutable()
+        record = StepRecord(self)
+        # Flagging the grid as shared makes a destroyed wall copy it, so the
+        # grid saved in the record is left untouched
+        self.grid_shared = True
+        if actions:
+            for k,elist in list(self.monsters.items()) + list(self.characters.items()):
+                for e in elist:
+                    action = actions.get(e.name)
+                    if action:
+                        self.save_attr(e, "dx")
+                        self.save_attr(e, "dy")
+                        e.move(action[0], action[1])
+                        if len(action) > 2 and action[2]:
+                            self.save_attr(e, "maybe_place_bomb")
+                            e.place_bomb()
+        self.step()
+        return record
+
+    # PARAM record [StepRecord]: the record returned by the matching apply()
+    def undo(self, record):
+        """Restores the world as it was before the matching call to apply()"""
+        record.restore(self)
+
     ###################
     # Private methods #
     ###################
 
+    def check_mutable(self):
+        """Raises RuntimeError if this world is shared"""
+        if self.frozen:
+            raise RuntimeError("Cannot modify a shared world, call mutable() first")
+
+    # The changes to the world that are not private to a step go through
+    # these, which refuse to modify a shared world
+
+    def add_bomb(self, x, y, character):
+        self.check_mutable()
+        super().add_bomb(x, y, character)
+
+    def add_explosion(self, x, y, bomb):
+        self.check_mutable()
+        super().add_explosion(x, y, bomb)
+
+    def remove_wall(self, x, y):
+        self.check_mutable()
+        super().remove_wall(x, y)
+
+    def remove_character(self, character):
+        self.check_mutable()
+        super().remove_character(character)
+
+    def step(self):
+        """Advances this world by one step in place"""
+        self.check_mutable()
+        self.time = self.time - 1
+        self.update_explosions()
+        self.events = self.update_bombs() + self.update_monsters() + self.update_characters()
+        self.update_scores()
+        self.manage_events()
+
     def aientity_do(self, entities):
         """Call AI to get actions for next step"""
         for i, elist in entities.items():
@@ -102,3 +200,50 @@ class SensedWorld(World):
         for e in self.events:
             if e.tpe == Event.CHARACTER_KILLED_BY_MONSTER:
                 self.remove_character(e.character)
+
+###############
+# Step record #
+###############
+
+class StepRecord(object):
+    """What SensedWorld.undo() needs to revert one SensedWorld.apply()"""
+
+    def __init__(self, wrld):
+        """Saves the state of wrld that a step replaces, and starts recording
+        the changes it makes in place"""
+        self.time = wrld.time
+        self.zhash = wrld.zhash
+        self.map_version = wrld.map_version
+        self.events = wrld.events
+        self.grid = wrld.grid
+        # The step builds new monster and character tables
+        self.monsters = wrld.monsters
+        self.characters = wrld.characters
+        # Everything else is changed in place and recorded in the undo log,
+        # shared by the records of nested apply() calls
+        if wrld.undo_log is None:
+            wrld.undo_log = []
+            if wrld.layers:
+                wrld.layers.log = wrld.undo_log
+        self.start = len(wrld.undo_log)
+
+    def restore(self, wrld):
+        """Puts the saved state back into wrld"""
+        log = wrld.undo_log
+        while len(log) > self.start:
+            change = log.pop()
+            change[0](*change[1:])
+        if self.start == 0:
+            # Outermost record: stop recording
+            wrld.undo_log = None
+            if wrld.layers:
+                wrld.layers.log = None
+        wrld.time = self.time
+        wrld.zhash = self.zhash
+        wrld.map_version = self.map_version
+        wrld.events = self.events
+        # The grid stays flagged as shared, as it may have been cloned since
+        wrld.grid = self.grid
+        wrld.monsters = self.monsters
+        wrld.characters = self.characters
+        wrld.bomb_owners = None
@@ -0,0 +1,91 @@
+###################
+# Tournament runs #
+###################
+
+# Runs many headless games, possibly spread over several processes. Each job
+# seeds its own game, so results do not depend on which process runs a job or
+# in which order.
+
+import contextlib
+import io
+import multiprocessing
+import random
+import sys
+from collections import namedtuple
+from game import Game
+from events import Event
+
+# A game to play:
+# - map: path of the map file
+# - monsters: list of (monster class, constructor arguments)
+# - character: (character class, constructor arguments)
+# - seed: seed of the random number generator
+Job = namedtuple("Job", ["map", "monsters", "character", "seed"])
+
+# The result of a job:
+# - job: the job itself
+# - outcome: "exit", "killed by monster", "killed by bomb" or "timeout"
+# - time: time left at the end of the game
+# - scores: dictionary { character name : score }
+# - events: list of (event type, character name, other name or None)
+Result = namedtuple("Result", ["job", "outcome", "time", "scores", "events"])
+
+# PARAM job [Job]: the game to play
+# PARAM quiet [bool]: if True, what agents print is discarded. This swaps
+#                     sys.stdout, so threads running jobs side by side must
+#                     pass False.
+def run_job(job, quiet=True):
+    """Plays a game and returns its Result"""
+    out = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        # Agents still using the random module get a seeded one as well
+        random.seed(job.seed)
+        g = Game.fromfile(job.map, headless=True, seed=job.seed)
+        for (cls, args) in job.monsters:
+            g.add_monster(cls(*args))
+        (cls, args) = job.character
+        character = cls(*args)
+        g.add_character(character)
+        # Same loop as Game.go() in headless mode, keeping all the events
+        events = []
+        while not g.done():
+            (g.world, g.events) = g.world.next()
+            events.extend(event_tuple(e) for e in g.events)
+            g.world.next_decisions()
+    return Result(job, outcome(events, character.name), g.world.time, dict(g.world.scores), events)
+
+# PARAM jobs [list]: the Jobs to run
+# PARAM processes [int]: number of worker processes, None for one per CPU,
+#                        1 to run the jobs in this process
+# PARAM quiet [bool]: if True, what agents print is discarded
+def run(jobs, processes=None, quiet=True):
+    """Runs the jobs and returns their Results, in the same order"""
+    if processes == 1:
+        return [run_job(job, quiet) for job in jobs]
+    args = [(job, quiet) for job in jobs]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.starmap(run_job, args, chunksize=1)
+
+def wins(results):
+    """Returns the number of results where the character found the exit"""
+    return sum(1 for r in results if r.outcome == "exit")
+
+###################
+# Private methods #
+###################
+
+def event_tuple(e):
+    """Returns a picklable description of an event"""
+    other = e.other.name if e.other else None
+    return (e.tpe, e.character.name, other)
+
+def outcome(events, name):
+    """Returns how the game ended for the given character"""
+    for (tpe, character, other) in events:
+        if tpe == Event.CHARACTER_FOUND_EXIT and character == name:
+            return "exit"
+        if tpe == Event.CHARACTER_KILLED_BY_MONSTER and character == name:
+            return "killed by monster"
+        if tpe == Event.BOMB_HIT_CHARACTER and other == name:
+            return "killed by bomb"
+    return "timeout"
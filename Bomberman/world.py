@@ -1,7 +1,13 @@
 from entity import *
 from events import Event
+from layers import CellLayers, WALL, EXIT, BOMB, EXPLOSION
+import zobrist
+import maps
+import distance_field
+import blast_table
+import danger_map
+import flow_field
 import sys
-from colorama import Fore, Back, Style
 
 class World:
 
@@ -19,6 +25,11 @@ class World:
         self.time = -1
         # Grid of cell types
         self.grid       = None
+        # Whether the grid might be shared with another world, in which case
+        # it must be copied before being modified
+        self.grid_shared = False
+        # Flat cell layers, only present with the "array" storage
+        self.layers     = None
         # List of dynamic elements
         self.bombs      = {}
         self.explosions = {}
@@ -28,16 +39,51 @@ class World:
         self.scores = {}
         # Events
         self.events = []
+        # Zobrist hash of walls, exit, bombs, explosions, monsters and
+        # characters, kept up to date by every change
+        self.zhash = 0
+        # Seed of the random number generators of the entities, if any
+        self.seed = None
+        # Version of the walls and exit, shared by clones (see maps.py)
+        self.map_version = maps.new_version()
+        # Exit distance field for the current map version, if computed
+        self.exit_field = None
+        # Blast table for the current map version, if computed
+        self.blast_table = None
+        # Owner name -> index of its bomb, built by bomb_by_owner() and then
+        # kept up to date as bombs are placed and explode
+        self.bomb_owners = None
+        # Name -> entity, built by monster_by_name() and character_by_name()
+        # and checked at each lookup, since entities keep their identity
+        # when they move
+        self.monster_names = {}
+        self.character_names = {}
+        # If not None, every change a step makes to the tables, the entity
+        # lists, the entities and the cell layers is appended to this list,
+        # as (function, arguments...) that puts the old value back (see
+        # SensedWorld.apply())
+        self.undo_log = None
 
+    # PARAM storage [string]: "dict" keeps the contents of the cells in
+    #                         dictionaries only, "array" also keeps them in
+    #                         flat per-cell layers for faster queries
+    # PARAM seed [object]: if not None, every monster and character added
+    #                      gets its own random number generator seeded from
+    #                      this value and its name
     @classmethod
-    def from_params(cls, width, height, max_time, bomb_time, expl_duration, expl_range):
+    def from_params(cls, width, height, max_time, bomb_time, expl_duration, expl_range, storage="dict", seed=None):
         """Create a new empty world state"""
         new = cls()
         new.bomb_time     = bomb_time
         new.expl_duration = expl_duration
         new.expl_range    = expl_range
         new.time          = max_time
+        new.seed          = seed
         new.grid          = [[False for y in range(height)] for x in range(width)]
+        if storage == "array":
+            new.layers    = CellLayers(width, height)
+        elif storage != "dict":
+            raise RuntimeError("Unknown storage", storage)
         return new
         
     def width(self):
@@ -50,6 +96,8 @@ class World:
 
     def empty_at(self, x, y):
         """Returns True if there is nothing at (x,y)"""
+        if self.layers:
+            return self.layers.empty(x + y * self.layers.width)
         return not (self.exit_at(x,y) or
                     self.wall_at(x,y) or
                     self.bomb_at(x,y) or
@@ -63,6 +111,8 @@ class World:
 
     def wall_at(self, x, y):
         """Returns True if there is a wall at (x,y)"""
+        if self.layers:
+            return self.layers.has(x + y * self.layers.width, WALL)
         return self.grid[x][y]
 
     def bomb_at(self, x, y):
@@ -81,12 +131,110 @@ class World:
         """Returns the characters at (x,y) or None"""
         return self.characters.get(self.index(x,y))
 
+    def iter_monsters(self):
+        """Iterates over all the monsters"""
+        for mlist in self.monsters.values():
+            yield from mlist
+
+    def iter_characters(self):
+        """Iterates over all the characters"""
+        for clist in self.characters.values():
+            yield from clist
+
+    def monster_by_name(self, name):
+        """Returns the monster with the given name or None"""
+        m = self.monster_names.get(name)
+        if not (m and self.holds(self.monsters, m)):
+            self.monster_names = {m.name: m for m in self.iter_monsters()}
+            m = self.monster_names.get(name)
+        return m
+
+    def character_by_name(self, name):
+        """Returns the character with the given name or None"""
+        c = self.character_names.get(name)
+        if not (c and self.holds(self.characters, c)):
+            self.character_names = {c.name: c for c in self.iter_characters()}
+            c = self.character_names.get(name)
+        return c
+
+    def bomb_by_owner(self, character):
+        """Returns the bomb placed by the given character or None"""
+        if self.bomb_owners is None:
+            self.bomb_owners = {b.owner.name: i for i, b in self.bombs.items()}
+        i = self.bomb_owners.get(character.name)
+        if i is None:
+            return None
+        return self.bombs.get(i)
+
+    def characters_within(self, x, y, r):
+        """Returns the characters at most r cells away from (x,y) along both
+        axes, as (character, dx, dy) with (dx,dy) their offset from (x,y)"""
+        width = self.width()
+        found = []
+        for i, clist in self.characters.items():
+            dx = i % width - x
+            dy = i // width - y
+            if clist and -r <= dx <= r and -r <= dy <= r:
+                for c in clist:
+                    found.append((c, dx, dy))
+        return found
+
+    def distance_to_exit(self, x, y):
+        """Returns the number of steps from (x,y) to the exit, walls being
+        the only obstacles, or None if the exit cannot be reached"""
+        if not self.exitcell:
+            return None
+        field = self.exit_field
+        if (not field) or (field.version != self.map_version):
+            field = self.exit_field = distance_field.for_world(self)
+        return field.distance(x, y)
+
+    # PARAM margin [int]: monsters also block the cells at most this many
+    #                     cells away from them along both axes
+    def exit_flow(self, margin=0):
+        """Returns an ExitFlowField giving the next step toward the exit from
+        every cell in the current state; without an exit, no cell reaches
+        it. The field is computed once per state and shared by all the
+        characters"""
+        return flow_field.for_world(self, margin)
+
+    def explosion_footprint(self, x, y):
+        """Returns the cells a bomb at (x,y) would cover if it exploded now,
+        (x,y) included, ignoring the entities that might stop its blast"""
+        cells = [(x, y)]
+        # A wall under the bomb stops the whole blast
+        if self.wall_at(x, y):
+            return cells
+        for ray in self.blast_rays(x, y):
+            for (xx, yy) in ray:
+                # Another bomb stops the blast
+                if self.bomb_at(xx, yy):
+                    break
+                cells.append((xx, yy))
+        return cells
+
+    def danger_map(self):
+        """Returns a DangerMap telling at which of the next steps each cell
+        will hold an explosion, given the current bombs and explosions"""
+        return danger_map.DangerMap(self)
+
+    def state_hash(self):
+        """Returns a 64-bit hash of the world state"""
+        # Monster directions are changed by the monsters themselves, so they
+        # are added here rather than kept in self.zhash
+        h = self.zhash
+        for i,mlist in self.monsters.items():
+            for m in mlist:
+                h ^= zobrist.key(zobrist.DIRECTION, i, zobrist.direction(m.dx, m.dy), m.name)
+        return h
+
     def next(self):
         """Returns a new world state, along with the events that occurred"""
         raise NotImplementedError("Method not implemented")
 
     def printit(self):
         """Prints the current state of the world"""
+        from colorama import Fore, Back, Style
         border = "+" + "-" * self.width() + "+\n"
         print("\nTIME LEFT: ", self.time)
         sys.stdout.write(border)
@@ -136,19 +284,95 @@ class World:
         """Returns an index used in internal dictionaries"""
         return x + y * self.width()
 
+    # PARAM table [dict]: bombs, explosions or scores
+    # PARAM key [object]: the key whose entry is about to change
+    def save_entry(self, table, key):
+        """Records an entry in the undo log, if any"""
+        if self.undo_log is not None:
+            if key in table:
+                self.undo_log.append((dict.__setitem__, table, key, table[key]))
+            else:
+                self.undo_log.append((dict.__delitem__, table, key))
+
+    # PARAM obj [Entity]: the entity whose attribute is about to change
+    # PARAM name [string]: the name of the attribute
+    def save_attr(self, obj, name):
+        """Records an attribute in the undo log, if any"""
+        if self.undo_log is not None:
+            self.undo_log.append((setattr, obj, name, getattr(obj, name)))
+
+    # PARAM entities [list]: a list of monsters or characters
+    # PARAM e [Entity]: the entity to remove from it
+    def remove_entity(self, entities, e):
+        """Removes an entity from a list, recording it in the undo log"""
+        i = entities.index(e)
+        del entities[i]
+        if self.undo_log is not None:
+            self.undo_log.append((list.insert, entities, i, e))
+
+    # PARAM name [string]: the name of a character
+    # PARAM points [int]: points to add to its score
+    def add_score(self, name, points):
+        """Adds points to a score, recording it in the undo log"""
+        self.save_entry(self.scores, name)
+        self.scores[name] = self.scores[name] + points
+
+    def holds(self, entities, e):
+        """Returns True if e is in the given monster or character lists"""
+        return any(x is e for x in entities.get(self.index(e.x, e.y), ()))
+
     def add_explosion(self, x, y, bomb):
         """Adds an explosion to the world state"""
-        self.explosions[self.index(x,y)] = ExplosionEntity(x, y, self.expl_duration, bomb.owner)
+        i = self.index(x,y)
+        old = self.explosions.get(i)
+        if old:
+            self.zhash ^= zobrist.key(zobrist.EXPLOSION, i, old.timer)
+        self.save_entry(self.explosions, i)
+        self.explosions[i] = ExplosionEntity(x, y, self.expl_duration, bomb.owner)
+        self.zhash ^= zobrist.key(zobrist.EXPLOSION, i, self.expl_duration)
+        if self.layers:
+            self.layers.set(i, EXPLOSION)
 
     def add_bomb(self, x, y, character):
         """Adds a bomb to the world state"""
-        self.bombs[self.index(x,y)] = BombEntity(x, y, self.bomb_time, character)
+        i = self.index(x,y)
+        old = self.bombs.get(i)
+        if old:
+            self.zhash ^= zobrist.key(zobrist.BOMB, i, old.timer)
+            if self.bomb_owners is not None:
+                self.bomb_owners.pop(old.owner.name, None)
+        self.save_entry(self.bombs, i)
+        self.bombs[i] = BombEntity(x, y, self.bomb_time, character)
+        if self.bomb_owners is not None:
+            self.bomb_owners[character.name] = i
+        self.zhash ^= zobrist.key(zobrist.BOMB, i, self.bomb_time)
+        if self.layers:
+            self.layers.set(i, BOMB)
+
+    def own_grid(self):
+        """Makes sure the grid is not shared before modifying it"""
+        if self.grid_shared:
+            self.grid = [list(column) for column in self.grid]
+            self.grid_shared = False
+
+    def remove_wall(self, x, y):
+        """Removes the wall at (x,y), if any"""
+        if self.grid[x][y]:
+            self.own_grid()
+            self.grid[x][y] = False
+            self.zhash ^= zobrist.key(zobrist.WALL, self.index(x,y))
+            self.map_version = maps.wall_destroyed(self.map_version, x, y)
+            if self.layers:
+                self.layers.clear(self.index(x,y), WALL)
 
     def remove_character(self, character):
         # Remove character if it exists
         i = self.index(character.x, character.y)
         if (i in self.characters) and (character in self.characters[i]):
-            self.characters[i].remove(character)
+            self.remove_entity(self.characters[i], character)
+            self.zhash ^= zobrist.key(zobrist.CHARACTER, i, 0, character.name)
+            if self.layers:
+                self.layers.remove_character(i)
 
     def check_blast(self, bomb, x, y):
         # Check if a wall has been hit
@@ -161,7 +385,10 @@ class World:
         if mlist:
             for m in mlist:
                 ev.append(Event(Event.BOMB_HIT_MONSTER, bomb.owner, m))
-                self.monsters[self.index(x,y)].remove(m)
+                self.remove_entity(self.monsters[self.index(x,y)], m)
+                self.zhash ^= zobrist.key(zobrist.MONSTER, self.index(x,y), 0, m.name)
+                if self.layers:
+                    self.layers.remove_monster(self.index(x,y))
         # Check if a character has been hit
         clist = self.characters_at(x,y)
         if clist:
@@ -171,17 +398,18 @@ class World:
         # Return collected events
         return ev
 
-    def add_blast_dxdy(self, bomb, dx, dy):
-        # Current position
-        xx = bomb.x + dx
-        yy = bomb.y + dy
-        # Range
-        rnge = 0
-        while ((rnge < self.expl_range) and
-               (xx >= 0) and (xx < self.width()) and
-               (yy >= 0) and (yy < self.height())):
-            # Cannot destroy exit or another bomb
-            if (self.exitcell == (xx,yy)) or (self.bomb_at(xx, yy)):
+    def blast_rays(self, x, y):
+        """Returns the 4 rays of a blast at (x,y) on the current map"""
+        table = self.blast_table
+        if (not table) or (table.version != self.map_version):
+            table = self.blast_table = blast_table.for_world(self)
+        return table.rays_at(self, x, y)
+
+    def add_blast_ray(self, bomb, ray):
+        # The ray already stops at the exit, the first wall and the range
+        for (xx, yy) in ray:
+            # Cannot destroy another bomb
+            if self.bomb_at(xx, yy):
                 return []
             # Place explosion
             self.add_explosion(xx, yy, bomb)
@@ -189,10 +417,6 @@ class World:
             ev = self.check_blast(bomb, xx, yy)
             if ev:
                 return ev
-            # Next cell
-            xx = xx + dx
-            yy = yy + dy
-            rnge = rnge + 1
         # No events happened
         return []
 
@@ -205,10 +429,9 @@ class World:
         if ev:
             return ev
         # Add explosions within range
-        ev =      self.add_blast_dxdy(bomb, 1, 0)
-        ev = ev + self.add_blast_dxdy(bomb,-1, 0)
-        ev = ev + self.add_blast_dxdy(bomb, 0, 1)
-        ev = ev + self.add_blast_dxdy(bomb, 0,-1)
+        ev = []
+        for ray in self.blast_rays(bomb.x, bomb.y):
+            ev = ev + self.add_blast_ray(bomb, ray)
         return ev
 
     def update_movable_entity(self, e):
@@ -220,7 +443,13 @@ class World:
         ny = max(0, min(self.height() - 1, ny))
         # Make sure we are actually moving
         if(((nx != e.x) or (ny != e.y)) and (not self.wall_at(nx, ny))):
+            # Move the entity in the hash
+            kind = zobrist.CHARACTER if isinstance(e, CharacterEntity) else zobrist.MONSTER
+            self.zhash ^= (zobrist.key(kind, self.index(e.x, e.y), 0, e.name) ^
+                           zobrist.key(kind, self.index(nx, ny), 0, e.name))
             # Save new entity position
+            self.save_attr(e, "x")
+            self.save_attr(e, "y")
             e.x = nx
             e.y = ny
             return True
@@ -238,17 +467,23 @@ class World:
                 ev.append(Event(Event.BOMB_HIT_MONSTER, expl.owner, monster))
                 if update_dict:
                     # Remove monster
-                    self.monsters[oi].remove(monster)
+                    self.remove_entity(self.monsters[oi], monster)
+                    self.zhash ^= zobrist.key(zobrist.MONSTER, self.index(monster.x, monster.y), 0, monster.name)
+                    if self.layers:
+                        self.layers.remove_monster(oi)
                 return ev
             # Otherwise, the monster can walk safely
             if update_dict:
                 # Remove monster from previous position
-                self.monsters[oi].remove(monster)
+                self.remove_entity(self.monsters[oi], monster)
                 # Put monster in new position
                 ni = self.index(monster.x, monster.y)
                 np = self.monsters.get(ni, [])
                 np.append(monster)
                 self.monsters[ni] = np                
+                if self.layers:
+                    self.layers.remove_monster(oi)
+                    self.layers.add_monster(ni)
             # Check for collisions with characters
             characters = self.characters_at(monster.x, monster.y)
             if characters:
@@ -269,17 +504,23 @@ class World:
                 ev.append(Event(Event.BOMB_HIT_CHARACTER, expl.owner, character))
                 if update_dict:
                     # Remove character
-                    self.characters[oi].remove(character)
+                    self.remove_entity(self.characters[oi], character)
+                    self.zhash ^= zobrist.key(zobrist.CHARACTER, self.index(character.x, character.y), 0, character.name)
+                    if self.layers:
+                        self.layers.remove_character(oi)
                 return ev
             # Otherwise, the character can walk
             if update_dict:
                 # Remove character from previous position
-                self.characters[oi].remove(character)
+                self.remove_entity(self.characters[oi], character)
                 # Put character in new position
                 ni = self.index(character.x, character.y)
                 np = self.characters.get(ni, [])
                 np.append(character)
                 self.characters[ni] = np
+                if self.layers:
+                    self.layers.remove_character(oi)
+                    self.layers.add_character(ni)
             # Check for collision with monster
             monsters = self.monsters_at(character.x, character.y)
             if monsters:
@@ -294,24 +535,40 @@ class World:
         """Updates explosions"""
         todelete = []
         for i,e in self.explosions.items():
+            self.zhash ^= zobrist.key(zobrist.EXPLOSION, i, e.timer)
+            self.save_attr(e, "timer")
             e.tick()
             if e.expired():
                 todelete.append(i)
-                self.grid[e.x][e.y] = False
+                self.remove_wall(e.x, e.y)
+            else:
+                self.zhash ^= zobrist.key(zobrist.EXPLOSION, i, e.timer)
         for i in todelete:
+            self.save_entry(self.explosions, i)
             del self.explosions[i]
+            if self.layers:
+                self.layers.clear(i, EXPLOSION)
 
     def update_bombs(self):
         """Updates explosions"""
         todelete = []
         ev = []
         for i,b in self.bombs.items():
+            self.zhash ^= zobrist.key(zobrist.BOMB, i, b.timer)
+            self.save_attr(b, "timer")
             b.tick()
             if b.expired():
                 todelete.append(i)
                 ev = ev + self.add_blast(b)
+            else:
+                self.zhash ^= zobrist.key(zobrist.BOMB, i, b.timer)
         for i in todelete:
+            if self.bomb_owners is not None:
+                self.bomb_owners.pop(self.bombs[i].owner.name, None)
+            self.save_entry(self.bombs, i)
             del self.bombs[i]
+            if self.layers:
+                self.layers.clear(i, BOMB)
         return ev
 
     def update_monsters(self):
@@ -325,6 +582,8 @@ class World:
                 # Update position and check for events
                 ev2 = self.update_monster_move(m, False)
                 ev = ev + ev2
+                if self.layers:
+                    self.layers.remove_monster(i)
                 # Monster gets inserted in next step's list unless hit
                 if not (ev2 and ev2[0].tpe == Event.BOMB_HIT_MONSTER):
                     # Update new index
@@ -332,6 +591,10 @@ class World:
                     np = nmonsters.get(ni, [])
                     np.append(m)
                     nmonsters[ni] = np
+                    if self.layers:
+                        self.layers.add_monster(ni)
+                else:
+                    self.zhash ^= zobrist.key(zobrist.MONSTER, self.index(m.x, m.y), 0, m.name)
         # Save new index
         self.monsters = nmonsters
         # Return events
@@ -347,18 +610,16 @@ class World:
             for c in clist:
                 # Attempt to place bomb
                 if c.maybe_place_bomb:
+                    self.save_attr(c, "maybe_place_bomb")
                     c.maybe_place_bomb = False
-                    can_bomb = True
                     # Make sure this character has not already placed another bomb
-                    for k,b in self.bombs.items():
-                        if b.owner == c:
-                            can_bomb = False
-                            break
-                    if can_bomb:
+                    if not self.bomb_by_owner(c):
                         self.add_bomb(c.x, c.y, c)
                 # Update position and check for events
                 ev2 = self.update_character_move(c, False)
                 ev = ev + ev2
+                if self.layers:
+                    self.layers.remove_character(i)
                 # Character gets inserted in next step's list unless hit,
                 # escaped, or killed
                 if not (ev2 and ev2[0].tpe in [Event.BOMB_HIT_CHARACTER, Event.CHARACTER_FOUND_EXIT, Event.CHARACTER_KILLED_BY_MONSTER]):
@@ -367,6 +628,10 @@ class World:
                     np = ncharacters.get(ni, [])
                     np.append(c)
                     ncharacters[ni] = np
+                    if self.layers:
+                        self.layers.add_character(ni)
+                else:
+                    self.zhash ^= zobrist.key(zobrist.CHARACTER, self.index(c.x, c.y), 0, c.name)
         # Save new index
         self.characters = ncharacters
         # Return events
@@ -376,16 +641,16 @@ class World:
         """Updates scores and manages events"""
         for e in self.events:
             if e.tpe == Event.BOMB_HIT_WALL:
-                self.scores[e.character.name] = self.scores[e.character.name] + 10
+                self.add_score(e.character.name, 10)
             elif e.tpe == Event.BOMB_HIT_MONSTER:
-                self.scores[e.character.name] = self.scores[e.character.name] + 50
+                self.add_score(e.character.name, 50)
             elif e.tpe == Event.BOMB_HIT_CHARACTER:
                 if e.character != e.other:
-                    self.scores[e.character.name] = self.scores[e.character.name] + 100
+                    self.add_score(e.character.name, 100)
             elif e.tpe == Event.CHARACTER_KILLED_BY_MONSTER:
                 self.remove_character(e.character)
             elif e.tpe == Event.CHARACTER_FOUND_EXIT:
-                self.scores[e.character.name] = self.scores[e.character.name] + 2 * self.time
+                self.add_score(e.character.name, 2 * self.time)
         for k,clist in self.characters.items():
             for c in clist:
-                self.scores[c.name] = self.scores[c.name] + 1
+                self.add_score(c.name, 1)
@@ -0,0 +1,54 @@
+import hashlib
+
+###################
+# Zobrist hashing #
+###################
+
+MASK = (1 << 64) - 1
+
+# Kinds of hashed features
+WALL      = 0
+EXIT      = 1
+BOMB      = 2
+EXPLOSION = 3
+MONSTER   = 4
+CHARACTER = 5
+DIRECTION = 6
+
+# Keys generated so far, by (kind, index, extra)
+keys = {}
+
+def splitmix64(x):
+    """Scrambles a 64-bit integer"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+# PARAM kind [int]: the kind of feature, one of the constants above
+# PARAM i [int]: the index of the cell of the feature
+# PARAM extra [int]: timer or direction of the feature, if any
+# PARAM name [str]: name of the monster or character, if any, so that
+#                   entities sharing a cell do not cancel each other out
+#                   and swapping two of them changes the hash
+def key(kind, i, extra=0, name=None):
+    """Returns the 64-bit key of a feature"""
+    k = (kind, i, extra, name)
+    z = keys.get(k)
+    if z is None:
+        # Keys only depend on their feature, so that hashes are the same
+        # in every process
+        z = splitmix64((kind << 48) ^ ((extra & 0xFFFF) << 32) ^ i)
+        if name is not None:
+            z = splitmix64(z ^ name_code(name))
+        keys[k] = z
+    return z
+
+def name_code(name):
+    """Returns a 64-bit integer standing for a name, the same in every
+    process (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "little")
+
+def direction(dx, dy):
+    """Returns the extra value of a direction"""
+    return (dx + 1) * 3 + (dy + 1)
@@ -2,34 +2,34 @@
 A* pathfinding algorithm for Bomberman AI
 """
 from .base import BombermanAlgorithm
-import heapq
-
-class Node:
-    """Node for A* pathfinding"""
-    def __init__(self, x, y, g_cost, h_cost, parent=None):
-        self.x = x
-        self.y = y
-        self.g_cost = g_cost
-        self.h_cost = h_cost
-        self.f_cost = g_cost + h_cost
-        self.parent = parent
-    
-    def __lt__(self, other):
-        return self.f_cost < other.f_cost
-    
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-    
-    def __hash__(self):
-        return hash((self.x, self.y))
+from .threat import MonsterThreatField
+from .grid_astar import pathfinder, walkable_cells
+from .dstar_lite import DStarLite
+from .hierarchical import HierarchicalAStar
 
 class AStarAlgorithm(BombermanAlgorithm):
     """
     A* pathfinding algorithm implementation.
     """
     
-    def __init__(self):
+    def __init__(self, search="astar"):
+        """
+        Args:
+            search: path finder used by find_path, "astar", "jps", "dstar"
+                or "hpa" (Jump Point Search, faster on large open maps,
+                D* Lite, which repairs its last search instead of starting
+                over, or HPA*, which plans on clusters of cells for very
+                large maps), or "flow" to follow the exit flow field of the
+                world, computed once per step for all the characters
+        """
         super().__init__("A* Pathfinding")
+        # Monster threat field of the last world seen, see threat_field()
+        self.threat = None
+        self.threat_world = None
+        self.threat_hash = None
+        # Path finder, reused by every search; its expanded attribute is
+        # the number of nodes expanded by the last one. None for "flow"
+        self.pathfinder = None if search == "flow" else pathfinder(search)
     
     def get_action(self, wrld, character):
         """
@@ -68,7 +68,15 @@ class AStarAlgorithm(BombermanAlgorithm):
         # No path found or already at goal
         return (0, 0)
     
-    def is_valid_position(self, wrld, x, y, monsters=None):
+    def threat_field(self, wrld):
+        """Monster threat field of the world, computed once per world state."""
+        if self.threat_world is not wrld or self.threat_hash != wrld.zhash:
+            self.threat = MonsterThreatField(wrld)
+            self.threat_world = wrld
+            self.threat_hash = wrld.zhash
+        return self.threat
+    
+    def is_valid_position(self, wrld, x, y, threat=None):
         """Check if position is valid and walkable."""
         # Check bounds
         if x < 0 or x >= wrld.width() or y < 0 or y >= wrld.height():
@@ -79,7 +87,7 @@ class AStarAlgorithm(BombermanAlgorithm):
             return False
         
         # Check if position is too close to any monster
-        if self.is_too_close_to_monster(wrld, x, y, monsters):
+        if self.is_too_close_to_monster(wrld, x, y, threat):
             return False
         
         return True
@@ -87,28 +95,19 @@ class AStarAlgorithm(BombermanAlgorithm):
     def get_all_monsters(self, wrld):
         """Get all monster positions in the world."""
         monsters = []
-        for x in range(wrld.width()):
-            for y in range(wrld.height()):
-                monster_list = wrld.monsters_at(x, y)
-                if monster_list:
-                    for monster in monster_list:
-                        # Get detection range, default to 2 if not available
-                        detection_range = getattr(monster, 'rnge', 2)
-                        monsters.append((x, y, detection_range))
+        for monster in wrld.iter_monsters():
+            # Get detection range, default to 2 if not available
+            detection_range = getattr(monster, 'rnge', 2)
+            monsters.append((monster.x, monster.y, detection_range))
         return monsters
     
-    def is_too_close_to_monster(self, wrld, x, y, monsters=None):
+    def is_too_close_to_monster(self, wrld, x, y, threat=None):
         """Check if position is too close to any monster."""
-        if monsters is None:
-            monsters = self.get_all_monsters(wrld)
-        for monster_x, monster_y, detection_range in monsters:
-            # Calculate distance to monster
-            distance = max(abs(x - monster_x), abs(y - monster_y))
-            # Only avoid if very close (within 1 cell of detection range)
-            # This allows getting closer but not too close
-            if distance <= 1:
-                return True
-        return False
+        if threat is None:
+            threat = self.threat_field(wrld)
+        # Only avoid if very close (a monster can get there in one step)
+        # This allows getting closer but not too close
+        return threat.within(x, y, 1)
     
     def is_monster_close(self, wrld, character):
         """Check if any monster is close to character (within detection range)."""
@@ -123,25 +122,12 @@ class AStarAlgorithm(BombermanAlgorithm):
     
     def find_escape_route(self, wrld, character):
         """Find the best escape route when monster is close."""
-        monsters = self.get_all_monsters(wrld)
-        if not monsters:
+        threat = self.threat_field(wrld)
+        if not threat.monsters:
             return (0, 0)
         
-        # Find the closest monster
-        closest_monster = None
-        closest_distance = float('inf')
-        for monster_x, monster_y, detection_range in monsters:
-            distance = max(abs(character.x - monster_x), abs(character.y - monster_y))
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_monster = (monster_x, monster_y)
-        
-        if not closest_monster:
-            return (0, 0)
-        
-        monster_x, monster_y = closest_monster
-        
-        # Try all 8 directions and find the one that maximizes distance
+        # Try all 8 directions and find the one that maximizes the number
+        # of steps the nearest monster needs to catch up
         best_direction = (0, 0)
         best_distance = 0
         
@@ -150,9 +136,12 @@ class AStarAlgorithm(BombermanAlgorithm):
             new_y = character.y + dy
             
             # Check if this direction is valid
-            if self.is_valid_position(wrld, new_x, new_y, monsters):
-                # Calculate distance to monster from new position
-                new_distance = max(abs(new_x - monster_x), abs(new_y - monster_y))
+            if self.is_valid_position(wrld, new_x, new_y, threat):
+                # Calculate distance to monster from new position, no
+                # monster being able to get there is best
+                new_distance = threat.distance(new_x, new_y)
+                if new_distance is None:
+                    new_distance = float('inf')
                 
                 # If this direction gives more distance, it's better
                 if new_distance > best_distance:
@@ -167,7 +156,7 @@ class AStarAlgorithm(BombermanAlgorithm):
         for dx, dy in self.get_neighbors():
             new_x = character.x + dx
             new_y = character.y + dy
-            if self.is_valid_position(wrld, new_x, new_y, monsters):
+            if self.is_valid_position(wrld, new_x, new_y, threat):
                 return (dx, dy)
         
         # If no escape route found, don't move
@@ -187,37 +176,15 @@ class AStarAlgorithm(BombermanAlgorithm):
         dy = abs(pos1[1] - pos2[1])
         return max(dx, dy)
     
-    def add_to_open_set(self, open_set, node):
-        """Add a node to the open set (priority queue)."""
-        heapq.heappush(open_set, node)
-    
-    def get_best_node(self, open_set):
-        """Get the node with lowest f_cost from open set."""
-        if not open_set:
-            return None
-        return heapq.heappop(open_set)
-    
-    def reconstruct_path(self, goal_node):
-        """Reconstruct path from goal node back to start using parent pointers."""
-        path = []
-        current = goal_node
-        
-        # Trace back from goal to start
-        while current is not None:
-            path.append((current.x, current.y))
-            current = current.parent
-        
-        # Reverse to get path from start to goal
-        path.reverse()
-        return path
-    
     def find_path(self, wrld, character):
         """
         Find path from character position to exit using A*.
         Returns list of (x, y) coordinates representing the path.
         """
-        # Get monsters once to avoid repeated scanning
-        monsters = self.get_all_monsters(wrld)
+        # The flow field avoids the same cells as the threat field below,
+        # and one search from the exit serves every character of the step
+        if self.pathfinder is None:
+            return wrld.exit_flow(1).path(character.x, character.y)
         
         # Basic setup
         start = (character.x, character.y)
@@ -227,58 +194,26 @@ class AStarAlgorithm(BombermanAlgorithm):
         if start == goal:
             return [start]
         
-        # Initialize open and closed sets
-        open_set = []           # Priority queue of nodes to explore
-        closed_set = set()      # Set of positions we've already explored
-        
-        # Create start node and add to open set
-        start_g_cost = 0  # Cost from start to start is 0
-        start_h_cost = self.heuristic(start, goal)  # Heuristic cost to goal
-        start_node = Node(start[0], start[1], start_g_cost, start_h_cost)
-        
-        # Add start node to open set
-        self.add_to_open_set(open_set, start_node)
+        # Search on flat cell indices
+        width = wrld.width()
+        if isinstance(self.pathfinder, (DStarLite, HierarchicalAStar)):
+            # Reads the cells it needs from the world, blocking those next
+            # to a monster as walkable_cells() does with the threat field
+            cells = self.pathfinder.find_world_path(wrld, start[0] + start[1] * width,
+                                                    goal[0] + goal[1] * width, 1)
+        else:
+            # Get the threat field once to avoid repeated scanning
+            threat = self.threat_field(wrld)
+            walkable = walkable_cells(wrld, threat)
+            cells = self.pathfinder.find_path(width, wrld.height(), walkable,
+                                              start[0] + start[1] * width,
+                                              goal[0] + goal[1] * width)
         
-        # Main A* search loop
-        while open_set:
-            # Get the best node (lowest f_cost)
-            current_node = self.get_best_node(open_set)
-            if not current_node:
-                break
-                
-            # Check if we reached the goal
-            if (current_node.x, current_node.y) == goal:
-                # Reconstruct path from goal to start
-                path = self.reconstruct_path(current_node)
-                return path
-            
-            # Add current position to closed set
-            closed_set.add((current_node.x, current_node.y))
-            
-            # Explore neighbors
-            for dx, dy in self.get_neighbors():
-                neighbor_x = current_node.x + dx
-                neighbor_y = current_node.y + dy
-                neighbor_pos = (neighbor_x, neighbor_y)
-                
-                # Skip if not valid position
-                if not self.is_valid_position(wrld, neighbor_x, neighbor_y, monsters):
-                    continue
-                
-                # Skip if already explored
-                if neighbor_pos in closed_set:
-                    continue
-                
-                # Calculate costs for this neighbor
-                neighbor_g_cost = current_node.g_cost + 1  # Each move costs 1
-                neighbor_h_cost = self.heuristic(neighbor_pos, goal)
-                neighbor_node = Node(neighbor_x, neighbor_y, neighbor_g_cost, neighbor_h_cost, current_node)
-                
-                # Add to open set
-                self.add_to_open_set(open_set, neighbor_node)
-            
         # No path found
-        return None
+        if cells is None:
+            return None
+        
+        return [(i % width, i // width) for i in cells]
     
     
     
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Wall-clock budget for the Bomberman search algorithms
+"""
+import time
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its deadline has passed.
+    """
+
+class Deadline:
+    """
+    Point in time after which a search must stop.
+
+    Times are read from time.monotonic(), which is the same clock in every
+    process of the machine, so that an end can be handed to a worker.
+    """
+
+    def __init__(self, budget=None, end=None):
+        """
+        Args:
+            budget: seconds from now, or None for no limit
+            end: if given instead of budget, the end itself, as a
+                time.monotonic() time
+        """
+        if budget is not None:
+            end = time.monotonic() + budget
+        self.end = end
+
+    def expired(self):
+        """True if the deadline has passed."""
+        return self.end is not None and time.monotonic() > self.end
+
+    def remaining(self):
+        """Seconds left before the deadline (0 once it passed), or None for
+        no limit."""
+        if self.end is None:
+            return None
+        return max(0.0, self.end - time.monotonic())
+
+    def check(self):
+        """Raises SearchTimeout if the deadline has passed."""
+        if self.end is not None and time.monotonic() > self.end:
+            raise SearchTimeout()
+
+def iterative_deepening(search, max_depth, deadline):
+    """
+    Runs a search one ply deeper at a time until the deadline.
+
+    Every iteration, the first one included, is dropped when it runs out of
+    time. The caller makes the deadline before its own setup, so that the
+    whole call fits in the budget.
+
+    Args:
+        search: called as search(depth, deadline, hint), with hint the best
+            move of the previous iteration (None for the first one), to be
+            searched first; returns the best move, which may be None
+        max_depth: depth of the last iteration
+        deadline: Deadline of the whole search
+
+    Returns:
+        (best move of the deepest completed iteration, its depth), or
+        (None, 0) if the first iteration did not complete in time
+    """
+    best = None
+    reached = 0
+    for depth in range(1, max_depth + 1):
+        try:
+            best = search(depth, deadline, best)
+        except SearchTimeout:
+            break
+        reached = depth
+        if deadline.expired():
+            break
+    return (best, reached)
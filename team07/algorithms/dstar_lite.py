@@ -0,0 +1,370 @@
+"""
+D* Lite incremental path finder for Bomberman search algorithms
+"""
+from array import array
+import heapq
+import re
+import maps
+from search_state import walls_of
+
+# Cost of the cells that cannot be reached
+INF = 1 << 30
+
+# Finds the cells that differ between two masks, once xor-ed together
+CHANGED = re.compile(b"[^\x00]")
+
+# Turns wall bytes into a mask of the cells without a wall
+OPEN = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+def changed_cells(old, new):
+    """
+    Indices at which two masks of the same length differ.
+
+    The masks are xor-ed as integers and the differences are then found by
+    a regular expression, both in C, so this stays fast on large maps.
+    """
+    diff = (int.from_bytes(old, "little") ^ int.from_bytes(new, "little")).to_bytes(len(new), "little")
+    return [m.start() for m in CHANGED.finditer(diff)]
+
+def blocked_cells(wrld, margin=0):
+    """
+    Cells without a wall that a character cannot walk to, as checked by
+    is_valid_position(): those with a bomb, an explosion, a monster or a
+    character, but the exit.
+
+    Args:
+        wrld: the world
+        margin: the cells at most this many cells away from a monster are
+            also blocked, even the exit
+
+    Returns:
+        The set of blocked cell indices (x + y * width)
+    """
+    blocked = set()
+    for table in (wrld.bombs, wrld.explosions, wrld.monsters, wrld.characters):
+        for i, entities in table.items():
+            if entities:
+                blocked.add(i)
+    width = wrld.width()
+    if wrld.exitcell:
+        blocked.discard(wrld.exitcell[0] + wrld.exitcell[1] * width)
+    if margin:
+        height = wrld.height()
+        for i, mlist in wrld.monsters.items():
+            if mlist:
+                (y, x) = divmod(i, width)
+                x0 = max(x - margin, 0)
+                x1 = min(x + margin + 1, width)
+                for row in range(max(y - margin, 0) * width, min(y + margin + 1, height) * width, width):
+                    blocked.update(range(row + x0, row + x1))
+    return blocked
+
+class DStarLite:
+    """
+    D* Lite (Koenig and Likhachev, 2002), for 8-connected moves of cost 1.
+
+    The search runs backward from the goal and its state is kept from one
+    call to the next. When the goal is the same as last time, the walkable
+    mask is compared with the previous one and only the cells around the
+    changed ones are searched again, so the cost of a call follows the
+    amount of change rather than the size of the map.
+
+    Same interface as GridAStar, plus find_world_path(), which reads the
+    changes from the world itself: the cells whose blocked_cells() status
+    changed and the walls destroyed since the last call, so that nothing
+    the size of the map is built or compared. The state is dropped and the
+    search starts over when the map size or the goal change, when more than
+    max_changes of the cells changed, or when a repair expands more cells
+    than the last search from scratch did. Changes close to the goal, such as a
+    monster blocking the only way to it, can make repairing slower than
+    searching again.
+    """
+
+    def __init__(self, max_changes=0.25):
+        self.max_changes = max_changes
+        self.width = 0
+        self.height = 0
+        self.goal = -1
+        # Map version and blocked cells of the world of the last
+        # find_world_path(), None after a find_path()
+        self.version = None
+        self.blocked = None
+        # Nodes expanded during the last call
+        self.expanded = 0
+        # Nodes expanded by the last search from scratch
+        self.budget = 0
+
+    def find_path(self, width, height, walkable, start, goal):
+        """
+        Find a shortest path between two cells.
+
+        Args:
+            width, height: size of the grid
+            walkable: mask with 1 for the cells the path may go through;
+                the start cell does not need to be walkable
+            start, goal: cell indices
+
+        Returns:
+            The list of cell indices from start to goal, both included, or
+            None if the goal cannot be reached
+        """
+        # Cell (x, y) is at (x + 1) + (y + 1) * stride in the padded grid,
+        # whose border is never walkable
+        stride = width + 2
+        free = bytearray(stride * (height + 2))
+        for y in range(height):
+            row = (y + 1) * stride + 1
+            free[row:row + width] = walkable[y * width:(y + 1) * width]
+        start = self.padded(start, width)
+        goal = self.padded(goal, width)
+        self.version = None
+        self.blocked = None
+        changed = None
+        if (width, height, goal) == (self.width, self.height, self.goal):
+            changed = changed_cells(self.free, free)
+        return self.plan(width, height, free, changed, start, goal)
+
+    def find_world_path(self, wrld, start, goal, margin=0):
+        """
+        Find a path between two cells of a world, through the cells without
+        a wall that are not in blocked_cells(wrld, margin).
+
+        Args:
+            wrld: the world
+            start, goal: cell indices; the start cell does not need to be
+                walkable
+            margin: see blocked_cells()
+
+        Returns:
+            The list of cell indices from start to goal, both included, or
+            None if the goal cannot be reached
+        """
+        width = wrld.width()
+        height = wrld.height()
+        blocked = blocked_cells(wrld, margin)
+        start = self.padded(start, width)
+        goal = self.padded(goal, width)
+        walls = None
+        if (width, height, goal) == (self.width, self.height, self.goal) and self.version is not None:
+            # Walls destroyed since the last call, if the map derives from
+            # the one seen then
+            walls = maps.find_ancestor(wrld.map_version, lambda v: v == self.version)[1]
+        wall_bytes = walls_of(wrld)
+        if walls is None:
+            stride = width + 2
+            free = bytearray(stride * (height + 2))
+            for y in range(height):
+                row = (y + 1) * stride + 1
+                free[row:row + width] = wall_bytes[y * width:(y + 1) * width].translate(OPEN)
+            for cell in blocked:
+                free[self.padded(cell, width)] = 0
+            changed = None
+        else:
+            # The mask of the last search, updated in place
+            free = self.free
+            cells = self.blocked ^ blocked
+            cells.update(x + y * width for (x, y) in walls)
+            changed = []
+            for cell in cells:
+                p = self.padded(cell, width)
+                f = 0 if (cell in blocked or wall_bytes[cell]) else 1
+                if free[p] != f:
+                    free[p] = f
+                    changed.append(p)
+        path = self.plan(width, height, free, changed, start, goal)
+        self.version = wrld.map_version
+        self.blocked = blocked
+        return path
+
+    def plan(self, width, height, free, changed, start, goal):
+        """
+        find_path() once the padded masks are known.
+
+        Args:
+            free: padded mask of the walkable cells
+            changed: padded cells in which free differs from the mask of the
+                last search, or None to search from scratch
+            start, goal: padded cell indices
+        """
+        self.expanded = 0
+        if changed is not None and len(changed) <= self.max_changes * width * height:
+            # The heuristic is measured from the start, which has moved
+            self.km += self.h(self.start, start)
+            previous = self.start
+            self.start = start
+            self.origin = divmod(start, self.stride)
+            self.free = free
+            # Only the moves into a changed cell cost something different,
+            # and only free cells and the start are part of the search
+            for c in changed:
+                self.update_vertex(c)
+                for d in self.offsets:
+                    if self.inside[c + d]:
+                        self.update_vertex(c + d)
+            self.update_vertex(previous)
+            self.update_vertex(start)
+            if self.compute(self.budget):
+                return self.extract()
+        repaired = self.expanded
+        self.reset(width, height, free, start, goal)
+        self.compute(-1)
+        self.budget = self.expanded - repaired
+        return self.extract()
+
+    def reset(self, width, height, free, start, goal):
+        """Drops the search state and starts a new search from the goal."""
+        stride = width + 2
+        size = stride * (height + 2)
+        self.width = width
+        self.height = height
+        self.stride = stride
+        self.free = free
+        self.start = start
+        # (y, x) of the start, from which the heuristic is measured
+        self.origin = divmod(start, stride)
+        self.goal = goal
+        self.km = 0
+        self.offsets = [dx + dy * stride for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+        self.inside = bytearray(size)
+        for y in range(height):
+            row = (y + 1) * stride + 1
+            self.inside[row:row + width] = b"\x01" * width
+        self.g = array('i', [INF]) * size
+        self.rhs = array('i', [INF]) * size
+        self.rhs[goal] = 0
+        # Cell -> key of its valid entry in the heap; others are stale
+        self.queued = {}
+        self.heap = []
+        self.push(goal)
+
+    ###################
+    # Private methods #
+    ###################
+
+    def padded(self, cell, width):
+        """Index in the padded grid of a cell index."""
+        (y, x) = divmod(cell, width)
+        return (x + 1) + (y + 1) * (width + 2)
+
+    def h(self, a, b):
+        """Chebyshev distance between two padded cells."""
+        (ay, ax) = divmod(a, self.stride)
+        (by, bx) = divmod(b, self.stride)
+        return max(abs(ax - bx), abs(ay - by))
+
+    def push(self, u):
+        """Adds a cell to the heap, replacing its previous entry."""
+        m = min(self.g[u], self.rhs[u])
+        (y, x) = divmod(u, self.stride)
+        (sy, sx) = self.origin
+        k1 = m + max(abs(x - sx), abs(y - sy)) + self.km
+        self.queued[u] = (k1, m)
+        heapq.heappush(self.heap, (k1, m, u))
+
+    def update_vertex(self, u):
+        """Recomputes the cost from a cell to the goal through its neighbors."""
+        g = self.g
+        free = self.free
+        if u != self.goal:
+            best = INF
+            if free[u] or u == self.start:
+                for d in self.offsets:
+                    s = u + d
+                    if free[s] and g[s] + 1 < best:
+                        best = g[s] + 1
+            self.rhs[u] = best
+        if g[u] != self.rhs[u]:
+            self.push(u)
+        else:
+            self.queued.pop(u, None)
+
+    def compute(self, budget):
+        """
+        Searches until the cost of the start is known.
+
+        Args:
+            budget: nodes that can be expanded, -1 for no limit
+
+        Returns:
+            False if the search ran out of budget
+        """
+        g = self.g
+        rhs = self.rhs
+        free = self.free
+        heap = self.heap
+        queued = self.queued
+        start = self.start
+        goal = self.goal
+        offsets = self.offsets
+        stride = self.stride
+        km = self.km
+        (sy, sx) = self.origin
+        push = self.push
+        update_vertex = self.update_vertex
+        while heap:
+            (k1, k2, u) = heap[0]
+            if rhs[start] == g[start] and (k1, k2) >= (g[start] + km, g[start]):
+                break
+            heapq.heappop(heap)
+            if queued.get(u) != (k1, k2):
+                continue
+            m = min(g[u], rhs[u])
+            (y, x) = divmod(u, stride)
+            new = (m + max(abs(x - sx), abs(y - sy)) + km, m)
+            if (k1, k2) < new:
+                push(u)
+                continue
+            del queued[u]
+            if budget == 0:
+                return False
+            budget -= 1
+            self.expanded += 1
+            if g[u] > rhs[u]:
+                # The cost went down: it can only lower that of the
+                # neighbors, no need to look at their other neighbors
+                cost = rhs[u]
+                g[u] = cost
+                if free[u]:
+                    cost += 1
+                    for d in offsets:
+                        s = u + d
+                        if cost < rhs[s] and s != goal and (free[s] or s == start):
+                            rhs[s] = cost
+                            push(s)
+            else:
+                # The cost went up: the neighbors that went through u must
+                # look for another way
+                old = g[u] + 1
+                g[u] = INF
+                update_vertex(u)
+                if free[u]:
+                    for d in offsets:
+                        s = u + d
+                        if rhs[s] == old and s != goal:
+                            update_vertex(s)
+        return True
+
+    def extract(self):
+        """Follows the costs from the start to the goal, in cell indices."""
+        g = self.g
+        free = self.free
+        stride = self.stride
+        cell = self.start
+        if self.rhs[cell] >= INF:
+            return None
+        path = []
+        while True:
+            (y, x) = divmod(cell, stride)
+            path.append((x - 1) + (y - 1) * self.width)
+            if cell == self.goal:
+                return path
+            if len(path) > self.width * self.height:
+                return None
+            best = None
+            for d in self.offsets:
+                s = cell + d
+                if free[s] and g[s] < INF and (best is None or g[s] < g[best]):
+                    best = s
+            if best is None:
+                return None
+            cell = best
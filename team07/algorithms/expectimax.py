@@ -1,16 +1,29 @@
 """
 Expectimax algorithm for Bomberman AI
 """
-import heapq
 import math
 from .base import BombermanAlgorithm
+from .grid_astar import GridAStar, open_cells
+from .transposition import TranspositionTable
+from .deadline import Deadline, iterative_deepening
 
 class ExpectimaxAlgorithm(BombermanAlgorithm):
     """
     Expectimax algorithm implementation.
     """
     
-    def __init__(self, search_depth = 3):
+    def __init__(self, search_depth = 3, tt_entries = 100000, tt_policy = "lru", time_budget = None):
+        """
+        Args:
+            search_depth: depth of the search, or of its deepest iteration
+                when time_budget is set
+            tt_entries, tt_policy: size and replacement policy of the
+                transposition table
+            time_budget: if set, seconds per search: the search deepens one
+                ply at a time, from 1 up to search_depth, and plays the best
+                move of the deepest iteration completed in time (see
+                safe_move() if none did)
+        """
         super().__init__("Expectimax")
         # Initial state!
         # (I might want to add more states in the future...)
@@ -33,6 +46,26 @@ class ExpectimaxAlgorithm(BombermanAlgorithm):
 
         self.x = 0
         self.y = 0
+
+        # The character being controlled
+        self.character = None
+
+        # Values of the nodes already searched, kept between turns
+        # (set tt_entries to 0 to disable it)
+        self.table = TranspositionTable(tt_entries, tt_policy)
+
+        # Number of nodes expanded during the last search
+        self.expanded = 0
+
+        # Wall-clock budget of a search, see iterative_deepening()
+        self.time_budget = time_budget
+        self.deadline = Deadline()
+        # Depth of the last search, or of its deepest completed iteration
+        self.depth_reached = 0
+
+        # A* engine, reused by every search, with the Manhattan distance
+        # this agent has always used
+        self.pathfinder = GridAStar("manhattan")
     
 
     def get_action(self, wrld, character):
@@ -45,14 +78,14 @@ class ExpectimaxAlgorithm(BombermanAlgorithm):
 
         # Start by checking to see if there are any monsters nearby.
         # This will determine if the agent does A* or expectimax
-        self.mon_checker(wrld.from_world(wrld), character)
+        self.mon_checker(wrld.from_world(wrld, True), character)
 
         if (self.state == "goal"):
             # Does A*
-            self.a_star_move(wrld.from_world(wrld))
+            self.a_star_move(wrld.from_world(wrld, True))
         elif (self.state == "mon dodge"):
             # Does expectimax
-            self.expectimax_search(wrld.from_world(wrld), self.search_depth, character)
+            self.expectimax_search(wrld.from_world(wrld, True), self.search_depth, character)
 
         return (self.dx, self.dy)
     
@@ -64,10 +97,8 @@ class ExpectimaxAlgorithm(BombermanAlgorithm):
     def find_exit(self, wrld):
         self.initial_x = self.y
         self.initial_y = self.x
-        for posy_x in range(0, wrld.width()):
-            for posy_y in range(0, wrld.height()):
-                if wrld.exit_at(posy_x, posy_y):
-                    self.exitie = (posy_x, posy_y)
+        if wrld.exitcell:
+            self.exitie = wrld.exitcell
 
     # This will check to see if there are any monsters near the agent
     def mon_checker(self, wrld, character):
@@ -86,55 +117,149 @@ class ExpectimaxAlgorithm(BombermanAlgorithm):
     ######################################################
 
     def expectimax_search(self, wrld, depth, character):
+        # The time budget, if any, counts from here
+        deadline = Deadline(self.time_budget)
         self.action = "move"
         self.find_exit(wrld)
 
+        # The whole tree is walked on this single world with apply/undo
+        self.character = character
+        self.expanded = 0
+        self.table.new_search()
+
+        if self.time_budget is None:
+            self.deadline = deadline
+            best = self.search_root(wrld, depth, None)
+            self.depth_reached = depth
+        else:
+            def search(d, deadline, hint):
+                self.deadline = deadline
+                return self.search_root(wrld, d, hint)
+            (best, self.depth_reached) = iterative_deepening(search, depth, deadline)
+        if best is None:
+            # Nothing searched in time (or no move at all): never replay the
+            # move of the last turn
+            best = self.safe_move(wrld)
+        (self.dx, self.dy) = best
+
+
+    # Returns the move (dx, dy), staying put included, that ends the
+    # farthest from the closest monster, then the closest to the exit
+    # (Played when not even a search of depth 1 completed)
+    def safe_move(self, wrld):
+        best = (0, 0)
+        top_score = None
+        for posy_x in [-1, 0, 1]:
+            for posy_y in [-1, 0, 1]:
+                x = self.x + posy_x
+                y = self.y + posy_y
+                if (x < 0) or (x >= wrld.width()) or (y < 0) or (y >= wrld.height()):
+                    continue
+                if wrld.wall_at(x, y) or wrld.monsters_at(x, y):
+                    continue
+                closey_mon = 100
+                for key in wrld.monsters:
+                    for mon in wrld.monsters[key]:
+                        closey_mon = min(closey_mon, abs(mon.x - x) + abs(mon.y - y))
+                exit_dist = wrld.distance_to_exit(x, y)
+                if exit_dist is None:
+                    exit_dist = wrld.width() * wrld.height()
+                score = (closey_mon, -exit_dist)
+                if (top_score is None) or (score > top_score):
+                    top_score = score
+                    best = (posy_x, posy_y)
+        return best
+
+
+    # Returns the best move (dx, dy) at the given depth, None if there is no
+    # move; hint, if given, is searched first
+    def search_root(self, wrld, depth, hint):
         # Keep track of the best score found to determine which move is the best!
         top_score = -math.inf
+        best = None
 
         # Loop through the possible moves for the player character
+        moves = []
         for posy_x in [-1, 0, 1]:
             if (self.x + posy_x >= 0) and (self.x + posy_x < wrld.width()):
                 for posy_y in [-1, 0, 1]:
                     if (posy_x != 0) or (posy_y != 0):
-                        new_wrld = wrld.from_world(wrld)
-                        bomberman = new_wrld.me(character)
-                        if(bomberman.y + posy_y >= 0) and (bomberman.y + posy_y < wrld.height()):
-                            if not wrld.wall_at((bomberman.x + posy_x), (bomberman.y + posy_y)):
-                                bomberman.move(posy_x, posy_y)
-                                next_wrld = wrld.next()
-                                move_points = self.expval(next_wrld[0], next_wrld[1], (depth - 1))
-
-                                if move_points >= top_score:
-                                    top_score = move_points
-                                    self.dx = posy_x
-                                    self.dy = posy_y
-
-
-    def expval(self, wrld, events, depth):
+                        if(self.y + posy_y >= 0) and (self.y + posy_y < wrld.height()):
+                            if not wrld.wall_at((self.x + posy_x), (self.y + posy_y)):
+                                moves.append((posy_x, posy_y))
+        # Ties go to the last move in this order, whatever the order searched
+        order = {move: i for (i, move) in enumerate(moves)}
+        if hint in moves:
+            moves.remove(hint)
+            moves.insert(0, hint)
+
+        for (posy_x, posy_y) in moves:
+            record = wrld.apply({self.character.name: (posy_x, posy_y)})
+            try:
+                move_points = self.expval(wrld, wrld.events, (depth - 1))
+            finally:
+                # Undoing the first step puts back the whole world, even
+                # if the search was stopped deeper in the tree
+                wrld.undo(record)
+
+            if (best is None or move_points > top_score or
+                (move_points == top_score and order[(posy_x, posy_y)] > order[best])):
+                top_score = move_points
+                best = (posy_x, posy_y)
+        return best
+
+
+    # Returns the utility if the search must stop at this node, None otherwise
+    def leaf_value(self, wrld, events, depth):
         # If the character has died or found the goal, calculate the utility
-        bomberman = wrld.me(self)
+        for event in events:
+            if ((3 == event.tpe) or
+                (2 == event.tpe) or
+                (4 == event.tpe)):
+                return self.state_utility(wrld, events, depth)
         # In case the agent has been killed, this will return the death reward
-        if (bomberman == None):
+        if (wrld.me(self.character) == None):
             return -10.0 * (depth + 1)
-        
-        if (len(events) > 0):
-            for event in events:
-                if ((3 == event.tpe) or
-                    (2 == event.tpe) or
-                    (4 == event.tpe)):
-                    return self.state_utility(wrld, events, depth)
         # If the depth limit has been reached, calculate the utility
-        elif (depth == 0):
-            return self.state_utility(wrld, events, depth)
+        # (or reuse it, if this state has already been evaluated)
+        if (depth <= 0):
+            state_hash = wrld.state_hash()
+            v = self.table.get(state_hash, depth, "leaf")
+            if (v == None):
+                v = self.state_utility(wrld, events, depth)
+                self.table.put(state_hash, depth, "leaf", v)
+            return v
+        return None
+
+
+    def expval(self, wrld, events, depth):
+        leaf = self.leaf_value(wrld, events, depth)
+        if (leaf != None):
+            return leaf
+        # Same state reached through another move order?
+        # (Steps without a new move keep the character's direction, so it
+        # is part of the key)
+        bomberman = wrld.me(self.character)
+        state_hash = wrld.state_hash()
+        kind = ("exp", bomberman.dx, bomberman.dy)
+        v = self.table.get(state_hash, depth, kind)
+        if (v != None):
+            return v
+        v = self.expand_expval(wrld, depth)
+        self.table.put(state_hash, depth, kind, v)
+        return v
+
+    def expand_expval(self, wrld, depth):
+        self.deadline.check()
+        self.expanded = self.expanded + 1
+        bomberman = wrld.me(self.character)
         
         v = 0
 
         # Loop through all the monsters in the world
-        for key in wrld.monsters:
-            for mon in wrld.monsters[key]:
+        for key in list(wrld.monsters):
+            for mon in list(wrld.monsters[key]):
                 moves = []
-                worlds = []
                 
                 # Loop through all the possible moves for the current monster
                 for posy_x in [-1, 0, 1]:
@@ -154,53 +279,54 @@ class ExpectimaxAlgorithm(BombermanAlgorithm):
                                             dist_score = 1.0 / ((char_dist) + 0.001)
 
                                             # Add this to the scores for all the moves
-                                            moves.append(dist_score)
-
-                                            # Create a new world and monsters
-                                            new_wrld = wrld.from_world(wrld)
-                                            new_mon = new_wrld.monsters[key][0]
-                                            new_mon.move(posy_x, posy_y)
-                                            worlds.append(new_wrld)
+                                            moves.append((dist_score, posy_x, posy_y))
                 
                 # If there are no moves found, then the agent can just move on
                 if (len(moves) == 0):
-                    next_wrld = wrld.next()
-                    return self.maxval(next_wrld[0], next_wrld[1], (depth - 1))
+                    record = wrld.apply()
+                    v = self.maxval(wrld, wrld.events, (depth - 1))
+                    wrld.undo(record)
+                    return v
                 
-                total_move_score = sum(moves)
+                total_move_score = sum(move[0] for move in moves)
 
-                # Iterate through the worlds and calculate the probability
+                # Iterate through the moves and calculate the probability
                 # based on how close to the player the monster will be
                 # (The player assumes that the monsters are more likely to move towards them)
-                for i in range(len(moves)):
-                    proby = moves[i] / total_move_score
-                    wrldy = worlds[i]
-                    new_wrld = wrldy
-                    new_events = wrldy.events
+                (old_dx, old_dy) = (mon.dx, mon.dy)
+                for (dist_score, posy_x, posy_y) in moves:
+                    self.deadline.check()
+                    proby = dist_score / total_move_score
+                    mon.move(posy_x, posy_y)
 
                     # Move on to the next step!
-                    v = v + (proby * self.maxval(new_wrld, new_events, (depth - 1)))
+                    v = v + (proby * self.maxval(wrld, wrld.events, (depth - 1)))
+                mon.move(old_dx, old_dy)
 
         if (v == 0):
-            next_wrld = wrld.next()
-            v = v + self.maxval(next_wrld[0],  next_wrld[1], (depth - 1))
+            record = wrld.apply()
+            v = v + self.maxval(wrld,  wrld.events, (depth - 1))
+            wrld.undo(record)
 
         return v
     
     def maxval(self, wrld, events, depth):
-        bomberman = wrld.me(self)
-        # In case the agent has been killed, this will return the death reward
-        if (bomberman == None):
-            return -10.0 * (depth + 1)
-        
-        if (len(events) > 0):
-            for event in events:
-                if ((3 == event.tpe) or
-                    (2 == event.tpe) or
-                    (4 == event.tpe)):
-                    return self.state_utility(wrld, events, depth)
-        elif (depth == 0):
-            return self.state_utility(wrld, events, depth)
+        leaf = self.leaf_value(wrld, events, depth)
+        if (leaf != None):
+            return leaf
+        # Same state reached through another move order?
+        state_hash = wrld.state_hash()
+        v = self.table.get(state_hash, depth, "max")
+        if (v != None):
+            return v
+        v = self.expand_maxval(wrld, depth)
+        self.table.put(state_hash, depth, "max", v)
+        return v
+
+    def expand_maxval(self, wrld, depth):
+        self.deadline.check()
+        self.expanded = self.expanded + 1
+        bomberman = wrld.me(self.character)
         
         v = -math.inf 
 
@@ -210,57 +336,56 @@ class ExpectimaxAlgorithm(BombermanAlgorithm):
                 for posy_y in [-1, 0, 1]:
                     if(bomberman.y + posy_y >= 0) and (bomberman.y + posy_y < wrld.height()):
                         if not wrld.wall_at((bomberman.x + posy_x), (bomberman.y + posy_y)):
-                            # Make a clone of the world and the character
-                            new_wrld = wrld.from_world(wrld)
-                            baby_bomber = new_wrld.me(self)
-                            baby_bomber.move(posy_x, posy_y)
-                            # Move on to the next step!
-                            next_wrld = new_wrld.next()
+                            # (Each child may cost a full evaluation)
+                            self.deadline.check()
+                            # Step the world with this move
+                            record = wrld.apply({bomberman.name: (posy_x, posy_y)})
                             # Continue calculating v based on this move
-                            v = max(v, self.expval(next_wrld[0], next_wrld[1], (depth - 1)))
+                            v = max(v, self.expval(wrld, wrld.events, (depth - 1)))
+                            wrld.undo(record)
         
         return v
     
 
     def state_utility(self, wrld, events, depth):
-        bomberman = wrld.me(self)
+        for event in events:
+            if ((3 == event.tpe) or
+                (2 == event.tpe)):
+                # If the character has died, return a big negative reward!
+                return -10.0 * (depth + 1)
+            elif (4 == event.tpe):
+                # If the goal is found, return a big reward!
+                # (Multiply it by the depth so that lower depths are better)
+                return 9999.0 * (depth + 1)
+
+        bomberman = wrld.me(self.character)
         if (bomberman == None):
             return -10.0 * (depth + 1)
-        
-        if (len(events) > 0):
-            for event in events:
-                if ((3 == event.tpe) or
-                    (2 == event.tpe)):
-                    # If the character has died, return a big negative reward!
-                    return -10.0 * (depth + 1)
-                elif (self.state == 'goal'):
-                    # If the goal is found, return a big reward!
-                    # (Multiply it by the depth so that lower depths are better)
-                    if (4 == event.tpe):
-                        return 9999.0 * (depth + 1)
-        
-        else:
             
-            # Calculate the distance to the exit from the current cell
-            exit_dist = (math.sqrt(((self.exitie[0] - bomberman.x)**2) + ((self.exitie[1] - bomberman.y)**2)))
-
-            # Calculate the length of the shortest path to the goal
-            pathy_len = len(self.a_star(wrld, bomberman.x, bomberman.y))
-
-            # Calculate the distance of the closest monster
-            closey_mon = 100
-            for key in wrld.monsters:
-                for mon in wrld.monsters[key]:
-                    mon_dist = abs(mon.x - bomberman.x) + abs(mon.y - bomberman.y)
-                    if (closey_mon > mon_dist):
-                        closey_mon = mon_dist
-
-                    if closey_mon < 2.5:
-                        return -10.0
-
-                        
-            # Get the total value
-            return  (3.5 * -pathy_len) + (1.125 * closey_mon) - (1.5 * exit_dist) - self.num_steps
+        # Calculate the distance to the exit from the current cell
+        exit_dist = (math.sqrt(((self.exitie[0] - bomberman.x)**2) + ((self.exitie[1] - bomberman.y)**2)))
+
+        # Calculate the length of the shortest path to the goal
+        # (the world caches the distances to the exit for each map)
+        pathy_len = wrld.distance_to_exit(bomberman.x, bomberman.y)
+        if pathy_len is None:
+            # No path to the exit, same as an empty A* path
+            pathy_len = 0
+
+        # Calculate the distance of the closest monster
+        closey_mon = 100
+        for key in wrld.monsters:
+            for mon in wrld.monsters[key]:
+                mon_dist = abs(mon.x - bomberman.x) + abs(mon.y - bomberman.y)
+                if (closey_mon > mon_dist):
+                    closey_mon = mon_dist
+
+                if closey_mon < 2.5:
+                    return -10.0
+
+                    
+        # Get the total value
+        return  (3.5 * -pathy_len) + (1.125 * closey_mon) - (1.5 * exit_dist) - self.num_steps
         
 
     ######################################################
@@ -281,44 +406,11 @@ class ExpectimaxAlgorithm(BombermanAlgorithm):
     def a_star(self, wrld, start_x, start_y):
         self.find_exit(wrld)
 
-        open_set = []
-        heapq.heappush(open_set, (0, (start_x, start_y)))
-
-        fromy_spot = {}
-        spoty_score = {(start_x, start_y): 0}
-
-        while open_set:
-            _, current_spot = heapq.heappop(open_set)
-
-            if (current_spot == tuple(self.exitie)):
-                goaly_path = []
-                while current_spot in fromy_spot:
-                    goaly_path.append(current_spot)
-                    current_spot = fromy_spot[current_spot]
-                
-                goaly_path.reverse()
-                return goaly_path
-                
-            for posy_x in [-1, 0, 1]:
-                for posy_y in [-1, 0, 1]:
-                    if (posy_x == 0) and (posy_y ==0):
-                        continue
-                    
-                    neighbor_spot = ((current_spot[0] + posy_x), (current_spot[1] + posy_y))
-                    if ((neighbor_spot[0] >= 0) and (neighbor_spot[0] < wrld.width()) and
-                        (neighbor_spot[1] >= 0) and (neighbor_spot[1] < wrld.height()) and
-                        not (wrld.wall_at(neighbor_spot[0], neighbor_spot[1]))):
-
-                        starty_score =  spoty_score[current_spot] + 1
-
-                        if ((neighbor_spot not in spoty_score) or (starty_score < spoty_score[neighbor_spot])):
-                            fromy_spot[neighbor_spot] = current_spot
-                            spoty_score[neighbor_spot] = starty_score
-
-                            total_score = starty_score + abs(neighbor_spot[0] - self.exitie[0]) + abs(neighbor_spot[1] - self.exitie[1])
-                            heapq.heappush(open_set, (total_score, neighbor_spot))
-
-        return []
-
-        
-
+        # Path through the cells without walls, without the start
+        width = wrld.width()
+        cells = self.pathfinder.find_path(width, wrld.height(), open_cells(wrld),
+                                          start_x + start_y * width,
+                                          self.exitie[0] + self.exitie[1] * width)
+        if cells is None:
+            return []
+        return [(i % width, i // width) for i in cells[1:]]
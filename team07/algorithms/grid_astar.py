@@ -0,0 +1,333 @@
+"""
+Grid A* shared by the Bomberman search algorithms
+"""
+from array import array
+import heapq
+from search_state import walls_of
+from .dstar_lite import DStarLite
+from .hierarchical import HierarchicalAStar
+
+# The 8 moves, as (dx, dy)
+MOVES = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Turns the wall bytes of a map (1 for a wall) into a mask of open cells
+OPEN = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+def open_cells(wrld):
+    """
+    Mask of the cells without a wall.
+
+    Returns:
+        bytearray with 1 for each cell index (x + y * width) without a wall
+    """
+    return bytearray(walls_of(wrld).translate(OPEN))
+
+def walkable_cells(wrld, threat=None):
+    """
+    Mask of the cells a character can walk to: empty cells and the exit,
+    as checked by is_valid_position().
+
+    Args:
+        wrld: the world
+        threat: if given, a MonsterThreatField; the cells a monster can
+            reach in one step are then left out, even the exit
+
+    Returns:
+        bytearray with 1 for each walkable cell index (x + y * width)
+    """
+    cells = open_cells(wrld)
+    for table in (wrld.bombs, wrld.explosions, wrld.monsters, wrld.characters):
+        for i, entities in table.items():
+            if entities:
+                cells[i] = 0
+    width = wrld.width()
+    if wrld.exitcell:
+        cells[wrld.exitcell[0] + wrld.exitcell[1] * width] = 1
+    if threat:
+        height = wrld.height()
+        for mx, my, monster in threat.monsters:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    x = mx + dx
+                    y = my + dy
+                    if 0 <= x < width and 0 <= y < height:
+                        cells[x + y * width] = 0
+    return cells
+
+class GridAStar:
+    """
+    A* for 8-connected moves of cost 1, on flat cell indices (x + y * width).
+
+    The g-scores and parents live in arrays kept from one search to the
+    next. Each search stamps the cells it touches with a new generation
+    number instead of clearing them. Heap entries are (f, h, cell) tuples,
+    so ties on f go to the cell closest to the goal.
+
+    The heuristic is the Chebyshev distance, exact on an open grid, or the
+    Manhattan distance, which overestimates diagonal moves: the search then
+    reaches the goal sooner, on a path that may not be the shortest. A cell
+    reached again by a shorter path is searched again.
+    """
+
+    def __init__(self, heuristic="chebyshev"):
+        if heuristic not in ("chebyshev", "manhattan"):
+            raise ValueError("Unknown heuristic: " + str(heuristic))
+        self.manhattan = heuristic == "manhattan"
+        self.size = 0
+        self.generation = 0
+        # Nodes expanded during the last search
+        self.expanded = 0
+
+    def find_path(self, width, height, walkable, start, goal):
+        """
+        Find a shortest path between two cells.
+
+        Args:
+            width, height: size of the grid
+            walkable: mask with 1 for the cells the path may go through;
+                the start cell does not need to be walkable
+            start, goal: cell indices
+
+        Returns:
+            The list of cell indices from start to goal, both included, or
+            None if the goal cannot be reached
+        """
+        self.prepare(width * height)
+        gen = self.generation
+        g = self.g
+        parent = self.parent
+        seen = self.seen
+        manhattan = self.manhattan
+        gx = goal % width
+        gy = goal // width
+        seen[start] = gen
+        g[start] = 0
+        parent[start] = -1
+        if manhattan:
+            h = abs(start % width - gx) + abs(start // width - gy)
+        else:
+            h = max(abs(start % width - gx), abs(start // width - gy))
+        heap = [(h, h, start)]
+        expanded = 0
+        while heap:
+            f, h, cell = heapq.heappop(heap)
+            if cell == goal:
+                self.expanded = expanded
+                path = []
+                while cell >= 0:
+                    path.append(cell)
+                    cell = parent[cell]
+                path.reverse()
+                return path
+            if f - h > g[cell]:
+                # Since reached by a shorter path
+                continue
+            expanded += 1
+            x = cell % width
+            y = cell // width
+            ng = g[cell] + 1
+            for dx, dy in MOVES:
+                nx = x + dx
+                ny = y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    n = nx + ny * width
+                    if walkable[n] and (seen[n] != gen or ng < g[n]):
+                        seen[n] = gen
+                        g[n] = ng
+                        parent[n] = cell
+                        if manhattan:
+                            h = abs(nx - gx) + abs(ny - gy)
+                        else:
+                            h = max(abs(nx - gx), abs(ny - gy))
+                        heapq.heappush(heap, (ng + h, h, n))
+        self.expanded = expanded
+        return None
+
+    def prepare(self, size):
+        """Starts a new generation, making room for size cells."""
+        if size != self.size or self.generation >= 0xFFFFFFFF:
+            self.size = size
+            self.generation = 0
+            self.g = array('i', [0]) * size
+            self.parent = array('i', [0]) * size
+            self.seen = array('I', [0]) * size
+            self.closed = array('I', [0]) * size
+        self.generation += 1
+
+class JumpPointSearch(GridAStar):
+    """
+    Jump Point Search: A* that only expands the cells where a shortest
+    path may turn, skipping the many equivalent ones in open areas.
+
+    Moves are 8-connected, cost 1, and may cut corners (as in the game, a
+    diagonal move only needs its target cell to be free). Same interface
+    as GridAStar; the returned path lists every cell, not just the jump
+    points, and has the same length as the one found by GridAStar.
+
+    The search runs on a copy of the grid with a border of blocked cells,
+    so that looking at a neighbor is a single index lookup.
+    """
+
+    def find_path(self, width, height, walkable, start, goal):
+        """
+        Find a shortest path between two cells.
+
+        Args:
+            width, height: size of the grid
+            walkable: mask with 1 for the cells the path may go through;
+                the start cell does not need to be walkable
+            start, goal: cell indices
+
+        Returns:
+            The list of cell indices from start to goal, both included, or
+            None if the goal cannot be reached
+        """
+        # Cell (x, y) is at (x + 1) + (y + 1) * stride in the padded grid
+        stride = width + 2
+        free = bytearray(stride * (height + 2))
+        for y in range(height):
+            row = (y + 1) * stride + 1
+            free[row:row + width] = walkable[y * width:(y + 1) * width]
+        self.prepare(len(free))
+        gen = self.generation
+        g = self.g
+        parent = self.parent
+        seen = self.seen
+        closed = self.closed
+        start = self.padded(start, width)
+        goal = self.padded(goal, width)
+        (gy, gx) = divmod(goal, stride)
+
+        def jump_straight(i, d, side):
+            # Walk along d until the goal, a blocked cell or a cell with a
+            # forced neighbor; side is the offset to the cells on each side
+            while free[i]:
+                if i == goal:
+                    return i
+                if ((free[i + d + side] and not free[i + side]) or
+                    (free[i + d - side] and not free[i - side])):
+                    return i
+                i += d
+            return -1
+
+        def jump_diagonal(i, dx, dy):
+            # Also stop where a straight jump from the cell finds something
+            d = dx + dy
+            while free[i]:
+                if i == goal:
+                    return i
+                if ((free[i - dx + dy] and not free[i - dx]) or
+                    (free[i + dx - dy] and not free[i - dy])):
+                    return i
+                if jump_straight(i + dx, dx, stride) >= 0 or jump_straight(i + dy, dy, 1) >= 0:
+                    return i
+                i += d
+            return -1
+
+        seen[start] = gen
+        g[start] = 0
+        parent[start] = -1
+        (y, x) = divmod(start, stride)
+        h = max(abs(x - gx), abs(y - gy))
+        heap = [(h, h, start)]
+        expanded = 0
+        while heap:
+            f, h, cell = heapq.heappop(heap)
+            if cell == goal:
+                self.expanded = expanded
+                return self.unfold(cell, width)
+            if closed[cell] == gen:
+                continue
+            closed[cell] = gen
+            expanded += 1
+            (y, x) = divmod(cell, stride)
+            for dx, dy in self.directions(free, cell, parent[cell], stride):
+                if dx and dy:
+                    n = jump_diagonal(cell + dx + dy, dx, dy)
+                elif dx:
+                    n = jump_straight(cell + dx, dx, stride)
+                else:
+                    n = jump_straight(cell + dy, dy, 1)
+                if n < 0 or closed[n] == gen:
+                    continue
+                (ny, nx) = divmod(n, stride)
+                ng = g[cell] + max(abs(nx - x), abs(ny - y))
+                if seen[n] != gen or ng < g[n]:
+                    seen[n] = gen
+                    g[n] = ng
+                    parent[n] = cell
+                    h = max(abs(nx - gx), abs(ny - gy))
+                    heapq.heappush(heap, (ng + h, h, n))
+        self.expanded = expanded
+        return None
+
+    def padded(self, cell, width):
+        """Index in the padded grid of a cell index."""
+        (y, x) = divmod(cell, width)
+        return (x + 1) + (y + 1) * (width + 2)
+
+    def directions(self, free, cell, p, stride):
+        """
+        Directions worth jumping to from a cell reached from cell p, as
+        offsets (dx, dy) in the padded grid.
+        """
+        if p < 0:
+            return [(dx, dy * stride) for dx, dy in MOVES]
+        (py, px) = divmod(p, stride)
+        (y, x) = divmod(cell, stride)
+        dx = (x > px) - (x < px)
+        dy = ((y > py) - (y < py)) * stride
+        if dx and dy:
+            # Natural neighbors, then the forced ones around blocked cells
+            dirs = [(0, dy), (dx, 0), (dx, dy)]
+            if not free[cell - dx]:
+                dirs.append((-dx, dy))
+            if not free[cell - dy]:
+                dirs.append((dx, -dy))
+        elif dx:
+            dirs = [(dx, 0)]
+            if not free[cell + stride]:
+                dirs.append((dx, stride))
+            if not free[cell - stride]:
+                dirs.append((dx, -stride))
+        else:
+            dirs = [(0, dy)]
+            if not free[cell + 1]:
+                dirs.append((1, dy))
+            if not free[cell - 1]:
+                dirs.append((-1, dy))
+        return dirs
+
+    def unfold(self, cell, width):
+        """
+        Path from the start to a cell, with the cells between jump points,
+        as cell indices of the unpadded grid.
+        """
+        stride = width + 2
+        path = []
+        while cell >= 0:
+            p = self.parent[cell]
+            (y, x) = divmod(cell, stride)
+            path.append((x - 1) + (y - 1) * width)
+            if p >= 0:
+                # Jump points are joined by straight or diagonal lines
+                (py, px) = divmod(p, stride)
+                dx = (px > x) - (px < x)
+                dy = (py > y) - (py < y)
+                while (x, y) != (px - dx, py - dy):
+                    x += dx
+                    y += dy
+                    path.append((x - 1) + (y - 1) * width)
+            cell = p
+        path.reverse()
+        return path
+
+# Path finders by name
+PATHFINDERS = {"astar": GridAStar, "jps": JumpPointSearch, "dstar": DStarLite,
+               "hpa": HierarchicalAStar}
+
+def pathfinder(name):
+    """A new path finder of the given kind: "astar", "jps", "dstar" or "hpa"."""
+    if name not in PATHFINDERS:
+        raise ValueError("Unknown path finder: " + str(name))
+    return PATHFINDERS[name]()
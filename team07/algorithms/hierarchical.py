@@ -0,0 +1,498 @@
+"""
+Hierarchical path finder (HPA*) for Bomberman search algorithms
+"""
+import heapq
+import maps
+from .dstar_lite import blocked_cells, changed_cells
+
+# The 8 moves, as (dx, dy)
+MOVES = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Ids of the start and the goal in the abstract graph, cells being >= 0
+START = -1
+GOAL = -2
+
+# Entrances with at least this many crossings get a transition at each end
+LONG_ENTRANCE = 6
+
+class HierarchicalAStar:
+    """
+    HPA* (Botea, Mueller and Schaeffer, 2004): the map is split into square
+    clusters, and A* runs on an abstract graph whose nodes are the cells
+    where a path can go from one cluster to the next. The abstract path is
+    then refined into cells with a search inside each cluster it crosses.
+
+    The abstract graph is kept from one call to the next and built lazily,
+    a cluster at a time, when the search first gets there. A changed cell,
+    such as a wall destroyed by a bomb, only drops its own cluster and, on
+    the edge of a cluster, the borders it touches and the clusters beyond
+    them.
+
+    Same interface as GridAStar, where each call compares the walkable mask
+    with the previous one. find_world_path() instead reads the world: it
+    finds the changed cells from the walls destroyed since the last map
+    version seen and from the cells of the entities, and only looks at the
+    walls of a cluster when the search first gets there, so its cost does
+    not grow with the size of the map.
+
+    The paths found are close to the shortest ones, not always the
+    shortest: a path goes through the cells chosen for each entrance
+    between clusters.
+    """
+
+    def __init__(self, cluster=10):
+        """
+        Args:
+            cluster: width and height of a cluster, in cells
+        """
+        self.cluster = cluster
+        self.width = 0
+        self.height = 0
+        self.walkable = None
+        # Clusters whose cells are set in self.walkable, None for all of
+        # them (see ensure_cells())
+        self.built = None
+        # With find_world_path(): the world being searched, the map version
+        # and the blocked cells of the last call
+        self.world = None
+        self.version = None
+        self.blocked = set()
+        # Abstract nodes expanded during the last call
+        self.expanded = 0
+
+    def find_path(self, width, height, walkable, start, goal):
+        """
+        Find a path between two cells.
+
+        Args:
+            width, height: size of the grid
+            walkable: mask with 1 for the cells the path may go through;
+                the start cell does not need to be walkable
+            start, goal: cell indices
+
+        Returns:
+            The list of cell indices from start to goal, both included, or
+            None if the goal cannot be reached
+        """
+        previous = self.walkable
+        if (width, height) != (self.width, self.height) or self.version is not None:
+            self.reset(width, height)
+            self.walkable = bytearray(walkable)
+        elif previous != walkable:
+            self.walkable = bytearray(walkable)
+            for cell in changed_cells(previous, walkable):
+                self.invalidate(cell)
+        return self.plan(start, goal)
+
+    def find_world_path(self, wrld, start, goal, margin=0):
+        """
+        Find a path between two cells of a world, through the cells without
+        a wall that are not in blocked_cells(wrld, margin).
+
+        Args:
+            wrld: the world
+            start, goal: cell indices; the start cell does not need to be
+                walkable
+            margin: see blocked_cells()
+
+        Returns:
+            The list of cell indices from start to goal, both included, or
+            None if the goal cannot be reached
+        """
+        width = wrld.width()
+        height = wrld.height()
+        blocked = blocked_cells(wrld, margin)
+        walls = None
+        if (width, height) == (self.width, self.height) and self.version is not None:
+            # Walls destroyed since the last call, if the map derives from
+            # the one seen then
+            walls = maps.find_ancestor(wrld.map_version, lambda v: v == self.version)[1]
+        if walls is None:
+            self.reset(width, height)
+            self.walkable = bytearray(width * height)
+            self.built = set()
+            self.world = wrld
+            self.blocked = blocked
+        else:
+            self.world = wrld
+            changed = self.blocked ^ blocked
+            changed.update(x + y * width for (x, y) in walls)
+            self.blocked = blocked
+            # Only the clusters already built know their cells
+            walkable = self.walkable
+            updated = []
+            for cell in changed:
+                if self.cluster_of(cell) in self.built:
+                    free = self.free(cell)
+                    if free != walkable[cell]:
+                        walkable[cell] = free
+                        updated.append(cell)
+            for cell in updated:
+                self.invalidate(cell)
+        self.version = wrld.map_version
+        return self.plan(start, goal)
+
+    def plan(self, start, goal):
+        """find_path() once self.walkable is up to date."""
+        width = self.width
+        height = self.height
+        walkable = self.walkable
+        self.expanded = 0
+        if start == goal:
+            return [start]
+        self.ensure_cells(self.cluster_of(goal))
+        if not walkable[goal]:
+            return None
+        # Link the start and the goal to the nodes of their clusters
+        gc = self.cluster_of(goal)
+        self.ensure(gc)
+        dist = self.search(goal, gc)[0]
+        arrive = {n: dist[n] for n in self.nodes[gc] if n in dist}
+        links = {START: self.links(start, goal)}
+        # The start may not be walkable, and then is part of no crossing:
+        # its neighbors in other clusters are linked to the nodes there
+        (y, x) = divmod(start, width)
+        for dx, dy in MOVES:
+            nx = x + dx
+            ny = y + dy
+            if 0 <= nx < width and 0 <= ny < height:
+                n = nx + ny * width
+                self.ensure_cells(self.cluster_of(n))
+                if walkable[n] and self.cluster_of(n) != self.cluster_of(start):
+                    links[START].append((n, 1))
+                    links[n] = self.links(n, goal)
+        route = self.abstract_path(start, goal, links, arrive)
+        if route is None:
+            return None
+        # Refine the abstract path, one cluster at a time, reusing the
+        # searches made from the nodes to find their intra edges
+        path = [start]
+        for i in range(1, len(route)):
+            a = path[-1]
+            b = goal if route[i] == GOAL else route[i]
+            c = self.cluster_of(a)
+            if c != self.cluster_of(b):
+                path.append(b)
+            elif a in self.tree and b in self.tree[a]:
+                path += self.unwind(self.tree[a], a, b)
+            else:
+                path += self.unwind(self.search(a, c, b)[1], a, b)
+        return path
+
+    def reset(self, width, height):
+        """Drops the abstract graph, for a map of a new size or unrelated
+        to the last one."""
+        self.width = width
+        self.height = height
+        self.built = None
+        self.world = None
+        self.version = None
+        self.blocked = set()
+        # Border -> (a, b) cell pairs chosen to cross it, see borders()
+        self.pairs = {}
+        # Node -> cells of other clusters it leads to
+        self.inter = {}
+        # Cluster -> its nodes, for the clusters whose borders are known
+        self.nodes = {}
+        # Node -> {node of the same cluster: steps}, for the nodes the
+        # search has expanded since their cluster last changed
+        self.intra = {}
+        # Node -> {cell: previous cell} on the ways from it in its cluster
+        self.tree = {}
+
+    def invalidate(self, cell):
+        """
+        Drops the parts of the abstract graph that depend on a cell whose
+        walkability changed, self.walkable being already up to date.
+        """
+        size = self.cluster
+        (y, x) = divmod(cell, self.width)
+        c = (x // size, y // size)
+        self.forget(c)
+        if x % size in (0, size - 1) or y % size in (0, size - 1):
+            # The clusters beyond a border only change if its crossings do
+            for key in self.borders(c):
+                if key in self.pairs:
+                    pairs = self.crossings(key)
+                    if pairs != self.pairs[key]:
+                        self.link(key, pairs)
+                        for side in self.sides(key):
+                            self.forget(side)
+
+    ###################
+    # Private methods #
+    ###################
+
+    def cluster_of(self, cell):
+        """(cx, cy) of the cluster of a cell."""
+        (y, x) = divmod(cell, self.width)
+        return (x // self.cluster, y // self.cluster)
+
+    def borders(self, c):
+        """
+        Keys of the 8 borders of a cluster: ("h", cx, cy) is between
+        clusters (cx, cy) and (cx + 1, cy), ("v", cx, cy) between (cx, cy)
+        and (cx, cy + 1), and the corners ("d", cx, cy) between (cx, cy)
+        and (cx + 1, cy + 1) and ("a", cx, cy) between (cx + 1, cy) and
+        (cx, cy + 1).
+        """
+        (cx, cy) = c
+        return [("h", cx, cy), ("h", cx - 1, cy), ("v", cx, cy), ("v", cx, cy - 1),
+                ("d", cx, cy), ("d", cx - 1, cy - 1), ("a", cx - 1, cy), ("a", cx, cy - 1)]
+
+    def sides(self, key):
+        """The two clusters on each side of a border."""
+        (kind, cx, cy) = key
+        if kind == "h":
+            return [(cx, cy), (cx + 1, cy)]
+        if kind == "v":
+            return [(cx, cy), (cx, cy + 1)]
+        if kind == "d":
+            return [(cx, cy), (cx + 1, cy + 1)]
+        return [(cx + 1, cy), (cx, cy + 1)]
+
+    def forget(self, c):
+        """Drops the nodes and intra edges of a cluster."""
+        for n in self.nodes.pop(c, ()):
+            self.intra.pop(n, None)
+            self.tree.pop(n, None)
+
+    def ensure_cells(self, c):
+        """Sets the cells of a cluster in self.walkable, from the world of
+        find_world_path(), the first time they are needed."""
+        if self.built is None or c in self.built:
+            return
+        self.built.add(c)
+        size = self.cluster
+        width = self.width
+        walkable = self.walkable
+        for y in range(c[1] * size, min((c[1] + 1) * size, self.height)):
+            for x in range(c[0] * size, min((c[0] + 1) * size, width)):
+                walkable[x + y * width] = self.free(x + y * width)
+
+    def free(self, cell):
+        """1 if a cell of the world of find_world_path() is walkable, else 0."""
+        (y, x) = divmod(cell, self.width)
+        if cell in self.blocked or self.world.wall_at(x, y):
+            return 0
+        return 1
+
+    def ensure(self, c):
+        """Finds the nodes of a cluster."""
+        if c in self.nodes:
+            return
+        nodes = set()
+        for key in self.borders(c):
+            pairs = self.pairs.get(key)
+            if pairs is None:
+                pairs = self.crossings(key)
+                self.link(key, pairs)
+            for a, b in pairs:
+                nodes.add(a if self.cluster_of(a) == c else b)
+        self.nodes[c] = sorted(nodes)
+
+    def link(self, key, pairs):
+        """Sets the crossings of a border and the inter edges they make."""
+        for a, b in self.pairs.get(key, ()):
+            for (u, v) in ((a, b), (b, a)):
+                self.inter[u].discard(v)
+                if not self.inter[u]:
+                    del self.inter[u]
+        self.pairs[key] = pairs
+        for a, b in pairs:
+            self.inter.setdefault(a, set()).add(b)
+            self.inter.setdefault(b, set()).add(a)
+
+    def edges(self, n):
+        """{node: steps} for the other nodes reached from a node in its cluster."""
+        intra = self.intra.get(n)
+        if intra is None:
+            c = self.cluster_of(n)
+            self.ensure(c)
+            (dist, self.tree[n]) = self.search(n, c)
+            intra = self.intra[n] = {m: dist[m] for m in self.nodes[c] if m != n and m in dist}
+        return intra
+
+    def crossings(self, key):
+        """
+        Pairs of walkable cells (a, b), a step apart, chosen to cross a
+        border: one or two for each entrance, that is each group of
+        crossings whose cells are next to each other on both sides.
+        """
+        (kind, cx, cy) = key
+        size = self.cluster
+        width = self.width
+        height = self.height
+        walkable = self.walkable
+        x = (cx + 1) * size - 1
+        y = (cy + 1) * size - 1
+        if cx < 0 or cy < 0:
+            return []
+        for c in self.sides(key):
+            self.ensure_cells(c)
+        if kind in ("d", "a"):
+            # A single crossing, between the cells on each side of a corner
+            if x + 1 >= width or y + 1 >= height:
+                return []
+            if kind == "d":
+                (a, b) = (x + y * width, x + 1 + (y + 1) * width)
+            else:
+                (a, b) = (x + 1 + y * width, x + (y + 1) * width)
+            if walkable[a] and walkable[b]:
+                return [(a, b)]
+            return []
+        # Cells along the border: lo..hi on the line between the clusters,
+        # the first cluster on one side and the second on the other
+        if kind == "h":
+            if x + 1 >= width or cy * size >= height:
+                return []
+            (lo, hi) = (cy * size, min((cy + 1) * size, height))
+            cell = lambda side, i: x + side + i * width
+        else:
+            if y + 1 >= height or cx * size >= width:
+                return []
+            (lo, hi) = (cx * size, min((cx + 1) * size, width))
+            cell = lambda side, i: i + (y + side) * width
+        found = [(i, j) for i in range(lo, hi) if walkable[cell(0, i)]
+                 for j in (i - 1, i, i + 1) if lo <= j < hi and walkable[cell(1, j)]]
+        # Group the crossings whose cells are neighbors on both sides
+        index = {p: k for k, p in enumerate(found)}
+        root = list(range(len(found)))
+
+        def find(k):
+            while root[k] != k:
+                root[k] = root[root[k]]
+                k = root[k]
+            return k
+
+        for k, (i, j) in enumerate(found):
+            for p in ((i - 1, j - 1), (i - 1, j), (i - 1, j + 1), (i, j - 1)):
+                if p in index:
+                    root[find(k)] = find(index[p])
+        groups = {}
+        for k, p in enumerate(found):
+            groups.setdefault(find(k), []).append(p)
+        entrances = groups.values()
+        pairs = []
+        for entrance in entrances:
+            if len(entrance) < LONG_ENTRANCE:
+                chosen = [entrance[len(entrance) // 2]]
+            else:
+                chosen = [entrance[0], entrance[-1]]
+            pairs += [(cell(0, i), cell(1, j)) for i, j in chosen]
+        return pairs
+
+    def links(self, cell, goal):
+        """
+        Edges from a cell that is not a node to the nodes of its cluster,
+        and to the goal if it is in the same cluster, as (node, steps).
+        """
+        c = self.cluster_of(cell)
+        self.ensure(c)
+        dist = self.search(cell, c)[0]
+        edges = [(n, dist[n]) for n in self.nodes[c] if n in dist]
+        if goal in dist:
+            edges.append((GOAL, dist[goal]))
+        return edges
+
+    def search(self, src, c, dst=None):
+        """
+        Breadth-first search from a cell, inside a cluster.
+
+        Args:
+            src: the cell to start from, which does not need to be walkable
+            c: the cluster
+            dst: if given, the search stops there
+
+        Returns:
+            ({cell: steps}, {cell: previous cell}) for the cells reached
+        """
+        self.ensure_cells(c)
+        size = self.cluster
+        width = self.width
+        walkable = self.walkable
+        x0 = c[0] * size
+        y0 = c[1] * size
+        x1 = min(x0 + size, width)
+        y1 = min(y0 + size, self.height)
+        dist = {src: 0}
+        parent = {src: None}
+        frontier = [src]
+        d = 0
+        while frontier and dst not in dist:
+            d += 1
+            reached = []
+            for cell in frontier:
+                (y, x) = divmod(cell, width)
+                for dx, dy in MOVES:
+                    nx = x + dx
+                    ny = y + dy
+                    if x0 <= nx < x1 and y0 <= ny < y1:
+                        n = nx + ny * width
+                        if walkable[n] and n not in dist:
+                            dist[n] = d
+                            parent[n] = cell
+                            reached.append(n)
+            frontier = reached
+        return (dist, parent)
+
+    def unwind(self, parent, a, b):
+        """Cells after a up to b, following the parents found by search()."""
+        path = []
+        while b != a:
+            path.append(b)
+            b = parent[b]
+        path.reverse()
+        return path
+
+    def abstract_path(self, start, goal, links, arrive):
+        """
+        A* on the abstract graph.
+
+        Args:
+            start, goal: cells of the start and the goal
+            links: {START or cell: [(node, steps)]}, edges added to the
+                graph for this search, see links()
+            arrive: {node: steps} for the nodes the goal can be reached from
+
+        Returns:
+            The list of abstract nodes from START to GOAL, or None
+        """
+        width = self.width
+        (gy, gx) = divmod(goal, width)
+
+        def h(cell):
+            (y, x) = divmod(cell, width)
+            return max(abs(x - gx), abs(y - gy))
+
+        g = {START: 0}
+        parent = {START: None}
+        closed = set()
+        heap = [(h(start), h(start), START)]
+        while heap:
+            (f, _, u) = heapq.heappop(heap)
+            if u == GOAL:
+                route = []
+                while u is not None:
+                    route.append(u)
+                    u = parent[u]
+                route.reverse()
+                return route
+            if u in closed:
+                continue
+            closed.add(u)
+            self.expanded += 1
+            edges = list(links.get(u, ()))
+            if u in self.inter:
+                edges += self.edges(u).items()
+                edges += [(v, 1) for v in self.inter[u]]
+            if u in arrive:
+                edges.append((GOAL, arrive[u]))
+            for v, cost in edges:
+                ng = g[u] + cost
+                if v not in closed and (v not in g or ng < g[v]):
+                    g[v] = ng
+                    parent[v] = u
+                    hv = 0 if v == GOAL else h(v)
+                    heapq.heappush(heap, (ng + hv, hv, v))
+        return None
@@ -2,28 +2,13 @@
 Hybrid A* + Minimax algorithm for Bomberman AI
 Combines A* pathfinding with Minimax for adversarial scenarios
 """
-import heapq
 import math
 import random
-
-class Node:
-    """Node for A* pathfinding"""
-    def __init__(self, x, y, g_cost, h_cost, parent=None):
-        self.x = x
-        self.y = y
-        self.g_cost = g_cost
-        self.h_cost = h_cost
-        self.f_cost = g_cost + h_cost
-        self.parent = parent
-    
-    def __lt__(self, other):
-        return self.f_cost < other.f_cost
-    
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-    
-    def __hash__(self):
-        return hash((self.x, self.y))
+from .threat import MonsterThreatField
+from .grid_astar import pathfinder, walkable_cells
+from .dstar_lite import DStarLite
+from .hierarchical import HierarchicalAStar
+from .deadline import Deadline, iterative_deepening
 
 class HybridAStarMinimax:
     """
@@ -31,8 +16,35 @@ class HybridAStarMinimax:
     Uses A* for general pathfinding and Minimax for multi-monster scenarios.
     """
     
-    def __init__(self):
-        pass
+    def __init__(self, search="astar", search_depth=3, time_budget=None):
+        """
+        Args:
+            search: path finder used by find_path, "astar", "jps", "dstar"
+                or "hpa" (Jump Point Search, faster on large open maps,
+                D* Lite, which repairs its last search instead of starting
+                over, or HPA*, which plans on clusters of cells for very
+                large maps), or "flow" to follow the exit flow field of the
+                world, computed once per step for all the characters
+            search_depth: depth of minimax_escape_route, or of its deepest
+                iteration when time_budget is set
+            time_budget: if set, seconds per minimax_escape_route: the
+                search deepens one ply at a time and plays the best move of
+                the deepest iteration completed in time (see safest_move()
+                if none did)
+        """
+        # Monster threat field of the last world seen, see threat_field()
+        self.threat = None
+        self.threat_world = None
+        self.threat_hash = None
+        # Path finder, reused by every search; its expanded attribute is
+        # the number of nodes expanded by the last one. None for "flow"
+        self.pathfinder = None if search == "flow" else pathfinder(search)
+        self.search_depth = search_depth
+        self.time_budget = time_budget
+        self.deadline = Deadline()
+        # Depth of the last minimax search, or of its deepest completed
+        # iteration
+        self.depth_reached = 0
     
     def get_action(self, wrld, character):
         """
@@ -73,7 +85,15 @@ class HybridAStarMinimax:
         # No path found or already at goal
         return (0, 0)
     
-    def is_valid_position(self, wrld, x, y, monsters=None):
+    def threat_field(self, wrld):
+        """Monster threat field of the world, computed once per world state."""
+        if self.threat_world is not wrld or self.threat_hash != wrld.zhash:
+            self.threat = MonsterThreatField(wrld)
+            self.threat_world = wrld
+            self.threat_hash = wrld.zhash
+        return self.threat
+    
+    def is_valid_position(self, wrld, x, y, threat=None, avoid_monsters=True):
         """Check if position is valid and walkable."""
         # Check bounds
         if x < 0 or x >= wrld.width() or y < 0 or y >= wrld.height():
@@ -84,7 +104,7 @@ class HybridAStarMinimax:
             return False
         
         # Check if position is too close to any monster
-        if self.is_too_close_to_monster(wrld, x, y, monsters):
+        if avoid_monsters and self.is_too_close_to_monster(wrld, x, y, threat):
             return False
         
         return True
@@ -92,28 +112,19 @@ class HybridAStarMinimax:
     def get_all_monsters(self, wrld):
         """Get all monster positions in the world."""
         monsters = []
-        for x in range(wrld.width()):
-            for y in range(wrld.height()):
-                monster_list = wrld.monsters_at(x, y)
-                if monster_list:
-                    for monster in monster_list:
-                        # Get detection range, default to 2 if not available
-                        detection_range = getattr(monster, 'rnge', 2)
-                        monsters.append((x, y, detection_range))
+        for monster in wrld.iter_monsters():
+            # Get detection range, default to 2 if not available
+            detection_range = getattr(monster, 'rnge', 2)
+            monsters.append((monster.x, monster.y, detection_range))
         return monsters
     
-    def is_too_close_to_monster(self, wrld, x, y, monsters=None):
+    def is_too_close_to_monster(self, wrld, x, y, threat=None):
         """Check if position is too close to any monster."""
-        if monsters is None:
-            monsters = self.get_all_monsters(wrld)
-        for monster_x, monster_y, detection_range in monsters:
-            # Calculate distance to monster
-            distance = max(abs(x - monster_x), abs(y - monster_y))
-            # Only avoid if very close (within 1 cell of detection range)
-            # This allows getting closer but not too close
-            if distance <= 1:
-                return True
-        return False
+        if threat is None:
+            threat = self.threat_field(wrld)
+        # Only avoid if very close (a monster can get there in one step)
+        # This allows getting closer but not too close
+        return threat.within(x, y, 1)
     
     def is_monster_close(self, wrld, character):
         """Check if any monster is close to character (within detection range)."""
@@ -140,23 +151,17 @@ class HybridAStarMinimax:
     
     def find_escape_route(self, wrld, character):
         """Find the best escape route when monster is close using multi-step planning."""
-        monsters = self.get_all_monsters(wrld)
-        if not monsters:
+        threat = self.threat_field(wrld)
+        if not threat.monsters:
             return (0, 0)
         
-        # Find the closest monster
-        closest_monster = None
-        closest_distance = float('inf')
-        for monster_x, monster_y, detection_range in monsters:
-            distance = max(abs(character.x - monster_x), abs(character.y - monster_y))
-            if distance < closest_distance:
-                closest_distance = distance
-                closest_monster = (monster_x, monster_y)
-        
+        # Find the closest monster, in steps around the walls
+        closest_monster = threat.nearest_monster(character.x, character.y)
         if not closest_monster:
-            return (0, 0)
+            # No monster can reach us: run from the one closest in a straight line
+            closest_monster = min(threat.monsters, key=lambda m: max(abs(character.x - m[0]), abs(character.y - m[1])))
         
-        monster_x, monster_y = closest_monster
+        monster_x, monster_y, monster = closest_monster
         
         # Multi-step escape planning: evaluate each direction by looking 2-3 steps ahead
         best_direction = (0, 0)
@@ -167,9 +172,9 @@ class HybridAStarMinimax:
             new_y = character.y + dy
             
             # For escape mode, use a more permissive validity check
-            if self.is_escape_valid_position(wrld, new_x, new_y, monsters, monster_x, monster_y):
+            if self.is_escape_valid_position(wrld, new_x, new_y, threat, monster_x, monster_y):
                 # Evaluate this direction by looking ahead 2-3 steps
-                score = self.evaluate_escape_direction(wrld, new_x, new_y, monster_x, monster_y, monsters, steps=3)
+                score = self.evaluate_escape_direction(wrld, new_x, new_y, monster_x, monster_y, threat, steps=3)
                 
                 if score > best_score:
                     best_score = score
@@ -183,13 +188,13 @@ class HybridAStarMinimax:
         for dx, dy in self.get_neighbors():
             new_x = character.x + dx
             new_y = character.y + dy
-            if self.is_escape_valid_position(wrld, new_x, new_y, monsters, monster_x, monster_y):
+            if self.is_escape_valid_position(wrld, new_x, new_y, threat, monster_x, monster_y):
                 return (dx, dy)
         
         # If no escape route found, don't move
         return (0, 0)
     
-    def is_escape_valid_position(self, wrld, x, y, monsters, monster_x, monster_y):
+    def is_escape_valid_position(self, wrld, x, y, threat, monster_x, monster_y):
         """More permissive validity check for escape mode."""
         # Check boundaries
         if x < 0 or x >= wrld.width() or y < 0 or y >= wrld.height():
@@ -207,9 +212,9 @@ class HybridAStarMinimax:
             return True  # Allow adjacent positions in escape mode
         
         # For other positions, use normal monster avoidance
-        return not self.is_too_close_to_monster(wrld, x, y, monsters)
+        return not self.is_too_close_to_monster(wrld, x, y, threat)
     
-    def evaluate_escape_direction(self, wrld, start_x, start_y, monster_x, monster_y, monsters, steps=3):
+    def evaluate_escape_direction(self, wrld, start_x, start_y, monster_x, monster_y, threat, steps=3):
         """Evaluate an escape direction by looking multiple steps ahead."""
         score = 0
         current_x, current_y = start_x, start_y
@@ -222,7 +227,7 @@ class HybridAStarMinimax:
             score += distance_to_monster * (steps - step)  # Weight earlier steps more
             
             # Check if this position is valid
-            if not self.is_valid_position(wrld, current_x, current_y, monsters):
+            if not self.is_valid_position(wrld, current_x, current_y, threat):
                 # Penalty for invalid positions
                 score -= 10 * (steps - step)
                 break
@@ -241,7 +246,7 @@ class HybridAStarMinimax:
                 monster_x, monster_y = predicted_monster_x, predicted_monster_y
                 
                 # Find next best move from current position
-                best_next_move = self.find_best_next_escape_move(wrld, current_x, current_y, monster_x, monster_y, monsters)
+                best_next_move = self.find_best_next_escape_move(wrld, current_x, current_y, monster_x, monster_y, threat)
                 if best_next_move:
                     current_x += best_next_move[0]
                     current_y += best_next_move[1]
@@ -252,7 +257,7 @@ class HybridAStarMinimax:
         
         return score
     
-    def find_best_next_escape_move(self, wrld, x, y, monster_x, monster_y, monsters):
+    def find_best_next_escape_move(self, wrld, x, y, monster_x, monster_y, threat):
         """Find the best next move from a given position during escape planning."""
         best_direction = None
         best_distance = -1
@@ -261,7 +266,7 @@ class HybridAStarMinimax:
             new_x = x + dx
             new_y = y + dy
             
-            if self.is_valid_position(wrld, new_x, new_y, monsters):
+            if self.is_valid_position(wrld, new_x, new_y, threat):
                 distance = max(abs(new_x - monster_x), abs(new_y - monster_y))
                 if distance > best_distance:
                     best_distance = distance
@@ -281,37 +286,15 @@ class HybridAStarMinimax:
         dy = abs(pos1[1] - pos2[1])
         return max(dx, dy)
     
-    def add_to_open_set(self, open_set, node):
-        """Add a node to the open set (priority queue)."""
-        heapq.heappush(open_set, node)
-    
-    def get_best_node(self, open_set):
-        """Get the node with lowest f_cost from open set."""
-        if not open_set:
-            return None
-        return heapq.heappop(open_set)
-    
-    def reconstruct_path(self, goal_node):
-        """Reconstruct path from goal node back to start using parent pointers."""
-        path = []
-        current = goal_node
-        
-        # Trace back from goal to start
-        while current is not None:
-            path.append((current.x, current.y))
-            current = current.parent
-        
-        # Reverse to get path from start to goal
-        path.reverse()
-        return path
-    
     def find_path(self, wrld, character):
         """
         Find path from character position to exit using A*.
         Returns list of (x, y) coordinates representing the path.
         """
-        # Get monsters once to avoid repeated scanning
-        monsters = self.get_all_monsters(wrld)
+        # The flow field avoids the same cells as the threat field below,
+        # and one search from the exit serves every character of the step
+        if self.pathfinder is None:
+            return wrld.exit_flow(1).path(character.x, character.y)
         
         # Basic setup
         start = (character.x, character.y)
@@ -324,86 +307,105 @@ class HybridAStarMinimax:
             print("Already at goal!")
             return [start]
         
-        # Initialize open and closed sets
-        open_set = []           # Priority queue of nodes to explore
-        closed_set = set()      # Set of positions we've already explored
-        
-        # Create start node and add to open set
-        start_g_cost = 0  # Cost from start to start is 0
-        start_h_cost = self.heuristic(start, goal)  # Heuristic cost to goal
-        start_node = Node(start[0], start[1], start_g_cost, start_h_cost)
-        
-        # Add start node to open set
-        self.add_to_open_set(open_set, start_node)
+        # Search on flat cell indices
+        width = wrld.width()
+        if isinstance(self.pathfinder, (DStarLite, HierarchicalAStar)):
+            # Reads the cells it needs from the world, blocking those next
+            # to a monster as walkable_cells() does with the threat field
+            cells = self.pathfinder.find_world_path(wrld, start[0] + start[1] * width,
+                                                    goal[0] + goal[1] * width, 1)
+        else:
+            # Get the threat field once to avoid repeated scanning
+            threat = self.threat_field(wrld)
+            walkable = walkable_cells(wrld, threat)
+            cells = self.pathfinder.find_path(width, wrld.height(), walkable,
+                                              start[0] + start[1] * width,
+                                              goal[0] + goal[1] * width)
         
-        # Main A* search loop
-        while open_set:
-            # Get the best node (lowest f_cost)
-            current_node = self.get_best_node(open_set)
-            if not current_node:
-                break
-                
-            # Check if we reached the goal
-            if (current_node.x, current_node.y) == goal:
-                # Reconstruct path from goal to start
-                path = self.reconstruct_path(current_node)
-                print("A* Pathfinding: Path found!")
-                return path
-            
-            # Add current position to closed set
-            closed_set.add((current_node.x, current_node.y))
-            
-            # Explore neighbors
-            for dx, dy in self.get_neighbors():
-                neighbor_x = current_node.x + dx
-                neighbor_y = current_node.y + dy
-                neighbor_pos = (neighbor_x, neighbor_y)
-                
-                # Skip if not valid position
-                if not self.is_valid_position(wrld, neighbor_x, neighbor_y, monsters):
-                    continue
-                
-                # Skip if already explored
-                if neighbor_pos in closed_set:
-                    continue
-                
-                # Calculate costs for this neighbor
-                neighbor_g_cost = current_node.g_cost + 1  # Each move costs 1
-                neighbor_h_cost = self.heuristic(neighbor_pos, goal)
-                neighbor_node = Node(neighbor_x, neighbor_y, neighbor_g_cost, neighbor_h_cost, current_node)
-                
-                # Add to open set
-                self.add_to_open_set(open_set, neighbor_node)
-            
         # No path found
-        print("A* Pathfinding: No path found!")
-        return None
+        if cells is None:
+            print("A* Pathfinding: No path found!")
+            return None
+        
+        print("A* Pathfinding: Path found!")
+        return [(i % width, i // width) for i in cells]
 
     # Minimax related functions
-    def minimax_escape_route(self, wrld, character, depth=3):
-        """Use minimax to find best escape route considering monster responses."""
-        monsters = self.get_all_monsters(wrld)
+    def minimax_escape_route(self, wrld, character, depth=None):
+        """Use minimax to find best escape route considering monster responses.
+        With a time budget, counted from this call, deepens one ply at a
+        time up to depth (search_depth by default)."""
+        deadline = Deadline(self.time_budget)
+        if depth is None:
+            depth = self.search_depth
+        # A monster can get next to a free cell in one step whatever the
+        # walls, so the whole threat field is not needed here
+        monster_positions = [(monster.x, monster.y) for monster in wrld.iter_monsters()]
+        moves = []
+        for dx, dy in self.get_neighbors():
+            x = character.x + dx
+            y = character.y + dy
+            if (self.is_valid_position(wrld, x, y, avoid_monsters=False) and
+                all(max(abs(x - mx), abs(y - my)) > 1 for mx, my in monster_positions)):
+                moves.append((dx, dy))
+        
+        if self.time_budget is None:
+            self.deadline = deadline
+            best_move = self.minimax_root(wrld, character, moves, monster_positions, depth, None)
+            self.depth_reached = depth
+        else:
+            def search(d, deadline, hint):
+                self.deadline = deadline
+                return self.minimax_root(wrld, character, moves, monster_positions, d, hint)
+            best_move, self.depth_reached = iterative_deepening(search, depth, deadline)
+        
+        if best_move is None:
+            # Nothing searched in time, or no move out of the monsters'
+            # reach: get as far from them as possible
+            best_move = self.safest_move(wrld, character, monster_positions)
+        return best_move
+    
+    def safest_move(self, wrld, character, monster_positions):
+        """The move, staying put included, that ends the farthest from the
+        closest monster, then the closest to the exit."""
+        best_move = (0, 0)
+        best_score = None
+        for dx, dy in [(0, 0)] + self.get_neighbors():
+            x = character.x + dx
+            y = character.y + dy
+            if (dx, dy) != (0, 0) and not self.is_valid_position(wrld, x, y, avoid_monsters=False):
+                continue
+            distance = min((max(abs(x - mx), abs(y - my)) for mx, my in monster_positions),
+                           default=math.inf)
+            score = (distance, -self.heuristic((x, y), wrld.exitcell))
+            if best_score is None or score > best_score:
+                best_score = score
+                best_move = (dx, dy)
+        return best_move
+    
+    def minimax_root(self, wrld, character, moves, monster_positions, depth, hint):
+        """Best of the given moves at the given depth, hint searched first.
+        Ties go to the first of the given moves, whatever the order searched."""
+        order = {move: i for i, move in enumerate(moves)}
+        if hint in moves:
+            moves = [hint] + [m for m in moves if m != hint]
         best_move = None
         best_score = float('-inf')
         
-        for dx, dy in self.get_neighbors():
-            new_x = character.x + dx
-            new_y = character.y + dy
+        for dx, dy in moves:
+            new_pos = (character.x + dx, character.y + dy)
+            score = self.minimax(wrld, new_pos, monster_positions, depth, False)
             
-            if self.is_valid_position(wrld, new_x, new_y, monsters):
-                new_pos = (new_x, new_y)
-                monster_positions = [(mx, my) for mx, my, _ in monsters]
-                
-                score = self.minimax(wrld, new_pos, monster_positions, depth, False)
-                
-                if score > best_score:
-                    best_score = score
-                    best_move = (dx, dy)
+            if score > best_score or (score == best_score and best_move is not None
+                                      and order[(dx, dy)] < order[best_move]):
+                best_score = score
+                best_move = (dx, dy)
         
-        return best_move or (0, 0)
+        return best_move
     
     def minimax(self, wrld, character_pos, monster_positions, depth, is_maximizing):
         """Minimax algorithm for adversarial decision making."""
+        self.deadline.check()
         if depth == 0:
             return self.evaluate_position(wrld, character_pos, monster_positions)
         
@@ -415,7 +417,7 @@ class HybridAStarMinimax:
                 new_x = character_pos[0] + dx
                 new_y = character_pos[1] + dy
                 
-                if self.is_valid_position(wrld, new_x, new_y, []):
+                if self.is_valid_position(wrld, new_x, new_y, avoid_monsters=False):
                     new_pos = (new_x, new_y)
                     score = self.minimax(wrld, new_pos, monster_positions, depth - 1, False)
                     max_score = max(max_score, score)
@@ -491,7 +493,7 @@ class HybridAStarMinimax:
             new_x = char_x + dx
             new_y = char_y + dy
             
-            if self.is_valid_position(wrld, new_x, new_y, []):
+            if self.is_valid_position(wrld, new_x, new_y, avoid_monsters=False):
                 # Check if this direction leads away from monsters
                 distance_improvement = 0
                 for monster_x, monster_y in monster_positions:
@@ -0,0 +1,466 @@
+"""
+Monte Carlo Tree Search algorithm for Bomberman AI
+"""
+import math
+import multiprocessing
+import random
+import time
+import distance_field
+from events import Event
+from search_state import SearchState, successors
+from .base import BombermanAlgorithm
+from .deadline import Deadline
+
+# The 9 actions of the character, and the moves of a monster
+ACTIONS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+# Chance that a monster out of chase range keeps its direction, when it can
+KEEP_DIRECTION = 0.5
+
+# Chance that the greedy rollout policy steps toward the exit
+GREEDY = 0.8
+
+# Seconds before the deadline of a turn at which the worker processes
+# stop, so that their results are back by the deadline
+RESULT_MARGIN = 0.002
+
+def open_moves(state, x, y):
+    """The moves from (x, y) that do not run into a wall or off the map,
+    staying put included."""
+    rules = state.rules
+    moves = []
+    for (dx, dy) in ACTIONS:
+        nx = x + dx
+        ny = y + dy
+        if (0 <= nx < rules.width) and (0 <= ny < rules.height):
+            if ((dx, dy) == (0, 0)) or not state.walls[nx + ny * rules.width]:
+                moves.append((dx, dy))
+    return moves
+
+def random_policy(state, pos, actions, distance, rng):
+    """Rollout policy: any action."""
+    return rng.choice(actions)
+
+def greedy_policy(state, pos, actions, distance, rng):
+    """Rollout policy: mostly one of the actions closest to the exit, among
+    those that end out of reach of the monsters' next step, if there are
+    any."""
+    if rng.random() >= GREEDY:
+        return rng.choice(actions)
+    best = []
+    nearest = None
+    for (dx, dy) in actions:
+        x = pos[0] + dx
+        y = pos[1] + dy
+        d = distance(x, y)
+        if d is None:
+            continue
+        for (name, mx, my, mdx, mdy) in state.monsters:
+            if abs(mx - x) <= 2 and abs(my - y) <= 2:
+                # Worse than any cell away from monsters
+                d += state.rules.width * state.rules.height
+                break
+        if nearest is None or d < nearest:
+            nearest = d
+            best = [(dx, dy)]
+        elif d == nearest:
+            best.append((dx, dy))
+    return rng.choice(best or actions)
+
+# Rollout policies by name; a policy is called as
+# policy(state, pos, actions, distance, rng) and returns one of the actions,
+# with pos the position of the character and distance(x, y) its steps to
+# the exit (None if it cannot be reached)
+ROLLOUT_POLICIES = {
+    "random": random_policy,
+    "greedy": greedy_policy,
+}
+
+class Node:
+    """
+    A state of the search tree.
+    """
+
+    __slots__ = ("state", "value", "visits", "edges", "untried")
+
+    def __init__(self, state, value=None):
+        self.state = state
+        # Reward if the game is over for the character, None otherwise
+        self.value = value
+        self.visits = 0
+        # Action -> Edge, for the actions tried so far
+        self.edges = {}
+        self.untried = None
+
+class Edge:
+    """
+    An action from a node, with the states the monsters' replies led to.
+    """
+
+    __slots__ = ("visits", "total", "children")
+
+    def __init__(self):
+        self.visits = 0
+        self.total = 0.0
+        # SearchState -> Node
+        self.children = {}
+
+class MCTSAlgorithm(BombermanAlgorithm):
+    """
+    Monte Carlo Tree Search implementation.
+
+    UCT over the compact search state (see search_state.py): each iteration
+    walks down the tree picking actions by their upper confidence bound,
+    samples the moves of the monsters, adds one node and plays the game on
+    from there with the rollout policy, stepping with successors(). Rewards
+    are 1 for reaching the exit and 0 for dying, discounted by the steps
+    taken, so that the exit is reached sooner rather than later. A rollout
+    that runs out of steps is scored as if the character then walked the
+    shortest way to the exit.
+
+    Monsters are sampled, not assumed to play their worst: those within
+    chase_range step toward the character, the others keep their direction
+    or move at random. The outcomes of an action are widened progressively,
+    so that the tree still gets deeper when monsters have many moves.
+
+    The subtree of the action played is kept for the next turn when the
+    world turns out to be in one of its states. With processes > 1, worker
+    processes build their own trees from the same root and their visits of
+    the root actions are added to those of this process.
+    """
+
+    def __init__(self, iterations=500, time_budget=None, exploration=1.4, rollout_policy="greedy",
+                 rollout_depth=20, discount=0.95, chase_range=1, widening=1.0, processes=1,
+                 seed=None):
+        """
+        Args:
+            iterations: iterations per turn, over all the processes; None
+                for as many as time_budget allows
+            time_budget: if set, seconds per turn
+            exploration: UCT exploration constant
+            rollout_policy: "random", "greedy", or a policy as described
+                in ROLLOUT_POLICIES (a module-level function, so that it
+                can be sent to the worker processes)
+            rollout_depth: steps played by a rollout before its last state
+                is evaluated
+            discount: factor applied to rewards for each step taken
+            chase_range: monsters at most this many cells away from the
+                character, along both axes, step toward it
+            widening: an action keeps at most widening * sqrt(visits)
+                different outcomes, and samples among them once it has
+                that many
+            processes: number of processes running iterations, this one
+                included; the others are started on the first turn and
+                stopped by close(), at the end of a with block, or when
+                the algorithm is garbage collected
+            seed: seed of the random generator
+        """
+        super().__init__("MCTS")
+        if iterations is None and time_budget is None:
+            raise ValueError("MCTS needs iterations or a time budget")
+        if isinstance(rollout_policy, str) and rollout_policy not in ROLLOUT_POLICIES:
+            raise ValueError("Unknown rollout policy: " + str(rollout_policy))
+        # What the worker processes need to build the same search
+        self.params = {
+            "iterations": iterations,
+            "time_budget": time_budget,
+            "exploration": exploration,
+            "rollout_policy": rollout_policy,
+            "rollout_depth": rollout_depth,
+            "discount": discount,
+            "chase_range": chase_range,
+            "widening": widening,
+        }
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.exploration = exploration
+        self.policy = ROLLOUT_POLICIES.get(rollout_policy, rollout_policy)
+        self.rollout_depth = rollout_depth
+        self.discount = discount
+        self.chase_range = chase_range
+        self.widening = widening
+        self.processes = processes
+        self.pool = None
+        self.rng = random.Random(seed)
+        # Tree of the last turn, and the action played
+        self.root = None
+        self.action = None
+        # Exit distances of the map
+        self.field = None
+        # open_moves() by cell, for the walls of the last state seen; the
+        # walls only change when a bomb destroys one
+        self.walls = None
+        self.moves = {}
+        # Iterations run during the last turn by every process, and per
+        # second of that turn
+        self.rollouts = 0
+        self.rollouts_per_sec = 0.0
+        # Visits of the root kept from the previous turn
+        self.reused = 0
+
+    def get_action(self, wrld, character):
+        """
+        Get next action using Monte Carlo Tree Search.
+        """
+        if not wrld.exitcell:
+            return (0, 0)
+        return self.search(wrld, character) or (0, 0)
+
+    def search(self, wrld, character):
+        """
+        Search the best action of a character.
+
+        Returns:
+            The most visited (dx, dy) at the root, or None if the character
+            is not in the world
+        """
+        start = time.perf_counter()
+        # The time budget, if any, counts from here, in this process and in
+        # the workers
+        deadline = Deadline(self.time_budget)
+        state = SearchState.from_world(wrld, character)
+        if state.me() is None:
+            return None
+        self.field = distance_field.for_world(wrld)
+        root = self.reuse(state)
+        self.reused = root.visits
+
+        # Share the iterations between the processes; the workers start
+        # while this process runs its own
+        work = None
+        iterations = self.iterations
+        if self.processes > 1:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.processes - 1)
+            share = None
+            if iterations is not None:
+                share = iterations // self.processes
+                iterations -= share * (self.processes - 1)
+            end = None
+            if deadline.end is not None:
+                end = deadline.end - RESULT_MARGIN
+            jobs = [(self.params, state, self.field, share, end, self.rng.getrandbits(64))
+                    for _ in range(self.processes - 1)]
+            work = self.pool.map_async(run_worker, jobs)
+        self.rollouts = self.run(root, iterations, deadline)
+
+        # Most visited action over all the trees; results that are not
+        # back in time are left out of this turn
+        visits = {action: edge.visits for action, edge in root.edges.items()}
+        if work is not None:
+            try:
+                results = work.get(deadline.remaining())
+            except multiprocessing.TimeoutError:
+                results = []
+            for (stats, rollouts) in results:
+                self.rollouts += rollouts
+                for action, n in stats.items():
+                    visits[action] = visits.get(action, 0) + n
+        elapsed = time.perf_counter() - start
+        self.rollouts_per_sec = self.rollouts / elapsed if elapsed > 0 else 0.0
+        if not visits:
+            return None
+        self.root = root
+        self.action = max(visits, key=lambda a: (visits[a], a))
+        return self.action
+
+    def close(self):
+        """Stop the worker processes."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # Games drop their characters without closing them
+        if getattr(self, "pool", None) is not None:
+            self.close()
+
+    ###################
+    # Private methods #
+    ###################
+
+    def reuse(self, state):
+        """The node of the last tree for this state, after the action
+        played, or a new root."""
+        if self.root is not None:
+            edge = self.root.edges.get(self.action)
+            if edge is not None:
+                node = edge.children.get(state)
+                if node is not None and node.value is None:
+                    return node
+        return Node(state)
+
+    def run(self, root, iterations, deadline):
+        """Runs iterations until there are enough or the deadline passed,
+        returns how many ran."""
+        count = 0
+        while (iterations is None or count < iterations) and not deadline.expired():
+            self.iterate(root)
+            count += 1
+        return count
+
+    def iterate(self, root):
+        """Selection, expansion, rollout and backpropagation, once."""
+        node = root
+        path = []
+        while True:
+            if node.value is not None:
+                reward = node.value
+                break
+            if node.state.time <= 0:
+                reward = self.evaluate(node.state)
+                break
+            pos = node.state.me()
+            if node.untried is None:
+                node.untried = list(self.moves_at(node.state, pos[0], pos[1]))
+                self.rng.shuffle(node.untried)
+            if node.untried:
+                action = node.untried.pop()
+                edge = node.edges[action] = Edge()
+            else:
+                (action, edge) = self.select(node)
+            path.append((node, edge))
+            (child, new) = self.step(node.state, pos, action, edge)
+            if new:
+                if child.value is not None:
+                    reward = child.value
+                else:
+                    (reward, steps) = self.rollout(child.state)
+                    reward *= self.discount ** steps
+                break
+            node = child
+        # Each edge gets the reward discounted by its own distance to the
+        # end of the path, so that the totals of a node do not depend on
+        # its depth, nor on which root it was searched from
+        for (node, edge) in reversed(path):
+            reward *= self.discount
+            node.visits += 1
+            edge.visits += 1
+            edge.total += reward
+
+    def select(self, node):
+        """The (action, edge) with the highest upper confidence bound."""
+        c = self.exploration * math.sqrt(math.log(node.visits))
+        best = None
+        for action, edge in node.edges.items():
+            u = edge.total / edge.visits + c / math.sqrt(edge.visits)
+            if best is None or u > best[0]:
+                best = (u, action, edge)
+        return best[1:]
+
+    def step(self, state, pos, action, edge):
+        """
+        Sample the monsters' replies to an action.
+
+        Returns:
+            (child node, True if it was just added)
+        """
+        children = edge.children
+        if children and len(children) >= self.widening * math.sqrt(edge.visits + 1):
+            # Enough outcomes: pick one of them as often as it was reached
+            nodes = list(children.values())
+            weights = [n.visits + 1 for n in nodes]
+            return (self.rng.choices(nodes, weights)[0], False)
+        (new, events) = successors(state, action, self.monster_actions(state, pos))
+        child = children.get(new)
+        if child is not None:
+            return (child, False)
+        child = children[new] = Node(new, self.outcome(new, events))
+        return (child, True)
+
+    def rollout(self, state):
+        """Plays the game on with the rollout policy, returns the reward and
+        the steps played to get it."""
+        policy = self.policy
+        distance = self.field.distance
+        moves_at = self.moves_at
+        rng = self.rng
+        steps = 0
+        while steps < self.rollout_depth and state.time > 0:
+            pos = state.me()
+            action = policy(state, pos, moves_at(state, pos[0], pos[1]), distance, rng)
+            (state, events) = successors(state, action, self.monster_actions(state, pos))
+            steps += 1
+            reward = self.outcome(state, events)
+            if reward is not None:
+                return (reward, steps)
+        return (self.evaluate(state), steps)
+
+    def monster_actions(self, state, pos):
+        """Sampled moves of the monsters, as passed to successors()."""
+        rules = state.rules
+        walls = state.walls
+        rng = self.rng
+        (cx, cy) = pos
+        actions = []
+        for (name, x, y, dx, dy) in state.monsters:
+            if max(abs(cx - x), abs(cy - y)) <= self.chase_range:
+                actions.append(((cx > x) - (cx < x), (cy > y) - (cy < y)))
+                continue
+            nx = x + dx
+            ny = y + dy
+            if ((dx or dy) and (0 <= nx < rules.width) and (0 <= ny < rules.height)
+                    and not walls[nx + ny * rules.width] and rng.random() < KEEP_DIRECTION):
+                actions.append(None)
+                continue
+            actions.append(rng.choice(self.moves_at(state, x, y)))
+        return actions
+
+    def moves_at(self, state, x, y):
+        """open_moves(), cached; the list must not be changed."""
+        if state.walls is not self.walls:
+            self.walls = state.walls
+            self.moves = {}
+        i = x + y * state.rules.width
+        moves = self.moves.get(i)
+        if moves is None:
+            moves = self.moves[i] = open_moves(state, x, y)
+        return moves
+
+    def outcome(self, state, events):
+        """Reward of a step that ended the game for the character, None if
+        it goes on."""
+        me = state.rules.me
+        found = False
+        for (tpe, name, other) in events:
+            if tpe == Event.BOMB_HIT_CHARACTER and other == me:
+                return 0.0
+            if tpe == Event.CHARACTER_KILLED_BY_MONSTER and name == me:
+                return 0.0
+            if tpe == Event.CHARACTER_FOUND_EXIT and name == me:
+                found = True
+        if found:
+            return 1.0
+        return None
+
+    def evaluate(self, state):
+        """Reward of a state where the game goes on: that of reaching the
+        exit by the shortest way, monsters aside."""
+        (x, y) = state.me()
+        d = self.field.distance(x, y)
+        if d is None:
+            return 0.0
+        return self.discount ** d
+
+def run_worker(job):
+    """
+    Searches a root in a worker process, until the end of the turn set by
+    the calling process (a time.monotonic() time, or None).
+
+    Returns:
+        ({action: visits} at the root, iterations run)
+    """
+    (params, state, field, iterations, end, seed) = job
+    params = dict(params, iterations=iterations)
+    algorithm = MCTSAlgorithm(seed=seed, **params)
+    algorithm.field = field
+    root = Node(state)
+    count = algorithm.run(root, iterations, Deadline(end=end))
+    return ({action: edge.visits for action, edge in root.edges.items()}, count)
@@ -1,20 +1,348 @@
 """
 Minimax algorithm for Bomberman AI
 """
+import itertools
+import math
+from events import Event
+from search_state import SearchState, successors
 from .base import BombermanAlgorithm
+from .transposition import TranspositionTable
+from .deadline import Deadline, iterative_deepening
+
+# The 9 actions of the character, and the moves of a monster
+ACTIONS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+# Value of a won game; a lost one is worth -WIN
+WIN = 100000
+
+# Kinds of the values kept in the transposition table
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+def state_key(state):
+    """
+    Hash of a search state, leaving out the direction of the controlled
+    character: its next action replaces it, so the states that only differ
+    by it have the same value.
+    """
+    me = state.rules.me
+    characters = tuple(c[:3] if c[0] == me else c for c in state.characters)
+    return hash((state.rules, state.walls, state.time, characters,
+                 state.monsters, state.bombs, state.explosions))
 
 class MinimaxAlgorithm(BombermanAlgorithm):
     """
     Minimax algorithm implementation.
+
+    Searches the compact search state (see search_state.py) with alpha-beta
+    pruning. Each step of the game is two plies: the character picks one of
+    its 9 actions, then the monsters close to it answer with the joint move
+    that is worst for it; the other monsters keep their direction. Moves are
+    ordered by the transposition table, then by killer moves (the last ones
+    that caused a cutoff at the same ply), then by the history of cutoffs,
+    and finally by how close they get to the exit (the character) or to the
+    character (the monsters).
     """
-    
-    def __init__(self, depth=3):
+
+    def __init__(self, depth=3, reply_range=3, tt_entries=100000, tt_policy="lru", time_budget=None,
+                 max_replies=81):
+        """
+        Args:
+            depth: steps searched (two plies each); the search deepens one
+                step at a time up to it
+            reply_range: monsters at most this many cells away from the
+                character, along both axes, answer each of its moves
+            tt_entries, tt_policy: size and replacement policy of the
+                transposition table
+            time_budget: if set, seconds per search: the search plays the
+                best action of the deepest iteration completed in time
+            max_replies: cap on the joint replies searched after a move of
+                the character; with more monsters in range, each only tries
+                its moves that end closest to the character
+        """
         super().__init__("Minimax")
         self.depth = depth
-    
+        self.reply_range = reply_range
+        self.max_replies = max_replies
+        self.time_budget = time_budget
+        self.deadline = Deadline()
+        # Values of the nodes already searched, kept between turns: the
+        # state reached after a step is the root of the next search
+        self.table = TranspositionTable(tt_entries, tt_policy)
+        # Killer moves by ply, and cutoffs caused by each move
+        self.killers = {}
+        self.history = {}
+        # Number of nodes expanded during the last search
+        self.expanded = 0
+        # Depth of the last search, or of its deepest completed iteration
+        self.depth_reached = 0
+        # Steps from a cell to the exit, from the world being searched
+        self.exit_distance = None
+
     def get_action(self, wrld, character):
         """
         Get next action using minimax algorithm.
         """
-        # TODO: Implement minimax logic
-        return (0, 0)
+        if not wrld.exitcell:
+            return (0, 0)
+        best = self.search(wrld, character)
+        return best or (0, 0)
+
+    def search(self, wrld, character):
+        """
+        Search the best action of a character.
+
+        Returns:
+            The best (dx, dy), or None if the character is not in the world
+            or if not even a search of depth 1 completed in time
+        """
+        # The time budget, if any, counts from here
+        deadline = Deadline(self.time_budget)
+        state = SearchState.from_world(wrld, character)
+        if state.me() is None:
+            return None
+        self.exit_distance = wrld.distance_to_exit
+        self.expanded = 0
+        self.killers = {}
+        self.history = {}
+        self.table.new_search()
+        # Even without a budget, the shallower searches are cheap and order
+        # the moves of the deeper ones
+        def search(depth, deadline, hint):
+            self.deadline = deadline
+            return self.search_root(state, depth, hint)
+        (best, self.depth_reached) = iterative_deepening(search, self.depth, deadline)
+        return best
+
+    ###################
+    # Private methods #
+    ###################
+
+    def search_root(self, state, depth, hint):
+        """Best action at the given depth, hint searched first."""
+        alpha = -WIN - depth - 1
+        best = None
+        key = state_key(state)
+        pos = state.me()
+        actions = self.character_actions(state, pos)
+        for action in self.ordered(actions, hint, 0, self.action_rank(state, pos)):
+            v = self.min_value(state, key, pos, action, depth, alpha, WIN + depth + 1, 1)
+            if v > alpha:
+                alpha = v
+                best = action
+        return best
+
+    def max_value(self, state, key, depth, alpha, beta, ply):
+        """Value of a state where the character is to move; key is its
+        state_key()."""
+        entry = self.table.get(key, depth, "max")
+        move = None
+        if entry is None:
+            entry = self.table.get(key, depth - 1, "max")
+            if entry is not None:
+                move = entry[2]
+        else:
+            (v, kind, move) = entry
+            if kind == EXACT:
+                return v
+            if kind == LOWER and v >= beta:
+                return v
+            if kind == UPPER and v <= alpha:
+                return v
+        self.deadline.check()
+        self.expanded += 1
+        start = alpha
+        best = -WIN - depth - 1
+        pos = state.me()
+        actions = self.character_actions(state, pos)
+        for action in self.ordered(actions, move, ply, self.action_rank(state, pos)):
+            v = self.min_value(state, key, pos, action, depth, alpha, beta, ply + 1)
+            if v > best:
+                best = v
+                move = action
+                if v > alpha:
+                    alpha = v
+                    if alpha >= beta:
+                        self.cutoff(action, ply, depth)
+                        break
+        self.store(key, depth, "max", best, start, beta, move)
+        return best
+
+    def min_value(self, state, key, pos, action, depth, alpha, beta, ply):
+        """Value of a step where the character, at pos, has picked its
+        action and the monsters are to answer; key is the state_key() of
+        state."""
+        kind_key = ("min", action)
+        entry = self.table.get(key, depth, kind_key)
+        move = None
+        if entry is None:
+            entry = self.table.get(key, depth - 1, kind_key)
+            if entry is not None:
+                move = entry[2]
+        else:
+            (v, kind, move) = entry
+            if kind == EXACT:
+                return v
+            if kind == LOWER and v >= beta:
+                return v
+            if kind == UPPER and v <= alpha:
+                return v
+        self.expanded += 1
+        start = beta
+        best = WIN + depth + 1
+        replies = self.monster_replies(state, pos, action)
+        for reply in self.ordered(replies, move, ply, self.reply_rank(state, pos, action)):
+            # Each reply is a step to simulate, even at the last ply
+            self.deadline.check()
+            (new, events) = successors(state, action, reply)
+            v = self.outcome(new, events, depth)
+            if v is None:
+                if depth <= 1 or new.time <= 0:
+                    v = self.evaluate(new)
+                else:
+                    v = self.max_value(new, state_key(new), depth - 1, alpha, beta, ply + 1)
+            if v < best:
+                best = v
+                move = reply
+                if v < beta:
+                    beta = v
+                    if alpha >= beta:
+                        self.cutoff(reply, ply, depth)
+                        break
+        self.store(key, depth, kind_key, best, alpha, start, move)
+        return best
+
+    def store(self, key, depth, kind_key, v, alpha, beta, move):
+        """Keep a value with the bound it is, given the window searched."""
+        if v <= alpha:
+            kind = UPPER
+        elif v >= beta:
+            kind = LOWER
+        else:
+            kind = EXACT
+        self.table.put(key, depth, kind_key, (v, kind, move))
+
+    def cutoff(self, move, ply, depth):
+        """Remember a move that caused a cutoff."""
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        self.history[move] = self.history.get(move, 0) + depth * depth
+
+    def ordered(self, moves, first, ply, rank):
+        """Moves in the order to search them: first, then the killers of
+        the ply, then by history and by rank."""
+        if len(moves) <= 1:
+            return moves
+        history = self.history
+        moves = sorted(moves, key=lambda m: (-history.get(m, 0), rank(m)))
+        front = [first] if first in moves else []
+        for killer in self.killers.get(ply, ()):
+            if killer in moves and killer not in front:
+                front.append(killer)
+        if front:
+            moves = front + [m for m in moves if m not in front]
+        return moves
+
+    def character_actions(self, state, pos):
+        """The actions of the character, at pos, that lead to different
+        cells."""
+        rules = state.rules
+        (x, y) = pos
+        actions = []
+        for (dx, dy) in ACTIONS:
+            nx = x + dx
+            ny = y + dy
+            if (0 <= nx < rules.width) and (0 <= ny < rules.height):
+                if ((dx, dy) == (0, 0)) or not state.walls[nx + ny * rules.width]:
+                    actions.append((dx, dy))
+        return actions
+
+    def monster_replies(self, state, pos, action):
+        """The joint moves of the monsters, as passed to successors(), with
+        the character at pos taking action. There are at most max_replies of
+        them: past it, each monster in range keeps its moves that end
+        closest to the character."""
+        rules = state.rules
+        (cx, cy) = pos
+        tx = cx + action[0]
+        ty = cy + action[1]
+        options = []
+        for (name, x, y, dx, dy) in state.monsters:
+            if max(abs(x - cx), abs(y - cy)) > self.reply_range:
+                # Too far to matter: keeps its direction
+                options.append((None,))
+                continue
+            moves = []
+            for (mx, my) in ACTIONS:
+                nx = x + mx
+                ny = y + my
+                if (0 <= nx < rules.width) and (0 <= ny < rules.height):
+                    if ((mx, my) == (0, 0)) or not state.walls[nx + ny * rules.width]:
+                        moves.append((mx, my))
+            options.append(moves)
+        answering = sum(1 for moves in options if moves[0] is not None)
+        if math.prod(len(moves) for moves in options) > self.max_replies:
+            # Same number of moves for each, 1 at least
+            keep = 1
+            while (keep + 1) ** answering <= self.max_replies:
+                keep += 1
+            for (i, (name, x, y, dx, dy)) in enumerate(state.monsters):
+                if options[i][0] is not None and len(options[i]) > keep:
+                    options[i] = sorted(options[i], key=lambda m: max(abs(x + m[0] - tx), abs(y + m[1] - ty)))[:keep]
+        return [tuple(reply) for reply in itertools.product(*options)]
+
+    def action_rank(self, state, pos):
+        """Orders the actions of the character, at pos, by the distance to
+        the exit of the cell they lead to."""
+        (x, y) = pos
+        far = state.rules.width * state.rules.height
+        def rank(action):
+            d = self.exit_distance(x + action[0], y + action[1])
+            return far if d is None else d
+        return rank
+
+    def reply_rank(self, state, pos, action):
+        """Orders the monster replies by how close they get the monsters to
+        the cell the character, at pos, moves to."""
+        x = pos[0] + action[0]
+        y = pos[1] + action[1]
+        monsters = state.monsters
+        def rank(reply):
+            total = 0
+            for ((name, mx, my, dx, dy), move) in zip(monsters, reply):
+                if move:
+                    total += max(abs(mx + move[0] - x), abs(my + move[1] - y))
+            return total
+        return rank
+
+    def outcome(self, state, events, depth):
+        """Value of a step that ended the game for the character, None if
+        it goes on. Sooner wins and later losses are worth more."""
+        me = state.rules.me
+        found = False
+        for (tpe, name, other) in events:
+            if tpe == Event.BOMB_HIT_CHARACTER and other == me:
+                return -WIN - depth
+            if tpe == Event.CHARACTER_KILLED_BY_MONSTER and name == me:
+                return -WIN - depth
+            if tpe == Event.CHARACTER_FOUND_EXIT and name == me:
+                found = True
+        if found:
+            return WIN + depth
+        return None
+
+    def evaluate(self, state):
+        """Utility of a state: steps to the exit, and how far the nearest
+        monster is, up to reply_range + 1 cells."""
+        (x, y) = state.me()
+        d = self.exit_distance(x, y)
+        if d is None:
+            d = state.rules.width * state.rules.height
+        safe = self.reply_range + 1
+        nearest = safe
+        for (name, mx, my, dx, dy) in state.monsters:
+            nearest = min(nearest, max(abs(mx - x), abs(my - y)))
+        return 2 * nearest - d
@@ -0,0 +1,88 @@
+"""
+Monster threat field for Bomberman search algorithms
+"""
+from array import array
+from collections import deque
+
+# The 8 moves of a monster
+MOVES = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+class MonsterThreatField:
+    """
+    Number of steps from every cell to the nearest monster.
+
+    Computed with one breadth-first search started from every monster at
+    once. Monsters move like characters and only walls stop them, so unlike
+    the Chebyshev distance, the field goes around walls.
+    """
+
+    def __init__(self, wrld):
+        self.width = wrld.width()
+        self.height = wrld.height()
+        # (x, y, monster) for each monster, in the order of wrld.monsters
+        self.monsters = []
+        for mlist in wrld.monsters.values():
+            for m in mlist:
+                self.monsters.append((m.x, m.y, m))
+        # Steps to the nearest monster, -1 if no monster can get there
+        self.dist = array('i', [-1]) * (self.width * self.height)
+        # Index in self.monsters of the nearest monster, -1 if none
+        self.source = array('i', [-1]) * (self.width * self.height)
+        queue = deque()
+        for k, (x, y, m) in enumerate(self.monsters):
+            i = x + y * self.width
+            if self.dist[i] < 0:
+                self.dist[i] = 0
+                self.source[i] = k
+                queue.append((x, y))
+        self.spread(wrld, queue)
+
+    def distance(self, x, y):
+        """
+        Steps from (x, y) to the nearest monster.
+
+        Returns:
+            The number of steps, or None if no monster can reach (x, y)
+        """
+        d = self.dist[x + y * self.width]
+        if d < 0:
+            return None
+        return d
+
+    def nearest_monster(self, x, y):
+        """
+        The monster closest to (x, y) in steps.
+
+        Returns:
+            (x, y, monster) as in self.monsters, or None if no monster can
+            reach (x, y)
+        """
+        k = self.source[x + y * self.width]
+        if k < 0:
+            return None
+        return self.monsters[k]
+
+    def within(self, x, y, steps):
+        """True if a monster can reach (x, y) in at most the given steps."""
+        d = self.dist[x + y * self.width]
+        return 0 <= d <= steps
+
+    def spread(self, wrld, queue):
+        """Breadth-first search from the cells in the queue."""
+        dist = self.dist
+        source = self.source
+        width = self.width
+        height = self.height
+        while queue:
+            (x, y) = queue.popleft()
+            i = x + y * width
+            d = dist[i] + 1
+            for dx, dy in MOVES:
+                nx = x + dx
+                ny = y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    j = nx + ny * width
+                    if dist[j] < 0 and not wrld.wall_at(nx, ny):
+                        dist[j] = d
+                        source[j] = source[i]
+                        queue.append((nx, ny))
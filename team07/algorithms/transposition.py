@@ -0,0 +1,84 @@
+"""
+Bounded transposition table for Bomberman search algorithms
+"""
+from collections import OrderedDict
+
+class TranspositionTable:
+    """
+    Caches search values by state hash, remaining depth and node kind.
+
+    Two replacement policies are available once max_entries is reached:
+        - "lru": evict the least recently used entry
+        - "depth": one entry per slot (hash modulo max_entries), replaced
+          by an entry searched at least as deep, or by any entry once it
+          is left over from an earlier search (see new_search())
+    """
+
+    def __init__(self, max_entries=100000, policy="lru"):
+        if policy not in ("lru", "depth"):
+            raise ValueError("Unknown replacement policy: " + str(policy))
+        self.max_entries = max_entries
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        # Bumped by new_search(), stored with the entries of the "depth"
+        # policy so that those of earlier searches do not hold their slots
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        """Drop every entry."""
+        if self.policy == "lru":
+            self.entries = OrderedDict()
+        else:
+            self.entries = [None] * self.max_entries
+
+    def new_search(self):
+        """Start a new search: the entries stored so far can still be found,
+        but any new entry may replace them."""
+        self.generation += 1
+
+    def get(self, state_hash, depth, kind):
+        """
+        Look up a value.
+
+        Returns:
+            The stored value, or None if the node is not in the table
+        """
+        if self.max_entries <= 0:
+            return None
+        if self.policy == "lru":
+            key = (state_hash, depth, kind)
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+        else:
+            entry = self.entries[state_hash % self.max_entries]
+            value = None
+            if entry is not None and entry[:3] == (state_hash, depth, kind):
+                value = entry[3]
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, state_hash, depth, kind, value):
+        """Store a value, evicting an older entry if the table is full."""
+        if self.max_entries <= 0:
+            return
+        if self.policy == "lru":
+            self.entries[(state_hash, depth, kind)] = value
+            self.entries.move_to_end((state_hash, depth, kind))
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            slot = state_hash % self.max_entries
+            entry = self.entries[slot]
+            if entry is None or entry[4] != self.generation or entry[1] <= depth:
+                self.entries[slot] = (state_hash, depth, kind, value, self.generation)
+
+    def __len__(self):
+        if self.policy == "lru":
+            return len(self.entries)
+        return sum(1 for entry in self.entries if entry is not None)
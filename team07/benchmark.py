@@ -0,0 +1,458 @@
+"""
+Microbenchmarks for the engine and the search algorithms
+
+Times World.next, SensedWorld.from_world, AStarAlgorithm.find_path (with
+A*, Jump Point Search, D* Lite, HPA* and the exit flow field),
+ExpectimaxAlgorithm.expectimax_search,
+HybridAStarMinimax.minimax_escape_route (at a fixed depth, and deepening
+under a time budget), MinimaxAlgorithm.search and MCTSAlgorithm.search (in
+this process and spread over two, the latter also under a time budget) on
+the project map and on larger synthetic maps. The searches also report the nodes they expand, or the
+rollouts they run, per second. Every scenario is seeded, so each run measures the same
+calls on the same states. The searches run under a time budget fail the run
+if their p99 latency is more than 10% over it (the two-process search only
+on a machine with more than one CPU).
+
+Usage:
+    python benchmark.py [--calls N] [--out results.json] [--baseline old.json]
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Bomberman'))
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import json
+import math
+import platform
+import random
+import time
+import tracemalloc
+from entity import CharacterEntity
+from game import Game
+from real_world import RealWorld
+from sensed_world import SensedWorld
+from monsters.stupid_monster import StupidMonster
+from monsters.selfpreserving_monster import SelfPreservingMonster
+from algorithms.astar import AStarAlgorithm
+from algorithms.expectimax import ExpectimaxAlgorithm
+from algorithms.hybrid_astar_minimax import HybridAStarMinimax
+from algorithms.minimax import MinimaxAlgorithm
+from algorithms.mcts import MCTSAlgorithm
+
+MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'project1', 'map.txt')
+
+
+class Wanderer(CharacterEntity):
+    """Walks towards the exit, with random detours, to reach varied states"""
+
+    def do(self, wrld):
+        (ex, ey) = wrld.exitcell
+        if self.rng.random() < 0.3:
+            self.move(self.rng.choice([-1, 0, 1]), self.rng.choice([-1, 0, 1]))
+        else:
+            self.move(ex - self.x, ey - self.y)
+
+
+#############
+# Scenarios #
+#############
+
+def project_world(seed):
+    """The project map with the two monsters of variant 5"""
+    g = Game.fromfile(MAP, headless=True, seed=seed)
+    g.add_monster(StupidMonster("stupid", "S", 3, 5))
+    g.add_monster(SelfPreservingMonster("aggressive", "A", 7, 13, 1))
+    g.add_character(Wanderer("me", "C", 0, 0))
+    return g.world
+
+
+def synthetic_world(width, height, seed):
+    """A larger map: rows of walls with gaps, scattered walls and a few monsters"""
+    rng = random.Random("map/%s/%s/%s" % (width, height, seed))
+    w = RealWorld.from_params(width, height, 10 * (width + height), 10, 2, 4, seed=seed)
+    for y in range(4, height - 1, 4):
+        gaps = rng.sample(range(width), 2)
+        for x in range(width):
+            if x not in gaps:
+                w.add_wall(x, y)
+    for y in range(height - 1):
+        if y % 4:
+            for x in range(width):
+                if (x, y) != (0, 0) and rng.random() < 0.05:
+                    w.add_wall(x, y)
+    w.add_exit(width - 1, height - 1)
+    for i in range(max(2, (width * height) // 800)):
+        (x, y) = (rng.randrange(width), rng.randrange(4, height - 1))
+        if not w.wall_at(x, y):
+            if i % 2:
+                w.add_monster(SelfPreservingMonster("aggressive%d" % i, "A", x, y, 2))
+            else:
+                w.add_monster(StupidMonster("stupid%d" % i, "S", x, y))
+    w.add_character(Wanderer("me", "C", 0, 0))
+    return w
+
+
+SCENARIOS = {
+    "project": project_world,
+    "synthetic-32x64": lambda seed: synthetic_world(32, 64, seed),
+    "synthetic-64x128": lambda seed: synthetic_world(64, 128, seed),
+}
+
+DEFAULT_SCENARIOS = ["project", "synthetic-32x64", "synthetic-64x128"]
+
+
+def play(build, seed=1):
+    """Yields the worlds of seeded games, one step at a time, forever, once
+    their entities have decided. The consumer may play the step itself with
+    w.next(), which updates the world in place; otherwise play() does"""
+    while True:
+        w = build(seed)
+        while me(w) and w.time > 0:
+            w.next_decisions()
+            time_left = w.time
+            yield w
+            if w.time == time_left:
+                w.next()
+        seed = seed + 1
+
+
+def states(build, count):
+    """Returns snapshots of the first count states of seeded games"""
+    snapshots = []
+    for w in play(build):
+        snapshots.append(SensedWorld.from_world(w))
+        if len(snapshots) == count:
+            return snapshots
+
+
+def warm_exit_field(snapshots):
+    """Computes the exit distance field of the map of the first snapshot, as
+    the first turn of a game would, so that the timed calls only repair it"""
+    if snapshots and snapshots[0].exitcell:
+        snapshots[0].distance_to_exit(*snapshots[0].exitcell)
+
+
+def me(wrld):
+    """Returns the character of a world, or None"""
+    for clist in wrld.characters.values():
+        for c in clist:
+            return c
+
+
+##############
+# Benchmarks #
+##############
+
+# Each benchmark yields prepared calls: only the calls themselves are timed.
+# Calls of a search return the number of nodes it expanded, or of what the
+# unit attribute of the benchmark names. A benchmark with a time_budget
+# attribute fails if its p99 latency is more than BUDGET_SLACK above it
+
+# Seconds per call of the searches deepening under a time budget
+TIME_BUDGET = 0.02
+
+# Part of the time budget a call may overrun by
+BUDGET_SLACK = 0.1
+
+def expanded(algorithm, search, *args):
+    """Runs a search and returns the number of nodes it expanded"""
+    search(*args)
+    return algorithm.expanded
+
+
+def bench_world_next(build, count):
+    # The timed call plays the step of the game
+    for w in play(build):
+        yield w.next
+
+
+def bench_from_world(build, count):
+    for s in states(build, count):
+        yield lambda s=s: SensedWorld.from_world(s)
+
+
+def bench_from_world_cow(build, count):
+    for s in states(build, count):
+        yield lambda s=s: SensedWorld.from_world(s, True)
+
+
+def bench_astar_find_path(build, count):
+    for s in states(build, count):
+        yield lambda s=s: AStarAlgorithm().find_path(s, me(s))
+
+
+def bench_jps_find_path(build, count):
+    for s in states(build, count):
+        yield lambda s=s: AStarAlgorithm("jps").find_path(s, me(s))
+
+
+def bench_dstar_find_path(build, count):
+    # One planner for the whole run: the states follow each other, so
+    # each call repairs the search of the previous one
+    algorithm = AStarAlgorithm("dstar")
+    for s in states(build, count):
+        yield lambda s=s: algorithm.find_path(s, me(s))
+
+
+def bench_hpa_find_path(build, count):
+    # One planner for the whole run, which keeps its abstract graph
+    algorithm = AStarAlgorithm("hpa")
+    for s in states(build, count):
+        yield lambda s=s: algorithm.find_path(s, me(s))
+
+
+def bench_flow_find_path(build, count):
+    # Computes the exit flow field of each state; other characters in the
+    # same state would reuse it
+    for s in states(build, count):
+        yield lambda s=s: AStarAlgorithm("flow").find_path(s, me(s))
+
+
+def bench_expectimax_search(build, count):
+    for s in states(build, count):
+        c = me(s)
+        algorithm = ExpectimaxAlgorithm()
+        (algorithm.x, algorithm.y) = (c.x, c.y)
+        yield lambda s=s, c=c, a=algorithm: expanded(a, a.expectimax_search, s, a.search_depth, c)
+
+
+def bench_expectimax_search_id(build, count):
+    # Deepens up to depth 6 within the time budget
+    snapshots = states(build, count)
+    warm_exit_field(snapshots)
+    for s in snapshots:
+        c = me(s)
+        algorithm = ExpectimaxAlgorithm(search_depth=6, time_budget=TIME_BUDGET)
+        (algorithm.x, algorithm.y) = (c.x, c.y)
+        yield lambda s=s, c=c, a=algorithm: expanded(a, a.expectimax_search, s, a.search_depth, c)
+
+
+def bench_minimax_escape_route(build, count):
+    for s in states(build, count):
+        yield lambda s=s: HybridAStarMinimax().minimax_escape_route(s, me(s))
+
+
+def bench_minimax_escape_route_id(build, count):
+    # Deepens up to depth 8 within the time budget
+    for s in states(build, count):
+        algorithm = HybridAStarMinimax(search_depth=8, time_budget=TIME_BUDGET)
+        yield lambda s=s, a=algorithm: a.minimax_escape_route(s, me(s))
+
+
+def bench_minimax_search(build, count):
+    # Searches two more plies than HybridAStarMinimax by default
+    for s in states(build, count):
+        algorithm = MinimaxAlgorithm()
+        yield lambda s=s, a=algorithm: expanded(a, a.search, s, me(s))
+
+
+def bench_minimax_search_id(build, count):
+    # Deepens up to 6 steps (12 plies) within the time budget
+    snapshots = states(build, count)
+    warm_exit_field(snapshots)
+    for s in snapshots:
+        algorithm = MinimaxAlgorithm(depth=6, time_budget=TIME_BUDGET)
+        yield lambda s=s, a=algorithm: expanded(a, a.search, s, me(s))
+
+
+def rollouts(algorithm, s):
+    """Runs a search and returns the number of rollouts it ran"""
+    algorithm.search(s, me(s))
+    return algorithm.rollouts
+
+
+def bench_mcts_search(build, count):
+    for s in states(build, count):
+        algorithm = MCTSAlgorithm(iterations=200, seed=1)
+        yield lambda s=s, a=algorithm: rollouts(a, s)
+
+
+def bench_mcts_search_parallel(build, count):
+    # The worker is started before the timed calls
+    snapshots = states(build, count)
+    algorithm = MCTSAlgorithm(iterations=200, processes=2, seed=1)
+    algorithm.search(snapshots[0], me(snapshots[0]))
+    try:
+        for s in snapshots:
+            yield lambda s=s: rollouts(algorithm, s)
+    finally:
+        algorithm.close()
+
+
+def bench_mcts_search_parallel_budget(build, count):
+    # Runs as many rollouts as the time budget allows, in both processes
+    snapshots = states(build, count)
+    algorithm = MCTSAlgorithm(iterations=None, time_budget=TIME_BUDGET, processes=2, seed=1)
+    algorithm.search(snapshots[0], me(snapshots[0]))
+    try:
+        for s in snapshots:
+            yield lambda s=s: rollouts(algorithm, s)
+    finally:
+        algorithm.close()
+
+
+bench_expectimax_search_id.time_budget = TIME_BUDGET
+bench_minimax_escape_route_id.time_budget = TIME_BUDGET
+bench_minimax_search_id.time_budget = TIME_BUDGET
+# On a single CPU the two processes take turns on it, and the worker
+# cannot send its results back in time: the search is still timed there,
+# but not held to the budget
+if (os.cpu_count() or 1) >= 2:
+    bench_mcts_search_parallel_budget.time_budget = TIME_BUDGET
+bench_mcts_search.unit = "rollouts"
+bench_mcts_search_parallel.unit = "rollouts"
+bench_mcts_search_parallel_budget.unit = "rollouts"
+
+
+BENCHMARKS = {
+    "World.next": bench_world_next,
+    "SensedWorld.from_world": bench_from_world,
+    "SensedWorld.from_world(cow)": bench_from_world_cow,
+    "AStarAlgorithm.find_path": bench_astar_find_path,
+    "AStarAlgorithm.find_path(jps)": bench_jps_find_path,
+    "AStarAlgorithm.find_path(dstar)": bench_dstar_find_path,
+    "AStarAlgorithm.find_path(hpa)": bench_hpa_find_path,
+    "AStarAlgorithm.find_path(flow)": bench_flow_find_path,
+    "ExpectimaxAlgorithm.expectimax_search": bench_expectimax_search,
+    "ExpectimaxAlgorithm.expectimax_search(id)": bench_expectimax_search_id,
+    "HybridAStarMinimax.minimax_escape_route": bench_minimax_escape_route,
+    "HybridAStarMinimax.minimax_escape_route(id)": bench_minimax_escape_route_id,
+    "MinimaxAlgorithm.search": bench_minimax_search,
+    "MinimaxAlgorithm.search(id)": bench_minimax_search_id,
+    "MCTSAlgorithm.search": bench_mcts_search,
+    "MCTSAlgorithm.search(2 processes)": bench_mcts_search_parallel,
+    "MCTSAlgorithm.search(2 processes, budget)": bench_mcts_search_parallel_budget,
+}
+
+
+###########
+# Running #
+###########
+
+def percentile(values, p):
+    """Returns the p-th percentile of sorted values (the smallest value that
+    at least p% of them do not exceed)"""
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+def measure(bench, build, calls, alloc_calls, budget):
+    """Times calls of a benchmark, then measures their allocations. Each pass
+    stops after the given number of calls or seconds, whichever comes first"""
+    unit = getattr(bench, "unit", "nodes")
+    latencies = []
+    counted = 0
+    deadline = time.perf_counter() + budget
+    for call in bench(build, calls):
+        start = time.perf_counter()
+        n = call()
+        latencies.append(time.perf_counter() - start)
+        if type(n) is int:
+            counted += n
+        if len(latencies) == calls or start > deadline:
+            break
+    latencies.sort()
+    # tracemalloc slows everything down, so allocations get their own pass
+    peaks = []
+    blocks = []
+    deadline = time.perf_counter() + budget
+    tracemalloc.start()
+    for call in bench(build, alloc_calls):
+        tracemalloc.reset_peak()
+        (before, _) = tracemalloc.get_traced_memory()
+        nblocks = sys.getallocatedblocks()
+        call()
+        blocks.append(sys.getallocatedblocks() - nblocks)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        if len(peaks) == alloc_calls or time.perf_counter() > deadline:
+            break
+    tracemalloc.stop()
+    total = sum(latencies)
+    result = {
+        "calls": len(latencies),
+        "ops_per_sec": len(latencies) / total if total else float("inf"),
+        "p50_us": percentile(latencies, 50) * 1e6,
+        "p90_us": percentile(latencies, 90) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+        "alloc_peak_bytes": sum(peaks) / len(peaks),
+        "alloc_net_blocks": sum(blocks) / len(blocks),
+    }
+    if counted:
+        result[unit + "_per_call"] = counted / len(latencies)
+        result[unit + "_per_sec"] = counted / total
+    if hasattr(bench, "time_budget"):
+        result["budget_us"] = bench.time_budget * 1e6
+    return result
+
+
+def over_budget(results):
+    """Prints the benchmarks whose p99 latency overruns their time budget by
+    more than BUDGET_SLACK and returns their names"""
+    over = []
+    for name, result in sorted(results.items()):
+        if "budget_us" in result and result["p99_us"] > result["budget_us"] * (1 + BUDGET_SLACK):
+            over.append(name)
+            print("%-60s p99 %.1f us over the budget of %.1f us" % (name, result["p99_us"], result["budget_us"]))
+    return over
+
+
+def compare(results, baseline, tolerance):
+    """Prints the speed of each benchmark relative to the baseline and
+    returns the names of those slower by more than tolerance"""
+    slower = []
+    print("\n%-60s %10s" % ("vs baseline", "speedup"))
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if not old:
+            continue
+        ratio = result["ops_per_sec"] / old["ops_per_sec"]
+        flag = ""
+        if ratio < 1.0 - tolerance:
+            slower.append(name)
+            flag = "  REGRESSION"
+        print("%-60s %9.2fx%s" % (name, ratio, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100, help="timed calls per benchmark")
+    parser.add_argument("--alloc-calls", type=int, default=10, help="calls measured for allocations")
+    parser.add_argument("--budget", type=float, default=10.0, help="seconds per benchmark and pass")
+    parser.add_argument("--only", default="", help="run benchmarks whose name contains this")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="scenarios to run (default: %s)" % ", ".join(DEFAULT_SCENARIOS))
+    parser.add_argument("--out", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    print("%-60s %12s %10s %10s %10s %12s" % ("benchmark", "ops/sec", "p50 us", "p90 us", "p99 us", "peak bytes"))
+    for scenario in args.scenario or DEFAULT_SCENARIOS:
+        for bench_name, bench in BENCHMARKS.items():
+            name = "%s/%s" % (bench_name, scenario)
+            if args.only not in name:
+                continue
+            r = results[name] = measure(bench, SCENARIOS[scenario], args.calls, args.alloc_calls, args.budget)
+            print("%-60s %12.1f %10.1f %10.1f %10.1f %12.0f" % (name, r["ops_per_sec"], r["p50_us"],
+                                                              r["p90_us"], r["p99_us"], r["alloc_peak_bytes"]))
+            for unit in ("nodes", "rollouts"):
+                if unit + "_per_sec" in r:
+                    print("%-60s %12.1f %s/sec, %.1f %s/call" % ("", r[unit + "_per_sec"], unit,
+                                                               r[unit + "_per_call"], unit))
+
+    failed = over_budget(results)
+    if args.out:
+        with open(args.out, "w") as fd:
+            json.dump({"python": platform.python_version(), "results": results}, fd, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)["results"]
+        if compare(results, baseline, args.tolerance):
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,14 +10,31 @@ from algorithms.expectimax import ExpectimaxAlgorithm
 from algorithms.minimax import MinimaxAlgorithm
 from algorithms.local_search import LocalSearchAlgorithm
 
+# Algorithm used in each variant
+VARIANT_ALGORITHMS = {
+    1: ExpectimaxAlgorithm,
+    2: ExpectimaxAlgorithm,
+    3: AStarAlgorithm,
+    4: AStarAlgorithm,
+    5: HybridAStarMinimax,
+}
+
 class TestCharacter(CharacterEntity):
-    def __init__(self, name, avatar, x, y):
+    def __init__(self, name, avatar, x, y, variant=None):
+        """
+        Args:
+            variant: number of the variant being run, which picks the
+                algorithm; if None, it is guessed from the calling script
+        """
         super().__init__(name, avatar, x, y)
         # Choose algorithm based on variant
-        self.algorithm = self._choose_algorithm()
+        if variant is None:
+            variant = self._detect_variant()
+        self.algorithm = VARIANT_ALGORITHMS[variant]()
+        print("Variant " + str(variant) + " - Using " + type(self.algorithm).__name__)
     
-    def _choose_algorithm(self):
-        """Choose algorithm based on the variant being run."""
+    def _detect_variant(self):
+        """Guess the variant being run from the calling file name."""
         import inspect
         import sys
         
@@ -27,37 +44,21 @@ class TestCharacter(CharacterEntity):
             # Go up the call stack to find the calling file
             caller_frame = frame.f_back
             while caller_frame:
-                filename = caller_frame.f_code.co_filename
-                if 'variant' in filename.lower():
-                    # Extract variant number from filename
-                    if 'variant1' in filename.lower():
-                        print("Detected Variant 1 - Using A* Algorithm")
-                        return ExpectimaxAlgorithm()
-                    elif 'variant2' in filename.lower():
-                        print("Detected Variant 2 - Using A* Algorithm")
-                        return ExpectimaxAlgorithm()
-                    elif 'variant3' in filename.lower():
-                        print("Detected Variant 3 - Using A* Algorithm")
-                        return AStarAlgorithm()
-                    elif 'variant4' in filename.lower():
-                        print("Detected Variant 4 - Using A* Algorithm")
-                        return AStarAlgorithm()
-                    elif 'variant5' in filename.lower():
-                        print("Detected Variant 5 - Using Hybrid A* + Minimax Algorithm")
-                        return HybridAStarMinimax()
+                filename = caller_frame.f_code.co_filename.lower()
+                for variant in VARIANT_ALGORITHMS:
+                    if 'variant' + str(variant) in filename:
+                        return variant
                 caller_frame = caller_frame.f_back
         finally:
             del frame
         
         # Fallback: check command line arguments
         for arg in sys.argv:
-            if 'variant5' in arg.lower() or 'test_variant5' in arg.lower():
-                print("Detected Variant 5 context - Using Hybrid A* + Minimax Algorithm")
-                return HybridAStarMinimax()
+            if 'variant5' in arg.lower():
+                return 5
         
         # Default to A* for variants 1-4, Hybrid for variant 5
-        print("Default: Using A* Algorithm (for Variants 1-4)")
-        return AStarAlgorithm()
+        return 3
     
     def do(self, wrld):
         # Get action from algorithm